@@ -0,0 +1,61 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from core.connection_profile import CONNECTION_PROFILES
+from core.database_connector import DatabaseConnector
+from core.database_types import TrackEntry
+
+
+# Create the argument parser.
+parser = argparse.ArgumentParser(description="Measure the commit latency of the connection profile presets.",
+                                 formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument("--commits", type=int, default=500, help="number of commits per profile")
+parser.add_argument("--directory", type=str, default=None, help="directory for the benchmark databases")
+
+
+def benchmark_profile(database_location, profile, commits):
+    """
+    Insert one track entry per commit and return the sorted commit latencies in milliseconds.
+    :param database_location: Path to the database.
+    :param profile: The connection profile.
+    :param commits: The number of commits.
+    :return: The sorted latencies.
+    """
+    db = DatabaseConnector(database_location, profile)
+    latencies = []
+    for _ in range(commits):
+        entry = TrackEntry(task_uid=1, timestamp_begin=db.get_current_timestamp())
+        t0 = time.perf_counter()
+        db.create_track_entry(entry)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    db.close()
+    return sorted(latencies)
+
+
+def main(args):
+    """
+    Run the benchmark for all presets. The durable preset has the settings of the rollback journal that was used before
+    the profiles existed, so it is the baseline.
+    """
+    profiles = sorted(CONNECTION_PROFILES.items())
+    directory = tempfile.mkdtemp(dir=args.directory)
+    try:
+        print("%-18s %10s %10s %10s" % ("profile", "mean ms", "median ms", "p95 ms"))
+        for name, profile in profiles:
+            database_location = os.path.join(directory, "%s.db" % name)
+            latencies = benchmark_profile(database_location, profile, args.commits)
+            if name == "durable":
+                name = "durable (baseline)"
+            mean = sum(latencies) / len(latencies)
+            median = latencies[len(latencies) // 2]
+            p95 = latencies[int(len(latencies) * 0.95)]
+            print("%-18s %10.3f %10.3f %10.3f" % (name, mean, median, p95))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())
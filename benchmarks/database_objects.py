@@ -0,0 +1,74 @@
+import argparse
+import time
+import tracemalloc
+
+from core.database_types import Task, TrackEntry, timestamp_to_sql
+from core.database_types import EPOCH
+
+
+# Create the argument parser.
+parser = argparse.ArgumentParser(description="Measure the memory per object and the hydration speed of the database "
+                                             "objects.",
+                                 formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument("--objects", type=int, default=100000, help="number of hydrated objects per class")
+parser.add_argument("--repeat", type=int, default=5, help="number of timing runs, the fastest run is reported")
+
+
+def make_rows(object_class, n):
+    """
+    Create n database rows for the given class like they are returned by the sqlite3 cursor.
+    :param object_class: The database object class.
+    :param n: The number of rows.
+    :return: List with the rows.
+    """
+    timestamp = timestamp_to_sql(EPOCH) + 1483340400000000
+    if object_class is Task:
+        return [(i, 1, "Title %d" % i, "Description", 0, timestamp + i, 0, 0) for i in range(n)]
+    else:
+        return [(i, 1, timestamp + i, timestamp + i + 1000000, 0) for i in range(n)]
+
+
+def benchmark_class(object_class, n, repeat):
+    """
+    Hydrate n objects of the given class and return the memory per object in bytes, the hydration time per object and
+    the attribute read time per object in microseconds.
+    :param object_class: The database object class.
+    :param n: The number of objects.
+    :param repeat: The number of timing runs.
+    :return: Tuple with memory, hydration time, and attribute read time.
+    """
+    rows = make_rows(object_class, n)
+
+    tracemalloc.start()
+    objects = [object_class.from_row(row) for row in rows]
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+
+    hydrate = read = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        objects = [object_class.from_row(row) for row in rows]
+        t1 = time.perf_counter()
+        for obj in objects:
+            obj.uid
+            obj.deleted
+        t2 = time.perf_counter()
+        hydrate = min(hydrate, t1 - t0)
+        read = min(read, t2 - t1)
+        del objects
+    return memory / n, hydrate / n * 1e6, read / n * 1e6
+
+
+def main(args):
+    """
+    Run the benchmark for tasks and track entries.
+    """
+    print("%-12s %14s %14s %14s" % ("class", "bytes/object", "hydrate us", "2 reads us"))
+    for object_class in (Task, TrackEntry):
+        memory, hydrate, read = benchmark_class(object_class, args.objects, args.repeat)
+        print("%-12s %14.1f %14.3f %14.3f" % (object_class.__name__, memory, hydrate, read))
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())
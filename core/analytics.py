@@ -0,0 +1,149 @@
+import itertools
+from collections import namedtuple
+
+import numpy
+
+from .database_connector import DatabaseConnector
+from .database_types import MICROSECONDS_PER_DAY, MICROSECONDS_PER_SECOND, timestamp_to_sql, weekday
+
+
+# TrackColumns holds the track entries of a user as column arrays, ordered by begin. uid, task_uid, type_id, begin, and
+# end are int64 arrays of equal length. begin and end are microseconds since EPOCH (see timestamp_to_sql()), open
+# entries end at the time that was passed to load_track_columns().
+TrackColumns = namedtuple("TrackColumns", ["uid", "task_uid", "type_id", "begin", "end"])
+
+
+def load_track_columns(database, user_uid, begin=None, end=None, now=None, type_ids=None):
+    """
+    Load the not-deleted track entries of the given user joined with their tasks in one bulk fetch. If begin or end is
+    given, entries are clipped to the range [begin, end). If an archive database is attached, the archived entries are
+    loaded, too.
+    :param database: The DatabaseConnector.
+    :param user_uid: The user uid.
+    :param begin: Begin of the range (datetime) or None.
+    :param end: End of the range (datetime) or None.
+    :param now: The end of open entries. Defaults to the current timestamp.
+    :param type_ids: Iterable with the task types that are loaded or None for all types.
+    :return: The TrackColumns.
+    """
+    assert isinstance(database, DatabaseConnector)
+    assert isinstance(user_uid, int)
+    if now is None:
+        now = database.get_current_timestamp()
+    lower = timestamp_to_sql(begin) if begin is not None else -2**63
+    upper = timestamp_to_sql(end) if end is not None else 2**63 - 1
+    args = {"user_uid": user_uid, "begin": lower, "end": upper, "now": timestamp_to_sql(now)}
+    select = ("SELECT `TrackEntries`.`uid`, `TrackEntries`.`task_uid`, `Tasks`.`type_id`, "
+              "MAX(`TrackEntries`.`timestamp_begin`, :begin), %s "
+              "FROM `%s` AS `Tasks` JOIN `%s` AS `TrackEntries` ON `TrackEntries`.`task_uid`=`Tasks`.`uid` "
+              "WHERE `Tasks`.`user_uid`=:user_uid AND `TrackEntries`.`deleted`=0 "
+              "AND `TrackEntries`.`timestamp_begin`<:end AND %s")
+    if type_ids is not None:
+        type_ids = [int(type_id) for type_id in type_ids]
+        select += " AND `Tasks`.`type_id` IN (%s)" % ", ".join("%d" % type_id for type_id in type_ids)
+
+    # Like in the report queries, the closed and the open entries are selected separately, so the closed entries can be
+    # bounded from below by the longest entry and the open entries are read from the partial index TrackEntries_open.
+    with database.reading() as connection:
+        if begin is None:
+            closed_condition = "`TrackEntries`.`timestamp_end` IS NOT NULL"
+        else:
+            args["first_begin"] = lower - database.get_max_track_entry_length()
+            closed_condition = ("`TrackEntries`.`timestamp_end` IS NOT NULL "
+                                "AND `TrackEntries`.`timestamp_begin`>=:first_begin "
+                                "AND `TrackEntries`.`timestamp_end`>:begin")
+        query = (select % (("MIN(`TrackEntries`.`timestamp_end`, :end)",) + database.history_tables +
+                           (closed_condition,)) +
+                 " UNION ALL " +
+                 select % (("MIN(:now, :end)",) + database.history_tables +
+                           ("`TrackEntries`.`timestamp_end` IS NULL AND :now>:begin",)) +
+                 " ORDER BY 4, 1;")
+        rows = connection.execute(query, args).fetchall()
+    data = numpy.fromiter(itertools.chain.from_iterable(rows), dtype=numpy.int64, count=5*len(rows))
+    data = data.reshape((len(rows), 5))
+    return TrackColumns(*(numpy.ascontiguousarray(data[:, i]) for i in range(5)))
+
+
+def durations(columns):
+    """
+    Returns the duration of each entry in seconds.
+    :param columns: The TrackColumns.
+    :return: float64 array with the durations.
+    """
+    return (columns.end - columns.begin) / MICROSECONDS_PER_SECOND
+
+
+def duration_histogram(columns, bins=10, range=None):
+    """
+    Returns the histogram of the entry durations in seconds, see numpy.histogram().
+    :param columns: The TrackColumns.
+    :param bins: Number of bins or array with the bin edges.
+    :param range: The (lower, upper) range of the bins or None.
+    :return: Tuple with the counts and the bin edges.
+    """
+    return numpy.histogram(durations(columns), bins=bins, range=range)
+
+
+def duration_percentiles(columns, percentiles=(50, 90, 99)):
+    """
+    Returns the percentiles of the entry durations in seconds.
+    :param columns: The TrackColumns.
+    :param percentiles: The percentiles in [0, 100].
+    :return: float64 array with one value per percentile (NaN if there are no entries).
+    """
+    if len(columns.uid) == 0:
+        return numpy.full(len(percentiles), numpy.nan)
+    return numpy.percentile(durations(columns), percentiles)
+
+
+def split_by_day(columns):
+    """
+    Split the entries at midnight, so each segment lies within one day.
+    :param columns: The TrackColumns.
+    :return: Tuple with the int64 arrays (index, day, duration): index of the entry in columns, day of the segment in
+             days since EPOCH, and duration of the segment in microseconds.
+    """
+    first_day = columns.begin // MICROSECONDS_PER_DAY
+    last_day = (columns.end - 1) // MICROSECONDS_PER_DAY
+    counts = numpy.maximum(last_day - first_day + 1, 0)
+    index = numpy.repeat(numpy.arange(len(counts)), counts)
+    offsets = numpy.arange(len(index)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    day = first_day[index] + offsets
+    segment_begin = numpy.maximum(columns.begin[index], day * MICROSECONDS_PER_DAY)
+    segment_end = numpy.minimum(columns.end[index], (day + 1) * MICROSECONDS_PER_DAY)
+    return index, day, segment_end - segment_begin
+
+
+def weekday_distribution(columns):
+    """
+    Returns the tracked time per weekday in seconds. Entries that cross midnight are split.
+    :param columns: The TrackColumns.
+    :return: float64 array of length 7, index 0 is Monday.
+    """
+    _, day, duration = split_by_day(columns)
+    return numpy.bincount(weekday(day), weights=duration, minlength=7) / MICROSECONDS_PER_SECOND
+
+
+def daily_totals(columns):
+    """
+    Returns the tracked time per day in seconds. Entries that cross midnight are split.
+    :param columns: The TrackColumns.
+    :return: Tuple with the sorted int64 array of days since EPOCH and the float64 array with the tracked seconds.
+    """
+    _, day, duration = split_by_day(columns)
+    days, inverse = numpy.unique(day, return_inverse=True)
+    return days, numpy.bincount(inverse, weights=duration, minlength=len(days)) / MICROSECONDS_PER_SECOND
+
+
+def context_switches(columns):
+    """
+    Returns the number of context switches per day. A context switch is an entry whose task differs from the task of
+    the previous entry on the same day. The day of an entry is the day on which it begins.
+    :param columns: The TrackColumns.
+    :return: Tuple with the sorted int64 array of days since EPOCH and the int64 array with the switch counts.
+    """
+    day = columns.begin // MICROSECONDS_PER_DAY
+    days, inverse = numpy.unique(day, return_inverse=True)
+    switched = (columns.task_uid[1:] != columns.task_uid[:-1]) & (day[1:] == day[:-1])
+    counts = numpy.bincount(inverse[1:], weights=switched, minlength=len(days)).astype(numpy.int64)
+    return days, counts
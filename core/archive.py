@@ -0,0 +1,97 @@
+from .database_types import Task, TrackEntry, MICROSECONDS_PER_DAY, create_table_statement
+
+
+# The schema name of the attached archive database.
+ARCHIVE_SCHEMA = "archive"
+
+# The temporary views with the rows of the main and the archive database.
+ALL_TASKS = "AllTasks"
+ALL_TRACK_ENTRIES = "AllTrackEntries"
+
+# The archived tables and their database object classes.
+_ARCHIVE_TABLES = (("Tasks", Task), ("TrackEntries", TrackEntry))
+
+
+def attach(connection, archive_location):
+    """
+    Attaches the archive database, creates its tables if necessary, and creates the temporary views AllTasks and
+    AllTrackEntries, which contain the rows of the main and the archive database. Must not be called inside a
+    transaction.
+    :param connection: The database connection.
+    :param archive_location: Path to the archive database.
+    """
+    c = connection.cursor()
+    c.execute("ATTACH DATABASE ? AS `%s`;" % ARCHIVE_SCHEMA, (archive_location,))
+    for (table_name, object_class), view_name in zip(_ARCHIVE_TABLES, (ALL_TASKS, ALL_TRACK_ENTRIES)):
+        c.execute(create_table_statement(object_class, table_name, if_not_exists=True, schema_name=ARCHIVE_SCHEMA))
+        columns = ", ".join("`%s`" % name for name in object_class._field_names)
+        c.execute("CREATE TEMP VIEW IF NOT EXISTS `%s` AS "
+                  "SELECT %s FROM `main`.`%s` UNION ALL SELECT %s FROM `%s`.`%s`;" %
+                  (view_name, columns, table_name, columns, ARCHIVE_SCHEMA, table_name))
+    c.execute("CREATE INDEX IF NOT EXISTS `%s`.`TrackEntries_task` ON `TrackEntries` (`task_uid`, `timestamp_begin`);"
+              % ARCHIVE_SCHEMA)
+    c.execute("CREATE INDEX IF NOT EXISTS `%s`.`TrackEntries_length` "
+              "ON `TrackEntries` (`timestamp_end` - `timestamp_begin`) WHERE `timestamp_end` IS NOT NULL;"
+              % ARCHIVE_SCHEMA)
+
+
+def detach(connection):
+    """
+    Drops the temporary views and detaches the archive database. Must not be called inside a transaction.
+    :param connection: The database connection.
+    """
+    c = connection.cursor()
+    c.execute("DROP VIEW IF EXISTS `temp`.`%s`;" % ALL_TASKS)
+    c.execute("DROP VIEW IF EXISTS `temp`.`%s`;" % ALL_TRACK_ENTRIES)
+    c.execute("DETACH DATABASE `%s`;" % ARCHIVE_SCHEMA)
+
+
+def move(connection, cutoff):
+    """
+    Moves the done and deleted tasks whose timestamp_orderby and track entries all lie before the cutoff, together with
+    their track entries, and the deleted track entries that begin before the cutoff from the main into the attached
+    archive database. The caller is responsible for the transaction.
+
+    The rollup tables keep counting the moved track entries, so reports over full days and the overtime balance do not
+    change. The balance checkpoints would be dropped by the delete triggers, so the affected checkpoints are restored
+    afterwards.
+    :param connection: The database connection.
+    :param cutoff: The cutoff in microseconds since the epoch.
+    :return: Tuple (number of moved tasks, number of moved track entries).
+    """
+    c = connection.cursor()
+    c.execute("CREATE TEMP TABLE `ArchivedTaskUids` AS "
+              "SELECT `uid` FROM `main`.`Tasks` WHERE (`done`=1 OR `deleted`=1) AND `timestamp_orderby`<:cutoff "
+              "AND NOT EXISTS (SELECT 1 FROM `main`.`TrackEntries` WHERE `task_uid`=`Tasks`.`uid` "
+              "AND (`timestamp_end` IS NULL OR `timestamp_end`>=:cutoff));", {"cutoff": cutoff})
+    entries_condition = ("`task_uid` IN (SELECT `uid` FROM `temp`.`ArchivedTaskUids`) "
+                         "OR (`deleted`=1 AND `timestamp_begin`<:cutoff)")
+
+    # The delete triggers drop the checkpoints of a user from the day of the earliest moved track entry on, so only
+    # these checkpoints are saved.
+    c.execute("CREATE TEMP TABLE `SavedCheckpoints` AS SELECT `BalanceCheckpoints`.* FROM ("
+              "SELECT `Tasks`.`user_uid` AS `user_uid`, MIN(`Moved`.`timestamp_begin`) / :day_length AS `first_day` "
+              "FROM (SELECT `task_uid`, `timestamp_begin` FROM `main`.`TrackEntries` WHERE %s) AS `Moved` "
+              "JOIN `main`.`Tasks` AS `Tasks` ON `Tasks`.`uid`=`Moved`.`task_uid` GROUP BY `Tasks`.`user_uid`"
+              ") AS `Users` JOIN `main`.`BalanceCheckpoints` AS `BalanceCheckpoints` "
+              "ON `BalanceCheckpoints`.`user_uid`=`Users`.`user_uid` "
+              "AND `BalanceCheckpoints`.`day`>=`Users`.`first_day`;"
+              % entries_condition, {"cutoff": cutoff, "day_length": MICROSECONDS_PER_DAY})
+
+    task_columns = ", ".join("`%s`" % name for name in Task._field_names)
+    entry_columns = ", ".join("`%s`" % name for name in TrackEntry._field_names)
+    c.execute("INSERT INTO `%s`.`Tasks` (%s) SELECT %s FROM `main`.`Tasks` "
+              "WHERE `uid` IN (SELECT `uid` FROM `temp`.`ArchivedTaskUids`);" %
+              (ARCHIVE_SCHEMA, task_columns, task_columns))
+    task_count = c.rowcount
+    c.execute("INSERT INTO `%s`.`TrackEntries` (%s) SELECT %s FROM `main`.`TrackEntries` WHERE %s;" %
+              (ARCHIVE_SCHEMA, entry_columns, entry_columns, entries_condition), {"cutoff": cutoff})
+    entry_count = c.rowcount
+    c.execute("DELETE FROM `main`.`TrackEntries` WHERE %s;" % entries_condition, {"cutoff": cutoff})
+    c.execute("DELETE FROM `main`.`Tasks` WHERE `uid` IN (SELECT `uid` FROM `temp`.`ArchivedTaskUids`);")
+    c.execute("DELETE FROM `main`.`TaskTotals` WHERE `task_uid` IN (SELECT `uid` FROM `temp`.`ArchivedTaskUids`);")
+
+    c.execute("INSERT OR REPLACE INTO `main`.`BalanceCheckpoints` SELECT * FROM `temp`.`SavedCheckpoints`;")
+    c.execute("DROP TABLE `temp`.`SavedCheckpoints`;")
+    c.execute("DROP TABLE `temp`.`ArchivedTaskUids`;")
+    return task_count, entry_count
@@ -0,0 +1,279 @@
+import asyncio
+
+from .database_connector import DatabaseConnector
+from .user_management import UserManagement
+from .write_queue import DEFAULT_MAX_GROUP, DEFAULT_MAX_SIZE, WriteQueue
+
+
+# The default number of pooled read connections of the facades.
+DEFAULT_READERS = 2
+
+
+def _forward(name, alone=False):
+    """
+    Creates a coroutine method that calls the method with the given name of the wrapped object on the writer thread.
+    :param name: The method name.
+    :param alone: Whether the call must run outside of a transaction (see WriteQueue.submit_alone()).
+    :return: The coroutine method.
+    """
+    async def method(self, *args, **kwargs):
+        return await self._submit(lambda target: getattr(target, name)(*args, **kwargs), alone)
+    method.__name__ = name
+    method.__doc__ = "Coroutine version of %s(), see the synchronous class." % name
+    return method
+
+
+def _forward_read(name):
+    """
+    Creates a coroutine method that calls the read method with the given name of the wrapped object like
+    _AsyncFacade._read().
+    :param name: The method name.
+    :return: The coroutine method.
+    """
+    async def method(self, *args, **kwargs):
+        return await self._read(lambda target: getattr(target, name)(*args, **kwargs))
+    method.__name__ = name
+    method.__doc__ = "Coroutine version of %s(), see the synchronous class." % name
+    return method
+
+
+class _AsyncFacade(object):
+    """
+    Base class of the asyncio facades. The wrapped object is owned by a WriteQueue, so all calls run on one writer
+    thread and never block the event loop. Calls that are submitted while the writer is busy are batched into one
+    transaction, so many concurrent coroutines share one connection without paying a commit each.
+
+    The coroutines wait on a semaphore with one slot per queue entry before they submit a call, so the queue never
+    fills up and its blocking put() never stalls the event loop.
+
+    With a reader pool, the reads do not go through the queue: they run on the threads of the default executor on the
+    pooled read connections, after the calls that were submitted before them are committed.
+    """
+
+    def __init__(self, factory, max_size, max_group, readers):
+        """
+        Starts the writer thread and creates the wrapped object on it.
+        :param factory: Function that creates the wrapped object.
+        :param max_size: The maximum number of queued calls. Further calls wait without blocking the event loop.
+        :param max_group: The maximum number of calls per transaction.
+        :param readers: The number of pooled read connections of the wrapped object.
+        """
+        self._writes = WriteQueue(factory, max_size, max_group)
+        self._max_size = max_size
+        self._readers = readers
+
+        # The semaphore is created on the first call, so it belongs to the event loop of the caller.
+        self._slots = None
+
+        # The future that is done when the last submitted call is finished.
+        self._last_call = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def _submit(self, fn, alone=False):
+        """
+        Submits fn(target) to the writer thread and returns the result. While the queue is full, the coroutine waits
+        for a free slot.
+        :param fn: The function.
+        :param alone: Whether the call must run outside of a transaction.
+        :return: The result of fn.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._max_size)
+        finished = asyncio.get_event_loop().create_future()
+        self._last_call = finished
+        try:
+            await self._slots.acquire()
+            try:
+                submit = self._writes.submit_alone if alone else self._writes.submit
+                future = asyncio.wrap_future(submit(fn))
+            except:
+                self._slots.release()
+                raise
+            future.add_done_callback(lambda f: self._slots.release())
+            return await future
+        finally:
+            finished.set_result(None)
+
+    async def _read(self, fn):
+        """
+        Runs the read fn(target) and returns the result. The read waits until the previously submitted calls are
+        finished, so it sees their writes. With the reader pool, it then runs on a thread of the default executor, so
+        it neither waits for the writer thread nor opens a write transaction. Without the pool, it is queued like a call
+        that runs alone, outside of a transaction.
+        :param fn: The function.
+        :return: The result of fn.
+        """
+        if self._readers == 0:
+            return await self._submit(fn, alone=True)
+        if self._last_call is not None and not self._last_call.done():
+            await asyncio.wait([self._last_call])
+        return await asyncio.get_event_loop().run_in_executor(None, fn, self._writes.target)
+
+    async def run(self, fn, *args):
+        """
+        Runs fn(target, *args) on the writer thread in one transaction and returns the result. Use this to make several
+        calls atomic or to read without a round trip per call.
+        Example:
+        await db.run(lambda db, task: db.create_tasks([task]), task)
+        :param fn: The function. It is called with the wrapped object.
+        :param args: The arguments.
+        :return: The result of fn.
+        """
+        return await self._submit(lambda target: fn(target, *args))
+
+    async def flush(self):
+        """
+        Waits until all submitted calls are committed.
+        """
+        await self._submit(lambda target: None)
+
+    async def close(self):
+        """
+        Commits all submitted calls and closes the wrapped object.
+        """
+        await asyncio.get_event_loop().run_in_executor(None, self._writes.close)
+
+
+class AsyncDatabaseConnector(_AsyncFacade):
+    """
+    The AsyncDatabaseConnector offers the methods of the DatabaseConnector as coroutines. The iterators return lists,
+    since the rows cannot be fetched lazily from another thread. The context managers (transaction(), reading(),
+    attached_archive()), cursor(), and the properties are replaced by run().
+    Example:
+    db = AsyncDatabaseConnector(path)
+    task = Task(user_uid=1, type_id=0)
+    await db.create_task(task)
+    await db.close()
+    """
+
+    def __init__(self, database_location, connection_profile="default", max_size=DEFAULT_MAX_SIZE,
+                 max_group=DEFAULT_MAX_GROUP, readers=DEFAULT_READERS):
+        """
+        Opens the database like DatabaseConnector on the writer thread.
+        :param database_location: Path to the database.
+        :param connection_profile: The name of a connection profile preset or a ConnectionProfile.
+        :param max_size: The maximum number of queued calls.
+        :param max_group: The maximum number of calls per transaction.
+        :param readers: The number of pooled read connections. The pool requires the WAL journal mode, so profiles
+        without WAL need readers=0.
+        """
+        super().__init__(lambda: DatabaseConnector(database_location, connection_profile, readers), max_size,
+                         max_group, readers)
+
+    async def iter_tasks(self, user_uid, open_only=False, chunk_size=None):
+        """
+        Returns the tasks of iter_tasks() as a list.
+        :param user_uid: The user uid.
+        :param open_only: Whether only tasks that are not done are returned.
+        :param chunk_size: Unused.
+        :return: List with the tasks.
+        """
+        return await self._read(lambda db: list(db.iter_tasks(user_uid, open_only)))
+
+    async def iter_track_entries(self, user_uid, since=None, until=None, chunk_size=None):
+        """
+        Returns the track entries of iter_track_entries() as a list.
+        :param user_uid: The user uid.
+        :param since: The earliest begin (datetime).
+        :param until: The begin after the last entry (datetime).
+        :param chunk_size: Unused.
+        :return: List with the track entries.
+        """
+        return await self._read(lambda db: list(db.iter_track_entries(user_uid, since, until)))
+
+    attach_archive = _forward("attach_archive", alone=True)
+    detach_archive = _forward("detach_archive", alone=True)
+    archive = _forward("archive", alone=True)
+    get_archive_cutoff = _forward_read("get_archive_cutoff")
+    get_archive_locations = _forward_read("get_archive_locations")
+    get_max_track_entry_length = _forward_read("get_max_track_entry_length")
+    create_user = _forward("create_user")
+    get_user = _forward_read("get_user")
+    update_user = _forward("update_user")
+    create_setting = _forward("create_setting")
+    # The settings are read from the cache of the connector, which only the writer thread fills.
+    load_settings = _forward("load_settings", alone=True)
+    get_setting = _forward("get_setting", alone=True)
+    compact_settings = _forward("compact_settings")
+    get_setting_history = _forward_read("get_setting_history")
+    create_task = _forward("create_task")
+    create_tasks = _forward("create_tasks")
+    get_task = _forward_read("get_task")
+    get_all_tasks = _forward_read("get_all_tasks")
+    get_open_tasks = _forward_read("get_open_tasks")
+    get_tasks = _forward_read("get_tasks")
+    get_tasks_page = _forward_read("get_tasks_page")
+    update_task = _forward("update_task")
+    create_track_entry = _forward("create_track_entry")
+    create_track_entries = _forward("create_track_entries")
+    get_track_entries = _forward_read("get_track_entries")
+    get_current_task_uid = _forward_read("get_current_task_uid")
+    get_open_track_entries = _forward_read("get_open_track_entries")
+    update_track_entry = _forward("update_track_entry")
+    update_track_entries = _forward("update_track_entries")
+    rebuild_rollups = _forward("rebuild_rollups")
+    get_task_total = _forward_read("get_task_total")
+    get_task_totals = _forward_read("get_task_totals")
+    get_current_timestamp = _forward_read("get_current_timestamp")
+
+
+class AsyncUserManagement(_AsyncFacade):
+    """
+    The AsyncUserManagement offers the methods of the UserManagement as coroutines. The calls run in the order in which
+    they are submitted, so for example a start_task() that is submitted after a stop_current_task() sees the stopped
+    task.
+    Example:
+    um = AsyncUserManagement("Abel", path)
+    task_uid = await um.create_task("Title", "Description")
+    await um.start_task(task_uid)
+    await um.close()
+    """
+
+    def __init__(self, user_name, database_location, connection_profile="default", max_size=DEFAULT_MAX_SIZE,
+                 max_group=DEFAULT_MAX_GROUP, readers=DEFAULT_READERS):
+        """
+        Creates the UserManagement on the writer thread.
+        :param user_name: The user name.
+        :param database_location: Path to the database.
+        :param connection_profile: The name of a connection profile preset or a ConnectionProfile.
+        :param max_size: The maximum number of queued calls.
+        :param max_group: The maximum number of calls per transaction.
+        :param readers: The number of pooled read connections. The pool requires the WAL journal mode, so profiles
+        without WAL need readers=0.
+        """
+        super().__init__(lambda: UserManagement(user_name, database_location, connection_profile, readers), max_size,
+                         max_group, readers)
+
+    @property
+    def current_task_uid(self):
+        """
+        Returns an awaitable with the uid of the current task after all previously submitted calls.
+        Example:
+        task_uid = await um.current_task_uid
+        :return: The awaitable.
+        """
+        return self._submit(lambda um: um.current_task_uid)
+
+    refresh = _forward("refresh")
+    archive = _forward("archive", alone=True)
+    archive_if_due = _forward("archive_if_due", alone=True)
+    get_open_tasks = _forward_read("get_open_tasks")
+    get_setting = _forward("get_setting", alone=True)
+    set_setting = _forward("set_setting")
+    get_tasks_page = _forward_read("get_tasks_page")
+    get_task_totals = _forward_read("get_task_totals")
+    get_task_total = _forward_read("get_task_total")
+    create_task = _forward("create_task")
+    create_general_work_task = _forward("create_general_work_task")
+    create_pause_task = _forward("create_pause_task")
+    start_general_work = _forward("start_general_work")
+    start_pause = _forward("start_pause")
+    delete_task = _forward("delete_task")
+    start_task = _forward("start_task")
+    stop_current_task = _forward("stop_current_task")
+    task_done = _forward("task_done")
@@ -0,0 +1,176 @@
+import datetime
+
+from .database_connector import DatabaseConnector
+from .database_types import Setting, EPOCH_DATE, MICROSECONDS_PER_DAY, MICROSECONDS_PER_SECOND, timedelta_to_sql, \
+    timestamp_to_sql, timestamp_from_sql, weekday
+from .reporting import summarize, DAY, TYPE
+from .user_management import PAUSE
+
+
+# The week days in the order of datetime.date.weekday().
+WEEKDAYS = ("Mo", "Tu", "We", "Th", "Fr", "Sa", "Su")
+
+# The settings key of the per week day target times.
+TARGETS_KEY = "week_targets"
+
+
+class BalanceEngine(object):
+    """
+    The BalanceEngine compares the tracked work time of a user (everything except PAUSE tasks) with the target time per
+    week day and computes the overtime balance. The target times are stored as timestamped settings, so each day uses
+    the targets that were set at the end of that day. Days before the first targets setting are not counted.
+
+    The balance at the end of each finished day is stored in the BalanceCheckpoints table. The balance as of now is the
+    last checkpoint plus the delta of the current day, so only the days since the last call are summarized. Triggers
+    delete the checkpoints from the day of a changed track entry or targets setting on, so they are recomputed on the
+    next call.
+    """
+
+    def __init__(self, database, user_uid):
+        assert isinstance(database, DatabaseConnector)
+        assert isinstance(user_uid, int)
+        self._database = database
+        self._user_uid = user_uid
+
+    def set_targets(self, targets):
+        """
+        Stores the target times per week day. The new targets apply from the current day on.
+        :param targets: Dict {day: seconds}, where day is one of WEEKDAYS. Missing days have a target of 0.
+        """
+        for day, seconds in targets.items():
+            if day not in WEEKDAYS:
+                raise KeyError("Invalid week day: " + str(day))
+            if seconds < 0:
+                raise ValueError("Target times must not be negative.")
+        value = {day: int(targets.get(day, 0)) for day in WEEKDAYS}
+        self._database.create_setting(Setting(user_uid=self._user_uid, key=TARGETS_KEY, value=value))
+
+    def get_targets(self, date=None):
+        """
+        Returns the target times that apply to the given day. Raises a KeyError if no targets were set until then.
+        :param date: The day (datetime.date). Defaults to the current day.
+        :return: Dict {day: timedelta}, where day is one of WEEKDAYS.
+        """
+        if date is None:
+            date = self._database.get_current_timestamp().date()
+        history = self._get_target_history()
+        targets = _targets_of_day(history, (date - EPOCH_DATE).days)
+        if targets is None:
+            raise KeyError("No targets set for user %d before %s." % (self._user_uid, date))
+        return {day: datetime.timedelta(0, targets[i] // MICROSECONDS_PER_SECOND) for i, day in enumerate(WEEKDAYS)}
+
+    def get_balance(self, now=None):
+        """
+        Returns the overtime balance: the tracked work time minus the target time, summed over all days since the first
+        targets setting. The current day counts with its full target time.
+        :param now: The current time (datetime). Defaults to the current timestamp.
+        :return: The balance (timedelta). Negative values are undertime.
+        """
+        if now is None:
+            now = self._database.get_current_timestamp()
+        history = self._get_target_history()
+        if len(history) == 0:
+            return datetime.timedelta()
+        today = timestamp_to_sql(now) // MICROSECONDS_PER_DAY
+
+        balance = self._update_checkpoints(history, today, now)
+        worked = self._worked_today(today, timestamp_to_sql(now))
+        target = _targets_of_day(history, today)
+        if target is not None:
+            balance += worked - target[weekday(today)]
+        return datetime.timedelta(0, 0, balance)
+
+    def _get_target_history(self):
+        """
+        Returns the list [(first_day, targets)] of all targets settings in ascending order, where first_day is the day
+        index from which the setting applies and targets is the list of target microseconds in WEEKDAYS order.
+        :return: The targets history.
+        """
+        settings = self._database.get_setting_history(self._user_uid, TARGETS_KEY)
+        return [(timestamp_to_sql(s.timestamp_create) // MICROSECONDS_PER_DAY,
+                 [s.value.get(day, 0) * MICROSECONDS_PER_SECOND for day in WEEKDAYS])
+                for s in settings]
+
+    def _worked_per_day(self, begin, end, now):
+        """
+        Returns the tracked work time (without PAUSE tasks) per day in the range [begin, end).
+        :param begin: The begin of the range (datetime).
+        :param end: The end of the range (datetime).
+        :param now: The time until which open track entries count.
+        :return: Dict {day index: microseconds}.
+        """
+        worked = {}
+        for row in summarize(self._database, self._user_uid, begin, end, period=DAY, group_by=TYPE, now=now):
+            if row.type_id != PAUSE:
+                day = (row.period - EPOCH_DATE).days
+                worked[day] = worked.get(day, 0) + timedelta_to_sql(row.duration)
+        return worked
+
+    def _worked_today(self, today, now):
+        """
+        Returns the tracked work time (without PAUSE tasks) of the current day: the closed track entries are read from
+        the day rollups, and only the open track entries are read from the partial index TrackEntries_open, so the
+        track entries of the day are not scanned.
+        :param today: The day index of the current day.
+        :param now: The current time in microseconds.
+        :return: The microseconds.
+        """
+        today_start = today * MICROSECONDS_PER_DAY
+        with self._database.reading() as connection:
+            c = connection.cursor()
+            c.execute("SELECT SUM(`duration`) FROM `RollupsDay` WHERE `user_uid`=? AND `day`=? AND `type_id`!=?;",
+                      (self._user_uid, today, PAUSE))
+            closed = c.fetchone()[0] or 0
+            c.execute("SELECT SUM(MAX(:now - MAX(`TrackEntries`.`timestamp_begin`, :today_start), 0)) "
+                      "FROM `Tasks` JOIN `TrackEntries` ON `TrackEntries`.`task_uid`=`Tasks`.`uid` "
+                      "WHERE `Tasks`.`user_uid`=:user_uid AND `Tasks`.`type_id`!=:pause "
+                      "AND `TrackEntries`.`deleted`=0 AND `TrackEntries`.`timestamp_end` IS NULL "
+                      "AND `TrackEntries`.`timestamp_begin`<:now;",
+                      {"user_uid": self._user_uid, "pause": PAUSE, "today_start": today_start, "now": now})
+            return closed + (c.fetchone()[0] or 0)
+
+    def _update_checkpoints(self, history, today, now):
+        """
+        Writes the missing checkpoints up to the day before today and returns the balance at the end of that day.
+        :param history: The targets history.
+        :param today: The day index of the current day.
+        :param now: The current time (datetime).
+        :return: The balance in microseconds.
+        """
+        with self._database.transaction():
+            c = self._database.cursor()
+            c.execute("SELECT `day`, `balance` FROM `BalanceCheckpoints` WHERE `user_uid`=? AND `day`<? "
+                      "ORDER BY `day` DESC LIMIT 1;", (self._user_uid, today))
+            row = c.fetchone()
+            if row is None:
+                first_day, balance = history[0][0], 0
+            else:
+                first_day, balance = row[0] + 1, row[1]
+            if first_day >= today:
+                return balance
+
+            worked = self._worked_per_day(timestamp_from_sql(first_day * MICROSECONDS_PER_DAY),
+                                          timestamp_from_sql(today * MICROSECONDS_PER_DAY), now)
+            rows = []
+            for day in range(first_day, today):
+                target = _targets_of_day(history, day)[weekday(day)]
+                balance += worked.get(day, 0) - target
+                rows.append((self._user_uid, day, worked.get(day, 0), target, balance))
+            c.executemany("INSERT OR REPLACE INTO `BalanceCheckpoints` "
+                          "(`user_uid`, `day`, `worked`, `target`, `balance`) VALUES (?, ?, ?, ?, ?);", rows)
+            return balance
+
+
+def _targets_of_day(history, day):
+    """
+    Returns the targets of the last setting in the history that applies to the given day, or None if there is none.
+    :param history: The targets history.
+    :param day: The day index.
+    :return: The list of target microseconds in WEEKDAYS order or None.
+    """
+    targets = None
+    for first_day, day_targets in history:
+        if first_day > day:
+            break
+        targets = day_targets
+    return targets
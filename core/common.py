@@ -1,7 +1,10 @@
+import contextlib
+import copy
 import json
 import logging
 import os
 import sys
+import tempfile
 
 import appdirs
 
@@ -54,7 +57,8 @@ class SettingsEncoder(json.JSONEncoder):
 
 class Settings(object):
     """
-    The settings object.
+    The settings object. The parsed configuration file is kept in memory and only read again when the modification time
+    or the size of the file changes. Writes replace the file atomically and can be grouped with batch().
     """
 
     def __init__(self, dirs):
@@ -62,29 +66,22 @@ class Settings(object):
         self.config_file = os.path.join(self.dirs.user_config_dir, "config.json")
         self.database_dir = os.path.join(self.dirs.user_data_dir, "databases")
         self.default_database = "mesme.db"
+        self._config = None  # the parsed configuration file or None if the file does not exist
+        self._config_stat = None  # (mtime, size) of the parsed configuration file
+        self._pending = {}  # settings that are not written yet
+        self._batch_depth = 0
 
     def __setitem__(self, name, value):
         """
-        Store the setting (name=value) in the configuration file.
+        Store the setting (name=value) in the configuration file. Inside batch(), the file is written when the
+        outermost batch ends.
         :param name: The setting name.
         :param value: The setting value.
         """
-        # Create the folder structure if necessary.
-        filename = self.config_file
-        folder = os.path.dirname(filename)
-        os.makedirs(folder, exist_ok=True)
-
-        # Read the current configuration.
-        config = {}
-        if os.path.isfile(filename):
-            with open(filename, "r") as f:
-                config = json.load(f)
-
-        # Save the setting.
-        config[name] = value
-        s = json.dumps(config, indent=2, cls=SettingsEncoder)
-        with open(filename, "w") as f:
-            f.write(s)
+        # Store the JSON representation, so later changes of value do not affect the stored setting.
+        self._pending[name] = json.loads(json.dumps(value, cls=SettingsEncoder))
+        if self._batch_depth == 0:
+            self.flush()
 
     def __getitem__(self, name):
         """
@@ -94,13 +91,101 @@ class Settings(object):
         :param name: The setting name.
         :return: Returns the setting value.
         """
-        filename = self.config_file
-        if os.path.isfile(filename):
-            with open(filename, "r") as f:
-                config = json.load(f)
-            return config[name]
-        else:
+        if name in self._pending:
+            return copy.deepcopy(self._pending[name])
+        config = self._load()
+        if config is None:
             raise KeyError("Could not find settings file.")
+        return copy.deepcopy(config[name])
+
+    def update(self, settings):
+        """
+        Store all settings of the given dict with one write.
+        :param settings: The dict {name: value}.
+        """
+        with self.batch():
+            for name, value in settings.items():
+                self[name] = value
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Context manager that collects all settings that are stored inside the with-block and writes them to the
+        configuration file at once when the outermost block is left. If the block raises an exception, the collected
+        settings are discarded.
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        except:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self._pending.clear()
+            raise
+        else:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self.flush()
+
+    def flush(self):
+        """
+        Write the pending settings to the configuration file. The file is read again before, so settings that were
+        written by another process in the meantime are kept. The new content is written to a temporary file that
+        replaces the configuration file, so a crash never leaves a truncated file behind.
+        """
+        if len(self._pending) == 0:
+            return
+        config = dict(self._load() or {})
+        config.update(self._pending)
+
+        # Create the folder structure if necessary.
+        filename = self.config_file
+        folder = os.path.dirname(filename)
+        os.makedirs(folder, exist_ok=True)
+
+        s = json.dumps(config, indent=2, cls=SettingsEncoder)
+        fd, temp_filename = tempfile.mkstemp(dir=folder, prefix=".config.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(s)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_filename, filename)
+        except:
+            if os.path.isfile(temp_filename):
+                os.remove(temp_filename)
+            raise
+        self._config = config
+        self._config_stat = Settings._stat(filename)
+        self._pending.clear()
+
+    def _load(self):
+        """
+        Return the parsed configuration file. The file is only read again if its modification time or size changed.
+        :return: The configuration dict or None if the file does not exist.
+        """
+        stat = Settings._stat(self.config_file)
+        if stat != self._config_stat:
+            if stat is None:
+                self._config = None
+            else:
+                with open(self.config_file, "r") as f:
+                    self._config = json.load(f)
+            self._config_stat = stat
+        return self._config
+
+    @staticmethod
+    def _stat(filename):
+        """
+        Return the modification time and the size of the given file.
+        :param filename: The file name.
+        :return: Tuple (mtime in nanoseconds, size) or None if the file does not exist.
+        """
+        try:
+            stat = os.stat(filename)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
 
 
 # The global settings object.
@@ -0,0 +1,61 @@
+import os
+import queue
+import sqlite3
+from urllib.request import pathname2url
+
+
+class ReaderPool(object):
+    """
+    The ReaderPool holds read-only connections to a database in WAL mode. In WAL mode, readers do not block the writer
+    and the writer does not block readers, so queries on the pooled connections run in parallel to each other and to
+    the writes. A connection is used by one thread at a time: acquire() waits until a connection is free.
+    """
+
+    def __init__(self, database_location, connection_profile, size):
+        """
+        Opens the read-only connections.
+        :param database_location: Path to the database. The database must exist and be in WAL mode.
+        :param connection_profile: The ConnectionProfile that is applied to the connections.
+        :param size: The number of connections.
+        """
+        if size < 1:
+            raise ValueError("The reader pool needs at least one connection.")
+        uri = "file:%s?mode=ro" % pathname2url(os.path.abspath(database_location))
+        self._connections = []
+        self._idle = queue.Queue()
+        for _ in range(size):
+            # The connections are handed from thread to thread, but never used by two threads at the same time.
+            connection = sqlite3.connect(uri, uri=True, isolation_level=None, check_same_thread=False)
+            connection_profile.apply(connection)
+            self._connections.append(connection)
+            self._idle.put(connection)
+
+    @property
+    def size(self):
+        """
+        Returns the number of connections.
+        :return: The number of connections.
+        """
+        return len(self._connections)
+
+    def acquire(self):
+        """
+        Returns a free connection. Blocks until a connection is released if all connections are in use.
+        :return: The connection.
+        """
+        return self._idle.get()
+
+    def release(self, connection):
+        """
+        Returns the connection to the pool.
+        :param connection: The connection from acquire().
+        """
+        self._idle.put(connection)
+
+    def close(self):
+        """
+        Closes all connections.
+        """
+        for connection in self._connections:
+            connection.close()
+        self._connections = []
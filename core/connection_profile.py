@@ -0,0 +1,82 @@
+class ConnectionProfile(object):
+    """
+    The ConnectionProfile holds the SQLite settings (journal mode, synchronous level, memory map, page cache, temp store,
+    and busy timeout) that are applied to a database connection.
+    """
+
+    def __init__(self, journal_mode="WAL", synchronous="NORMAL", mmap_size=64*1024*1024, cache_size=-8000,
+                 temp_store="MEMORY", busy_timeout=5000):
+        """
+        Initialize the connection profile.
+        :param journal_mode: The journal mode, for example "WAL" or "DELETE".
+        :param synchronous: The synchronous level: "OFF", "NORMAL", "FULL", or "EXTRA".
+        :param mmap_size: Maximum number of bytes of the database file that are memory-mapped.
+        :param cache_size: The page cache size. Positive values are pages, negative values are kibibytes.
+        :param temp_store: Where temporary tables and indexes are stored: "DEFAULT", "FILE", or "MEMORY".
+        :param busy_timeout: Milliseconds to wait for a lock that is held by another connection.
+        """
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.mmap_size = int(mmap_size)
+        self.cache_size = int(cache_size)
+        self.temp_store = temp_store
+        self.busy_timeout = int(busy_timeout)
+
+    def apply(self, connection):
+        """
+        Apply the profile to the given connection. This must be called outside of a transaction.
+        :param connection: The database connection.
+        """
+        c = connection.cursor()
+        c.execute("PRAGMA busy_timeout = %d;" % self.busy_timeout)
+        c.execute("PRAGMA journal_mode = %s;" % self.journal_mode)
+        c.execute("PRAGMA synchronous = %s;" % self.synchronous)
+        c.execute("PRAGMA mmap_size = %d;" % self.mmap_size)
+        c.execute("PRAGMA cache_size = %d;" % self.cache_size)
+        c.execute("PRAGMA temp_store = %s;" % self.temp_store)
+
+    def to_dict(self):
+        """
+        Convert the connection profile to a dict.
+        :return: The profile dict.
+        """
+        return {
+            "journal_mode": self.journal_mode,
+            "synchronous": self.synchronous,
+            "mmap_size": self.mmap_size,
+            "cache_size": self.cache_size,
+            "temp_store": self.temp_store,
+            "busy_timeout": self.busy_timeout
+        }
+
+
+# The connection profile presets.
+# default: WAL lets readers and the writer work concurrently. With synchronous=NORMAL, a commit only appends to the WAL
+#          file and the fsync happens at checkpoints, so a power loss can lose the last commits but never corrupts the
+#          database.
+# durable: Every commit is synced to disk, and the rollback journal is used instead of WAL, since WAL needs shared memory
+#          that does not work on network file systems. Use this on machines that lose power or on network file systems.
+#          The reader pool of the DatabaseConnector requires WAL, so it cannot be used with this preset.
+# fast:    No syncs at all and large caches. A crash of the operating system can corrupt the database, so this is meant
+#          for imports and synthetic load.
+CONNECTION_PROFILES = {
+    "default": ConnectionProfile(),
+    "durable": ConnectionProfile(journal_mode="DELETE", synchronous="FULL", mmap_size=0, cache_size=-2000,
+                                 temp_store="DEFAULT"),
+    "fast": ConnectionProfile(synchronous="OFF", mmap_size=256*1024*1024, cache_size=-64000)
+}
+
+
+def get_connection_profile(profile):
+    """
+    Returns the connection profile for the given preset name. ConnectionProfile objects are returned unchanged.
+    Raises a KeyError if there is no preset with the given name.
+    :param profile: The preset name or a ConnectionProfile.
+    :return: The connection profile.
+    """
+    if isinstance(profile, ConnectionProfile):
+        return profile
+    try:
+        return CONNECTION_PROFILES[profile]
+    except KeyError:
+        raise KeyError("Unknown connection profile: %s" % profile)
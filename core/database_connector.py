@@ -1,11 +1,52 @@
+import contextlib
+import copy
 import logging
 import datetime
 import json
 import os
 import sqlite3
+import threading
 
+from . import archive
+from .connection_pool import ReaderPool
+from .connection_profile import get_connection_profile
+from .database_migrations import migrate
+from .identity_map import IdentityMap
+from .rollups import add_track_entries, rebuild
+from .task_filter import TaskFilter
 from .database_types import User, Setting, Task, TrackEntry
-from .database_types import create_table, insert_object, update_object
+from .database_types import fetch_chunks, insert_object, insert_objects, select_statement, update_columns, update_object
+from .database_types import update_objects
+from .database_types import MAX_VARIABLES, MICROSECONDS_PER_DAY, timestamp_to_sql
+
+
+# The default number of rows that the iterators fetch at once.
+DEFAULT_CHUNK_SIZE = 256
+
+# The default number of tasks per page.
+DEFAULT_PAGE_SIZE = 50
+
+# Whether SQLite supports RETURNING (3.35), so create_user() can insert a user and get its uid with a single statement.
+_UPSERT_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# The track entry fields that affect the rollup tables.
+_ROLLUP_FIELDS = frozenset(["task_uid", "timestamp_begin", "timestamp_end", "deleted"])
+
+# iter_track_entries() sorts the track entries in time windows of about this many rows, starting with a window of
+# _INITIAL_WINDOW microseconds.
+_WINDOW_ROWS = 4096
+_INITIAL_WINDOW = 30 * MICROSECONDS_PER_DAY
+
+
+def _rollup_rows(rows):
+    """
+    Returns the (task_uid, timestamp_begin, timestamp_end) tuples of the given track entry rows that count in the rollup
+    tables. Open and deleted track entries do not count.
+    :param rows: Iterable with track entry rows (uid, task_uid, timestamp_begin, timestamp_end, deleted).
+    :return: Generator with the tuples.
+    """
+    return ((row[1], row[2], row[3]) for row in rows if row[3] is not None and not row[4])
+
 
 
 class DatabaseConnector(object):
@@ -13,23 +54,48 @@ class DatabaseConnector(object):
     The DatabaseConnector connects to a database and wraps the database queries.
     """
 
-    def __init__(self, database_location):
+    def __init__(self, database_location, connection_profile="default", readers=0, identity_map=False):
         """
         Creates the database file and the necessary tables. If the database file already exists, it will not be
-        overwritten.
+        overwritten, but its schema is migrated to the current version.
+
+        With readers > 0, the connector can be shared between threads: the writes are serialized on the writer
+        connection, and the reads run on a pool of read-only connections (see reading()), so long reports do not wait
+        for the writes and run in parallel on multiple cores. This requires the WAL journal mode.
         :param database_location: Path to the database.
+        :param connection_profile: The name of a connection profile preset or a ConnectionProfile.
+        :param readers: The number of pooled read-only connections. With 0, the connector uses a single connection
+        that can only be used by the thread that created it.
+        :param identity_map: Whether the users, tasks, and track entries are kept in an IdentityMap, so repeated reads
+        of a row return the same object.
         """
         self._date_format = "%Y-%m-%dT%H:%M:%S:%f"
+        self._transaction_depth = 0
+        self._archive_attached = False
+        self._archive_location = None
+        self._settings_cache = {}
+        self._write_log = []
+        self._identity_map = IdentityMap() if identity_map else None
+        self._pool = None
+        self._connection = None
+        self._write_lock = threading.RLock()
+        self._local = threading.local()
         DatabaseConnector._create_database_folder_structure(database_location)
-        self._connection = sqlite3.connect(database_location)
-        tables = {
-            "Users": User,
-            "Settings": Setting,
-            "Tasks": Task,
-            "TrackEntries": TrackEntry
-        }
-        for table_name, object_class in tables.items():
-            create_table(self._connection, table_name, object_class, if_not_exists=True)
+
+        # The connection runs in autocommit mode, so a single statement is committed immediately and statements can be
+        # grouped with transaction().
+        profile = get_connection_profile(connection_profile)
+        self._connection = sqlite3.connect(database_location, isolation_level=None, check_same_thread=(readers == 0))
+        profile.apply(self._connection)
+        migrate(self._connection)
+
+        if readers > 0:
+            journal_mode = self._connection.execute("PRAGMA journal_mode;").fetchone()[0]
+            if journal_mode.lower() != "wal":
+                self.close()
+                raise ValueError("The reader pool requires the WAL journal mode, but the database uses %s." %
+                                 journal_mode)
+            self._pool = ReaderPool(database_location, profile, readers)
 
     def __del__(self):
         """
@@ -42,10 +108,173 @@ class DatabaseConnector(object):
         """
         Closes the database connection.
         """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
         if self._connection is not None:
             self._connection.close()
             self._connection = None
 
+    def cursor(self):
+        """
+        Returns a database cursor for modules that run their own queries on top of the connector, for example reporting.
+        Writes must be wrapped in transaction(). With the reader pool, reads must be wrapped in reading(), so the cursor
+        belongs to a connection that is reserved for the current thread.
+        :return: The cursor.
+        """
+        return self._read_connection().cursor()
+
+    @contextlib.contextmanager
+    def _writing(self):
+        """
+        Context manager that reserves the writer connection for the current thread.
+        :return: The writer connection.
+        """
+        with self._write_lock:
+            self._local.write_depth = getattr(self._local, "write_depth", 0) + 1
+            try:
+                yield self._connection
+            finally:
+                self._local.write_depth -= 1
+
+    @contextlib.contextmanager
+    def reading(self):
+        """
+        Context manager for reads. With the reader pool, the current thread gets a read-only connection for the
+        with-block, and all reads inside the block see the same snapshot of the database, even if other threads commit
+        writes in the meantime. Nested blocks share the connection of the outermost block. Inside a transaction of the
+        current thread, while an archive database is attached (the archive views only exist on the writer connection),
+        and without the reader pool, the reads use the writer connection.
+        Example:
+        with db.reading() as connection:
+            c = connection.cursor()
+        :return: The connection.
+        """
+        if self._pool is None or self._archive_attached or getattr(self._local, "write_depth", 0) > 0:
+            with self._writing() as connection:
+                yield connection
+            return
+
+        depth = getattr(self._local, "read_depth", 0)
+        if depth > 0:
+            self._local.read_depth += 1
+            try:
+                yield self._local.reader
+            finally:
+                self._local.read_depth -= 1
+            return
+
+        connection = self._pool.acquire()
+        self._local.reader = connection
+        self._local.read_depth = 1
+        try:
+            connection.execute("BEGIN;")
+            try:
+                yield connection
+            finally:
+                connection.execute("COMMIT;")
+        finally:
+            self._local.read_depth = 0
+            self._local.reader = None
+            self._pool.release(connection)
+
+    def _read_connection(self):
+        """
+        Returns the connection for reads of the current thread: the pooled connection if the thread is inside reading(),
+        otherwise the writer connection.
+        :return: The connection.
+        """
+        reader = getattr(self._local, "reader", None)
+        if reader is None or getattr(self._local, "write_depth", 0) > 0:
+            return self._connection
+        return reader
+
+    @property
+    def identity_map(self):
+        """
+        Returns the IdentityMap with the hit and miss counters or None if the identity map is disabled.
+        :return: The identity map or None.
+        """
+        return self._identity_map
+
+    def _from_row(self, table_name, database_object_class, row):
+        """
+        Returns the database object for the given row: the object from the identity map if it is enabled, otherwise a
+        new object.
+        :param table_name: The table name.
+        :param database_object_class: The database object class.
+        :param row: The database row.
+        :return: The database object.
+        """
+        if self._identity_map is None:
+            return database_object_class.from_row(row)
+        return self._identity_map.load(table_name, database_object_class, row)
+
+    def _inserted(self, table_name, database_objects):
+        """
+        Adds the inserted objects to the identity map if it is enabled.
+        :param table_name: The table name.
+        :param database_objects: Iterable with the inserted database objects.
+        """
+        if self._identity_map is not None:
+            for database_object in database_objects:
+                self._identity_map.add(table_name, database_object)
+
+    def _log_writes(self, action, table_name, database_objects):
+        """
+        Remembers the uid and the clean row of the given objects before they are written inside a transaction, so
+        _restore_objects() can reset them if the transaction is rolled back. Writes outside of a transaction are
+        committed right away and are not remembered.
+        :param action: "insert" or "update".
+        :param table_name: The table name.
+        :param database_objects: Iterable with the database objects.
+        """
+        if self._transaction_depth > 0:
+            self._write_log.extend((action, table_name, database_object, database_object.uid,
+                                    database_object._clean_row) for database_object in database_objects)
+
+    def _restore_objects(self, position):
+        """
+        Resets the objects that were written since the given position of the write log to their state before the
+        writes, in reverse order, and removes them from the log. The written objects get their old uid and clean row
+        back, so their modifications count as not written again. Inserted objects are removed from the identity map,
+        and the cached objects that received the written fields are refreshed from their old clean row.
+        :param position: The length of the write log when the rolled back transaction or savepoint was started.
+        """
+        for action, table_name, database_object, uid, clean_row in reversed(self._write_log[position:]):
+            if action == "cached":
+                self._identity_map.restore(database_object, clean_row)
+                continue
+            if action == "insert" and self._identity_map is not None:
+                self._identity_map.discard(table_name, database_object)
+            database_object.uid = uid
+            database_object._clean_row = clean_row
+        del self._write_log[position:]
+
+    def _update_objects(self, connection, table_name, database_objects):
+        """
+        Writes the modified fields of the given objects like update_objects() with ignore_none=True. If the identity map
+        is enabled, the written fields are copied to the cached objects with the same uids.
+        :param connection: The writer connection.
+        :param table_name: The table name.
+        :param database_objects: List with the database objects.
+        """
+        written = None
+        if self._identity_map is not None:
+            written = [(database_object, update_columns(database_object, ignore_none=True))
+                       for database_object in database_objects]
+        self._log_writes("update", table_name, database_objects)
+        if len(database_objects) == 1:
+            update_object(connection, table_name, database_objects[0], ignore_none=True)
+        else:
+            update_objects(connection, table_name, database_objects, ignore_none=True)
+        if written is not None:
+            for database_object, column_names in written:
+                changed = self._identity_map.written(table_name, database_object, column_names)
+                if changed is not None and self._transaction_depth > 0:
+                    cached, clean_row = changed
+                    self._write_log.append(("cached", table_name, cached, cached.uid, clean_row))
+
     @staticmethod
     def _create_database_folder_structure(database_location):
         """
@@ -56,10 +285,193 @@ class DatabaseConnector(object):
         folder = os.path.dirname(database_location)
         os.makedirs(folder, exist_ok=True)
 
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Context manager that groups all writes inside the with-block into one atomic transaction, which is committed
+        when the outermost block is left. Nested blocks use savepoints, so an exception inside a nested block only rolls
+        back the writes of that block (and of the outer blocks, if the exception is not caught). The database objects
+        that were written by rolled back writes get their uid and clean state back, so they are written again by the
+        next update. With the reader pool, the writes of other threads wait until the transaction is finished.
+        Example:
+        with db.transaction():
+            db.create_task(task)
+            db.create_track_entry(entry)
+        """
+        with self._writing() as connection:
+            c = connection.cursor()
+            savepoint = "sp%d" % self._transaction_depth
+            if self._transaction_depth == 0:
+                c.execute("BEGIN IMMEDIATE;")
+            else:
+                c.execute("SAVEPOINT `%s`;" % savepoint)
+            self._transaction_depth += 1
+            log_position = len(self._write_log)
+            try:
+                yield self
+            except:
+                self._transaction_depth -= 1
+
+                # The cache may contain settings of the rolled back writes.
+                self._settings_cache.clear()
+                self._restore_objects(log_position)
+                if self._transaction_depth == 0:
+                    c.execute("ROLLBACK;")
+                else:
+                    c.execute("ROLLBACK TO `%s`;" % savepoint)
+                    c.execute("RELEASE `%s`;" % savepoint)
+                raise
+            else:
+                self._transaction_depth -= 1
+                if self._transaction_depth == 0:
+                    try:
+                        c.execute("COMMIT;")
+                    except:
+                        # A failed commit leaves the transaction open, for example on a deferred constraint.
+                        self._settings_cache.clear()
+                        self._restore_objects(0)
+                        if connection.in_transaction:
+                            c.execute("ROLLBACK;")
+                        raise
+                    del self._write_log[:]
+                else:
+                    c.execute("RELEASE `%s`;" % savepoint)
+
+    def attach_archive(self, archive_location):
+        """
+        Attaches the archive database, so reports can read the full history from the views AllTasks and
+        AllTrackEntries (see history_tables). The archive database is created if it does not exist.
+        :param archive_location: Path to the archive database.
+        """
+        if self._archive_attached:
+            raise RuntimeError("An archive database is already attached.")
+        if self._transaction_depth > 0:
+            raise RuntimeError("The archive database cannot be attached inside a transaction.")
+        DatabaseConnector._create_database_folder_structure(archive_location)
+        with self._writing() as connection:
+            archive.attach(connection, archive_location)
+            self._archive_attached = True
+            self._archive_location = os.path.abspath(archive_location)
+
+    def detach_archive(self):
+        """
+        Detaches the archive database.
+        """
+        if not self._archive_attached:
+            raise RuntimeError("No archive database is attached.")
+        if self._transaction_depth > 0:
+            raise RuntimeError("The archive database cannot be detached inside a transaction.")
+        with self._writing() as connection:
+            archive.detach(connection)
+            self._archive_attached = False
+            self._archive_location = None
+
+    @contextlib.contextmanager
+    def attached_archive(self, archive_location):
+        """
+        Context manager that attaches the archive database for the with-block.
+        Example:
+        with db.attached_archive(path):
+            rows = reporting.summarize(db, user_uid, begin, end)
+        :param archive_location: Path to the archive database.
+        """
+        self.attach_archive(archive_location)
+        try:
+            yield self
+        finally:
+            self.detach_archive()
+
+    @property
+    def archive_attached(self):
+        """
+        Returns whether an archive database is attached.
+        :return: Whether an archive database is attached.
+        """
+        return self._archive_attached
+
+    @property
+    def history_tables(self):
+        """
+        Returns the names of the tables or views with all tasks and track entries: the views over the main and the
+        archive database if the archive is attached, otherwise the main tables.
+        :return: Tuple (tasks table, track entries table).
+        """
+        if self._archive_attached:
+            return archive.ALL_TASKS, archive.ALL_TRACK_ENTRIES
+        return "Tasks", "TrackEntries"
+
+    def get_max_track_entry_length(self):
+        """
+        Returns the length of the longest closed track entry of all users in microseconds, including the archived
+        entries if the archive is attached. A closed entry that overlaps a range that starts at begin cannot start before
+        begin minus this length, so range queries can bound the begin of the closed entries from below. The lengths are
+        indexed, so this does not scan the track entries.
+        :return: The maximum length in microseconds (0 if there are no closed entries).
+        """
+        schemas = ("main", archive.ARCHIVE_SCHEMA) if self._archive_attached else ("main",)
+        with self.reading() as connection:
+            c = connection.cursor()
+            length = 0
+            for schema_name in schemas:
+                c.execute("SELECT MAX(`timestamp_end` - `timestamp_begin`) FROM `%s`.`TrackEntries` "
+                          "WHERE `timestamp_end` IS NOT NULL;" % schema_name)
+                length = max(length, c.fetchone()[0] or 0)
+            return length
+
+    def get_archive_cutoff(self):
+        """
+        Returns the cutoff of the last move into an archive database in microseconds. All archived track entries end
+        before the cutoff.
+        :return: The cutoff in microseconds or None if no data was archived.
+        """
+        with self.reading() as connection:
+            c = connection.cursor()
+            c.execute("SELECT MAX(`cutoff`) FROM `Archives`;")
+            return c.fetchone()[0]
+
+    def get_archive_locations(self):
+        """
+        Returns the paths of the archive databases that data was moved into.
+        :return: List with the absolute paths.
+        """
+        with self.reading() as connection:
+            c = connection.cursor()
+            c.execute("SELECT `location` FROM `Archives` ORDER BY `location`;")
+            return [row[0] for row in c.fetchall()]
+
+    def archive(self, archive_location, horizon):
+        """
+        Moves the done and deleted tasks that were last active before the horizon, together with their track entries,
+        and the deleted track entries before the horizon into the archive database. This keeps the main database small,
+        so the queries on open tasks and track entries do not slow down as the years pass. The horizon is rounded down
+        to midnight. Reports over full days and the overtime balance still include the archived time. The archive
+        database and the cutoff are recorded (see get_archive_locations()), so the rollups are not rebuilt without it.
+        :param archive_location: Path to the archive database.
+        :param horizon: The minimum age of the archived data (timedelta).
+        :return: Tuple (number of archived tasks, number of archived track entries).
+        """
+        cutoff = timestamp_to_sql(self.get_current_timestamp() - horizon)
+        cutoff -= cutoff % MICROSECONDS_PER_DAY
+        attach = not self._archive_attached
+        if attach:
+            self.attach_archive(archive_location)
+        try:
+            with self.transaction():
+                counts = archive.move(self._connection, cutoff)
+                if counts != (0, 0):
+                    c = self._connection.cursor()
+                    c.execute("INSERT OR IGNORE INTO `Archives` VALUES (?, ?);", (self._archive_location, cutoff))
+                    c.execute("UPDATE `Archives` SET `cutoff`=MAX(`cutoff`, ?) WHERE `location`=?;",
+                              (cutoff, self._archive_location))
+                return counts
+        finally:
+            if attach:
+                self.detach_archive()
+
     @property
     def date_format(self):
         """
-        Returns the date format.
+        Returns the date format that was used to store timestamps as text before they were stored as integers.
         :return: The date format.
         """
         return self._date_format
@@ -68,15 +480,34 @@ class DatabaseConnector(object):
         """
         Inserts the user into the database and sets user.uid to the user uid.
         If the user already exists in the database, it is not inserted a second time and user.uid is set to the uid of
-        the existing entry.
+        the existing entry, which costs a single read. The unique index on the user names makes this safe if several
+        processes create the same user at the same time.
         :param user: The user object.
         """
         assert isinstance(user, User)
-        try:
-            existing_user = self.get_user(user.name)
-            user.uid = existing_user.uid
-        except KeyError:
-            insert_object(self._connection, "Users", user)
+        with self._writing() as connection:
+            c = connection.cursor()
+            c.execute("SELECT `uid` FROM `Users` WHERE `name`=?;", (user.name,))
+            row = c.fetchone()
+            if row is None:
+                if _UPSERT_RETURNING:
+                    c.execute("INSERT INTO `Users` (`name`, `deleted`) VALUES (?, ?) "
+                              "ON CONFLICT (`name`) DO NOTHING RETURNING `uid`;", (user.name, user.deleted))
+                    row = c.fetchone()
+                else:
+                    c.execute("INSERT OR IGNORE INTO `Users` (`name`, `deleted`) VALUES (?, ?);",
+                              (user.name, user.deleted))
+                    if c.rowcount == 1:
+                        row = (c.lastrowid,)
+                if row is None:
+                    # Another process created the user after the first read.
+                    c.execute("SELECT `uid` FROM `Users` WHERE `name`=?;", (user.name,))
+                    row = c.fetchone()
+            user_uid = row[0]
+            self._log_writes("insert", "Users", [user])
+        user.uid = user_uid
+        user.mark_clean()
+        self._inserted("Users", [user])
 
     def get_user(self, name):
         """
@@ -85,26 +516,29 @@ class DatabaseConnector(object):
         :return: The user.
         """
         assert isinstance(name, str)
-        c = self._connection.cursor()
-        c.execute("SELECT * FROM `Users` WHERE `name`=?;", (name,))
-        row = c.fetchone()
+        with self.reading() as connection:
+            c = connection.cursor()
+            c.execute("SELECT * FROM `Users` WHERE `name`=?;", (name,))
+            row = c.fetchone()
         if row is None:
             raise KeyError("No user found with the name %s." % name)
         else:
-            return User(*row)
+            return self._from_row("Users", User, row)
 
     def update_user(self, user):
         """
-        Use all not-None values from the given user and use them to overwrite the respective fields of the user with the
-        given uid.
+        Write the modified fields of the given user to the user with the same uid. If the user was not loaded from the
+        database, all not-None values are written.
         :param user: The user database object.
         """
         assert isinstance(user, User)
-        update_object(self._connection, "Users", user, ignore_none=True)
+        with self._writing() as connection:
+            self._update_objects(connection, "Users", [user])
 
     def create_setting(self, setting):
         """
-        Inserts the setting into the database and sets setting.uid and setting.timestamp_create.
+        Inserts the setting into the database and sets setting.uid and setting.timestamp_create. If the settings of the
+        user are cached, the cache is updated, too.
         Raises a TypeError if the setting value cannot be converted to JSON via json.dumps.
         :param setting: The setting.
         """
@@ -116,30 +550,97 @@ class DatabaseConnector(object):
 
         # Set the timestamp and insert the setting into the database.
         setting.timestamp_create = self.get_current_timestamp()
-        insert_object(self._connection, "Settings", setting)
+        with self._writing() as connection:
+            try:
+                self._log_writes("insert", "Settings", [setting])
+                insert_object(connection, "Settings", setting)
+            finally:
+                # Replace the json string with the actual value.
+                setting.value = old_value
+
+            # Write through to the cache. The order is the same as in the database query.
+            settings = self._settings_cache.get(setting.user_uid)
+            if settings is not None:
+                cached = settings.get(setting.key)
+                if cached is None or (setting.timestamp_create, setting.uid) >= (cached.timestamp_create, cached.uid):
+                    settings[setting.key] = copy.deepcopy(setting)
 
-        # Replace the json string with the actual value.
-        setting.value = old_value
+    def load_settings(self, user_uid):
+        """
+        Loads the latest setting of every key of the given user into the settings cache with one query. Afterwards,
+        get_setting() is served from memory. The cache only sees the settings that are written by this connector.
+        :param user_uid: The user uid.
+        """
+        assert isinstance(user_uid, int)
+        with self.reading() as connection:
+            c = connection.cursor()
+            c.execute("SELECT * FROM `Settings` AS `s` WHERE `user_uid`=? AND `uid`=("
+                      "SELECT `uid` FROM `Settings` WHERE `user_uid`=`s`.`user_uid` AND `key`=`s`.`key` "
+                      "ORDER BY `timestamp_create` DESC, `uid` DESC LIMIT 1);", (user_uid,))
+            rows = c.fetchall()
+        settings = {}
+        for row in rows:
+            setting = Setting.from_row(row)
+            setting.value = json.loads(setting.value)
+            settings[setting.key] = setting
+        self._settings_cache[user_uid] = settings
 
     def get_setting(self, user_uid, key):
         """
         Returns the setting for the given user. Raises a KeyError if no setting is found that matches user and key.
+        The settings of the user are loaded into the cache on the first call.
         :param user_uid: The user uid.
         :param key: The setting key.
         :return: The setting.
         """
         assert isinstance(user_uid, int)
         assert isinstance(key, str)
-        c = self._connection.cursor()
-        c.execute("SELECT * FROM `Settings` WHERE `user_uid`=? AND `key`=? "
-                  "ORDER BY `timestamp_create` DESC, `uid` DESC;", (user_uid, key))
-        row = c.fetchone()
-        if row is None:
+        if user_uid not in self._settings_cache:
+            self.load_settings(user_uid)
+        try:
+            setting = self._settings_cache[user_uid][key]
+        except KeyError:
             raise KeyError("No setting found with user_uid=%s and key=%s." % (user_uid, key))
-        else:
-            setting = Setting(*row)
+
+        # Return a copy, so the caller cannot modify the cached value.
+        return copy.deepcopy(setting)
+
+    def compact_settings(self, user_uid, keys):
+        """
+        Deletes the superseded history rows of the given setting keys, so only the latest setting of each key is kept.
+        Keys whose history is still needed, for example the week targets of the balance engine, must not be compacted.
+        :param user_uid: The user uid.
+        :param keys: Iterable with the setting keys.
+        :return: The number of deleted rows.
+        """
+        assert isinstance(user_uid, int)
+        deleted = 0
+        with self.transaction():
+            c = self._connection.cursor()
+            for key in keys:
+                c.execute("DELETE FROM `Settings` WHERE `user_uid`=? AND `key`=? AND `uid`!=("
+                          "SELECT `uid` FROM `Settings` WHERE `user_uid`=? AND `key`=? "
+                          "ORDER BY `timestamp_create` DESC, `uid` DESC LIMIT 1);", (user_uid, key, user_uid, key))
+                deleted += c.rowcount
+        return deleted
+
+    def get_setting_history(self, user_uid, key):
+        """
+        Returns all settings for the given user and key sorted by timestamp_create in ascending order.
+        :param user_uid: The user uid.
+        :param key: The setting key.
+        :return: List with the settings.
+        """
+        assert isinstance(user_uid, int)
+        assert isinstance(key, str)
+        with self.reading() as connection:
+            c = connection.cursor()
+            c.execute("SELECT * FROM `Settings` WHERE `user_uid`=? AND `key`=? "
+                      "ORDER BY `timestamp_create` ASC, `uid` ASC;", (user_uid, key))
+            settings = [Setting.from_row(row) for row in c.fetchall()]
+        for setting in settings:
             setting.value = json.loads(setting.value)
-            return setting
+        return settings
 
     def create_task(self, task):
         """
@@ -148,7 +649,43 @@ class DatabaseConnector(object):
         """
         assert isinstance(task, Task)
         task.timestamp_orderby = self.get_current_timestamp()
-        insert_object(self._connection, "Tasks", task)
+        with self._writing() as connection:
+            self._log_writes("insert", "Tasks", [task])
+            insert_object(connection, "Tasks", task)
+        self._inserted("Tasks", [task])
+
+    def create_tasks(self, tasks):
+        """
+        Inserts the given tasks into the database in one transaction and sets task.uid and task.timestamp_orderby of
+        each task.
+        :param tasks: Iterable with the tasks.
+        :return: List with the inserted tasks.
+        """
+        tasks = list(tasks)
+        now = self.get_current_timestamp()
+        for task in tasks:
+            assert isinstance(task, Task)
+            task.timestamp_orderby = now
+        with self.transaction():
+            self._log_writes("insert", "Tasks", tasks)
+            insert_objects(self._connection, "Tasks", tasks)
+        self._inserted("Tasks", tasks)
+        return tasks
+
+    def get_task(self, task_uid):
+        """
+        Returns the task with the given uid. Raises a KeyError if no task with the given uid exists.
+        :param task_uid: The task uid.
+        :return: The task.
+        """
+        assert isinstance(task_uid, int)
+        with self.reading() as connection:
+            c = connection.cursor()
+            c.execute(select_statement(Task, "Tasks"), (task_uid,))
+            row = c.fetchone()
+        if row is None:
+            raise KeyError("No row found in Tasks with uid=%s." % task_uid)
+        return self._from_row("Tasks", Task, row)
 
     def get_all_tasks(self, user_uid):
         """
@@ -156,13 +693,7 @@ class DatabaseConnector(object):
         :param user_uid: The user uid.
         :return: List with tasks.
         """
-        assert isinstance(user_uid, int)
-        c = self._connection.cursor()
-        c.execute("SELECT * FROM `Tasks` WHERE `user_uid`=? AND `deleted`!=1 "
-                  "ORDER BY `timestamp_orderby` ASC, `uid` ASC;", (user_uid,))
-        rows = c.fetchall()
-        tasks = [Task(*row) for row in rows]
-        return tasks
+        return list(self.iter_tasks(user_uid))
 
     def get_open_tasks(self, user_uid):
         """
@@ -171,22 +702,134 @@ class DatabaseConnector(object):
         :param user_uid: The user uid.
         :return: List with open tasks.
         """
+        return list(self.iter_tasks(user_uid, open_only=True))
+
+    def iter_tasks(self, user_uid, open_only=False, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Yields the tasks of the given user sorted by timestamp_orderby in ascending order like get_all_tasks() and
+        get_open_tasks(), but fetches the rows in chunks instead of loading all of them at once.
+        :param user_uid: The user uid.
+        :param open_only: Whether only tasks that are not done are returned.
+        :param chunk_size: The number of rows per fetch.
+        :return: Generator with the tasks.
+        """
+        task_filter = TaskFilter(done=False) if open_only else TaskFilter()
+        read = lambda connection: fetch_chunks(self._select_tasks(connection, user_uid, task_filter), chunk_size)
+        return self._iter_objects(read, "Tasks", Task)
+
+    def _iter_objects(self, read, table_name, database_object_class):
+        """
+        Yields the database objects of the rows of _iter_chunks(read).
+        :param read: Generator function that runs the queries on the given connection and yields lists of rows.
+        :param table_name: The table name.
+        :param database_object_class: The database object class.
+        :return: Generator with the database objects.
+        """
+        for rows in self._iter_chunks(read):
+            for row in rows:
+                yield self._from_row(table_name, database_object_class, row)
+
+    def _iter_chunks(self, read):
+        """
+        Yields the lists of rows of read(connection). The generators of the iterators are consumed in turns with other
+        reads of the same thread, so they never keep the connection of reading() while they are suspended:
+        With the reader pool, a generator that is started outside of reading() acquires its own read connection and
+        keeps it and its snapshot until it is exhausted or closed. Inside reading(), inside a transaction of the current
+        thread, or while an archive database is attached, the rows are read at once on the connection of reading(), so
+        neither that connection nor the write lock is held while the generator is suspended. Without the reader pool,
+        the connection can only be used by the thread that created it, so the rows are read chunk by chunk without the
+        write lock.
+        :param read: Generator function that runs the queries on the given connection and yields lists of rows.
+        :return: Generator with lists of rows.
+        """
+        if self._pool is None:
+            yield from read(self._connection)
+        elif (self._archive_attached or getattr(self._local, "write_depth", 0) > 0 or
+              getattr(self._local, "read_depth", 0) > 0):
+            with self.reading() as connection:
+                chunks = list(read(connection))
+            yield from chunks
+        else:
+            connection = self._pool.acquire()
+            try:
+                connection.execute("BEGIN;")
+                try:
+                    yield from read(connection)
+                finally:
+                    connection.execute("COMMIT;")
+            finally:
+                self._pool.release(connection)
+
+    def get_tasks(self, user_uid, task_filter=None, after=None, limit=None):
+        """
+        Returns the tasks of the given user that match the filter, sorted by (timestamp_orderby, uid) in ascending
+        order. The filter runs in SQL on the Tasks indexes. With after and limit, the tasks are returned page by page
+        (keyset pagination), so every page costs an index seek and the number of returned rows, no matter how many
+        tasks come before it.
+        :param user_uid: The user uid.
+        :param task_filter: The TaskFilter. Defaults to all not deleted tasks.
+        :param after: The last task of the previous page or None for the first page.
+        :param limit: The maximum number of tasks or None.
+        :return: List with the tasks.
+        """
+        with self.reading() as connection:
+            rows = self._select_tasks(connection, user_uid, task_filter, after, limit).fetchall()
+        return [self._from_row("Tasks", Task, row) for row in rows]
+
+    def get_tasks_page(self, user_uid, after=None, limit=DEFAULT_PAGE_SIZE, done=None, type_id=None):
+        """
+        Returns the next page of not deleted tasks of the given user like get_tasks().
+        :param user_uid: The user uid.
+        :param after: The last task of the previous page or None for the first page.
+        :param limit: The maximum number of tasks on the page.
+        :param done: If not None, only tasks with this done state are returned.
+        :param type_id: If not None, only tasks with this type id are returned.
+        :return: List with the tasks. The list is shorter than limit on the last page.
+        """
+        return self.get_tasks(user_uid, TaskFilter(type_id=type_id, done=done), after, limit)
+
+    def _select_tasks(self, connection, user_uid, task_filter=None, after=None, limit=None):
+        """
+        Executes the task query of get_tasks() on the given connection and returns the cursor.
+        :param connection: The connection from reading() or _iter_chunks().
+        :param user_uid: The user uid.
+        :param task_filter: The TaskFilter. Defaults to all not deleted tasks.
+        :param after: The last task of the previous page or None.
+        :param limit: The maximum number of tasks or None.
+        :return: The cursor.
+        """
         assert isinstance(user_uid, int)
-        c = self._connection.cursor()
-        c.execute("SELECT * FROM `Tasks` WHERE `user_uid`=? AND `done`=0 AND `deleted`!=1 "
-                  "ORDER BY `timestamp_orderby` ASC, `uid` ASC;", (user_uid,))
-        rows = c.fetchall()
-        tasks = [Task(*row) for row in rows]
-        return tasks
+        if task_filter is None:
+            task_filter = TaskFilter()
+        assert isinstance(task_filter, TaskFilter)
+        condition, params = task_filter.to_sql()
+        query = "SELECT * FROM `Tasks` WHERE `user_uid`=?"
+        params = [user_uid] + params
+        if condition:
+            query += " AND " + condition
+        if after is not None:
+            # The first condition lets SQLite seek into the index, the second one skips the tasks with the same
+            # timestamp_orderby up to the uid of the last task.
+            query += " AND `timestamp_orderby`>=? AND (`timestamp_orderby`>? OR `uid`>?)"
+            orderby = timestamp_to_sql(after.timestamp_orderby)
+            params += [orderby, orderby, after.uid]
+        query += " ORDER BY `timestamp_orderby` ASC, `uid` ASC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        c = connection.cursor()
+        c.execute(query + ";", params)
+        return c
 
     def update_task(self, task):
         """
-        Use all not-None values from the given task and use them to overwrite the respective fields of the task with the
-        given uid.
+        Write the modified fields of the given task to the task with the same uid. If the task was not loaded from the
+        database, all not-None values are written. Nothing is written if no field was modified.
         :param task: The task with the update values.
         """
         assert isinstance(task, Task)
-        update_object(self._connection, "Tasks", task, ignore_none=True)
+        with self._writing() as connection:
+            self._update_objects(connection, "Tasks", [task])
 
     def create_track_entry(self, entry):
         """
@@ -194,7 +837,27 @@ class DatabaseConnector(object):
         :param entry: The track entry.
         """
         assert isinstance(entry, TrackEntry)
-        insert_object(self._connection, "TrackEntries", entry)
+        with self.transaction():
+            self._log_writes("insert", "TrackEntries", [entry])
+            insert_object(self._connection, "TrackEntries", entry)
+            add_track_entries(self._connection, _rollup_rows([entry.sql_values()]))
+        self._inserted("TrackEntries", [entry])
+
+    def create_track_entries(self, entries):
+        """
+        Inserts the given track entries into the database in one transaction and sets entry.uid of each entry.
+        :param entries: Iterable with the track entries.
+        :return: List with the inserted track entries.
+        """
+        entries = list(entries)
+        for entry in entries:
+            assert isinstance(entry, TrackEntry)
+        with self.transaction():
+            self._log_writes("insert", "TrackEntries", entries)
+            insert_objects(self._connection, "TrackEntries", entries)
+            add_track_entries(self._connection, _rollup_rows(entry.sql_values() for entry in entries))
+        self._inserted("TrackEntries", entries)
+        return entries
 
     def get_track_entries(self, task_uid):
         """
@@ -203,12 +866,93 @@ class DatabaseConnector(object):
         :return: List with the track entries.
         """
         assert isinstance(task_uid, int)
-        c = self._connection.cursor()
-        c.execute("SELECT * FROM `TrackEntries` WHERE `task_uid`=? ORDER BY `timestamp_begin` ASC;", (task_uid,))
-        rows = c.fetchall()
-        entries = [TrackEntry(*row) for row in rows]
+        with self.reading() as connection:
+            c = connection.cursor()
+            c.execute("SELECT * FROM `TrackEntries` WHERE `task_uid`=? ORDER BY `timestamp_begin` ASC;", (task_uid,))
+            rows = c.fetchall()
+        entries = [self._from_row("TrackEntries", TrackEntry, row) for row in rows]
         return entries
 
+    def iter_track_entries(self, user_uid, since=None, until=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Yields the track entries of all tasks of the given user that begin in the range [since, until), sorted by
+        timestamp_begin in ascending order. The rows are fetched in chunks, so exports and reports over long histories
+        run in bounded memory.
+        :param user_uid: The user uid.
+        :param since: The earliest begin (datetime). Defaults to no lower bound.
+        :param until: The begin after the last entry (datetime). Defaults to no upper bound.
+        :param chunk_size: The number of rows per fetch.
+        :return: Generator with the track entries.
+        """
+        assert isinstance(user_uid, int)
+        read = lambda connection: self._read_track_entries(connection, user_uid, since, until, chunk_size)
+        return self._iter_objects(read, "TrackEntries", TrackEntry)
+
+    def _read_track_entries(self, connection, user_uid, since, until, chunk_size):
+        """
+        Reads the rows of iter_track_entries() on the given connection. The queries start from the tasks of the user and
+        search the TrackEntries_task index of each task, so the track entries of other users are never read. Ordering
+        the entries of all tasks by timestamp_begin needs a sort, so the range is read in time windows that are sorted
+        one at a time. The window length adapts to the density of the entries, so a window holds about _WINDOW_ROWS
+        entries.
+        :param connection: The connection from _iter_chunks().
+        :param user_uid: The user uid.
+        :param since: The earliest begin (datetime) or None.
+        :param until: The begin after the last entry (datetime) or None.
+        :param chunk_size: The number of rows per fetch.
+        :return: Generator with lists of rows.
+        """
+        c = connection.cursor()
+        if since is not None and until is not None:
+            lower, upper = timestamp_to_sql(since), timestamp_to_sql(until)
+        else:
+            # Without a bound, the range is limited to the first and the last entry of the user.
+            c.execute("SELECT MIN(`first`), MAX(`last`) FROM (SELECT "
+                      "(SELECT MIN(`timestamp_begin`) FROM `TrackEntries` WHERE `task_uid`=`Tasks`.`uid`) AS `first`, "
+                      "(SELECT MAX(`timestamp_begin`) FROM `TrackEntries` WHERE `task_uid`=`Tasks`.`uid`) AS `last` "
+                      "FROM `Tasks` WHERE `user_uid`=?);", (user_uid,))
+            first, last = c.fetchone()
+            if first is None:
+                return
+            lower = first if since is None else max(first, timestamp_to_sql(since))
+            upper = last + 1 if until is None else min(last + 1, timestamp_to_sql(until))
+
+        query = ("SELECT `TrackEntries`.* FROM `Tasks` "
+                 "CROSS JOIN `TrackEntries` ON `TrackEntries`.`task_uid`=`Tasks`.`uid` "
+                 "WHERE `Tasks`.`user_uid`=? AND `TrackEntries`.`timestamp_begin`>=? "
+                 "AND `TrackEntries`.`timestamp_begin`<? "
+                 "ORDER BY `TrackEntries`.`timestamp_begin` ASC, `TrackEntries`.`uid` ASC;")
+        window = _INITIAL_WINDOW
+        while lower < upper:
+            window_end = min(lower + window, upper)
+            count = 0
+            for rows in fetch_chunks(c.execute(query, (user_uid, lower, window_end)), chunk_size):
+                count += len(rows)
+                yield rows
+            if count < _WINDOW_ROWS // 2:
+                window *= 2
+            elif count > _WINDOW_ROWS * 2:
+                window = max(window // 2, 1)
+            lower = window_end
+
+    def get_current_task_uid(self, user_uid):
+        """
+        Returns the task uid of the latest open track entry of the given user.
+        :param user_uid: The user uid.
+        :return: The task uid or None if the user has no open track entry.
+        """
+        assert isinstance(user_uid, int)
+        with self.reading() as connection:
+            c = connection.cursor()
+            c.execute("SELECT `TrackEntries`.`task_uid` FROM `Tasks` "
+                      "JOIN `TrackEntries` ON `TrackEntries`.`task_uid`=`Tasks`.`uid` "
+                      "WHERE `Tasks`.`user_uid`=? AND `TrackEntries`.`timestamp_end` IS NULL "
+                      "AND `TrackEntries`.`deleted`=0 "
+                      "ORDER BY `TrackEntries`.`timestamp_begin` DESC, `TrackEntries`.`uid` DESC LIMIT 1;",
+                      (user_uid,))
+            row = c.fetchone()
+        return None if row is None else row[0]
+
     def get_open_track_entries(self, task_uid):
         """
         Returns all open track entries for the given task sorted by timestamp in ascending order.
@@ -216,26 +960,116 @@ class DatabaseConnector(object):
         :return: List with the open track entries.
         """
         assert isinstance(task_uid, int)
-        c = self._connection.cursor()
-        c.execute("SELECT * FROM `TrackEntries` WHERE `task_uid`=? AND `timestamp_end` IS NULL "
-                  "ORDER BY `timestamp_begin` ASC;", (task_uid,))
-        rows = c.fetchall()
-        entries = [TrackEntry(*row) for row in rows]
+        with self.reading() as connection:
+            c = connection.cursor()
+            c.execute("SELECT * FROM `TrackEntries` WHERE `task_uid`=? AND `timestamp_end` IS NULL "
+                      "ORDER BY `timestamp_begin` ASC;", (task_uid,))
+            rows = c.fetchall()
+        entries = [self._from_row("TrackEntries", TrackEntry, row) for row in rows]
         return entries
 
     def update_track_entry(self, entry):
         """
-        Update all not-None values from the given track entry and use them to overwrite the respective fields of the
-        track entry with the given uid.
+        Write the modified fields of the given track entry to the track entry with the same uid. If the track entry was
+        not loaded from the database, all not-None values are written. Nothing is written if no field was modified.
         :param entry: The track entry with the update values.
         """
         assert isinstance(entry, TrackEntry)
-        update_object(self._connection, "TrackEntries", entry, ignore_none=True)
+        with self.transaction():
+            self._update_track_entries([entry])
+
+    def update_track_entries(self, entries):
+        """
+        Updates the given track entries like update_track_entry() in one transaction. Track entries without modified
+        fields are skipped.
+        :param entries: Iterable with the track entries with the update values.
+        """
+        entries = list(entries)
+        for entry in entries:
+            assert isinstance(entry, TrackEntry)
+        with self.transaction():
+            self._update_track_entries(entries)
+
+    def _update_track_entries(self, entries):
+        """
+        Updates the given track entries and moves their time in the rollup tables. Track entries whose modified fields
+        do not affect the tracked time are written without touching the rollups.
+        :param entries: List with the track entries with the update values.
+        """
+        rollup_uids = [entry.uid for entry in entries if entry.dirty_fields() is None or
+                       not _ROLLUP_FIELDS.isdisjoint(entry.dirty_fields())]
+        add_track_entries(self._connection, _rollup_rows(self._select_track_entry_rows(rollup_uids)), -1)
+        self._update_objects(self._connection, "TrackEntries", entries)
+        add_track_entries(self._connection, _rollup_rows(self._select_track_entry_rows(rollup_uids)), 1)
+
+    def _select_track_entry_rows(self, uids):
+        """
+        Returns the rows of the track entries with the given uids as they are stored in the database.
+        :param uids: List with the track entry uids.
+        :return: List with the rows.
+        """
+        c = self._connection.cursor()
+        rows = []
+        for i in range(0, len(uids), MAX_VARIABLES):
+            chunk = uids[i:i+MAX_VARIABLES]
+            c.execute("SELECT * FROM `TrackEntries` WHERE `uid` IN (%s);" % ", ".join("?" * len(chunk)), chunk)
+            rows.extend(c.fetchall())
+        return rows
+
+    def rebuild_rollups(self, user_uid=None):
+        """
+        Regenerates the rollup tables from the track entries, for example after the track entries were modified without
+        the connector. If data was archived, the archive database must be attached, otherwise a RuntimeError is raised,
+        since the archived time would be lost from the rollups.
+        :param user_uid: The user whose rollups are regenerated. Defaults to all users.
+        """
+        missing = [location for location in self.get_archive_locations() if location != self._archive_location]
+        if len(missing) > 0:
+            raise RuntimeError("The rollups cannot be rebuilt without the archived track entries in %s. Attach the "
+                               "archive database first." % ", ".join(missing))
+        with self.transaction():
+            rebuild(self._connection, user_uid, *self.history_tables)
+
+    def get_task_total(self, task_uid):
+        """
+        Returns the tracked time of the given task. Open and deleted track entries do not count.
+        :param task_uid: The task uid.
+        :return: The tracked time as timedelta.
+        """
+        assert isinstance(task_uid, int)
+        with self.reading() as connection:
+            c = connection.cursor()
+            c.execute("SELECT `duration` FROM `TaskTotals` WHERE `task_uid`=?;", (task_uid,))
+            row = c.fetchone()
+        duration = 0 if row is None else row[0]
+        return datetime.timedelta(0, 0, duration)
+
+    def get_task_totals(self, user_uid, task_filter=None):
+        """
+        Returns the tracked time of the tasks of the given user that match the filter. Open and deleted track entries do
+        not count.
+        :param user_uid: The user uid.
+        :param task_filter: The TaskFilter. Defaults to the open tasks.
+        :return: Dict {task_uid: timedelta}.
+        """
+        assert isinstance(user_uid, int)
+        if task_filter is None:
+            task_filter = TaskFilter(done=False)
+        assert isinstance(task_filter, TaskFilter)
+        condition, params = task_filter.to_sql()
+        query = ("SELECT `Tasks`.`uid`, `TaskTotals`.`duration` FROM `Tasks` "
+                 "LEFT JOIN `TaskTotals` ON `TaskTotals`.`task_uid`=`Tasks`.`uid` WHERE `Tasks`.`user_uid`=?")
+        if condition:
+            query += " AND " + condition
+        with self.reading() as connection:
+            c = connection.cursor()
+            c.execute(query + ";", [user_uid] + params)
+            rows = c.fetchall()
+        return {task_uid: datetime.timedelta(0, 0, duration or 0) for task_uid, duration in rows}
 
     def get_current_timestamp(self):
         """
-        Returns a well-formatted current timestamp.
+        Returns the current timestamp.
         :return: The timestamp.
         """
-        now = datetime.datetime.now()
-        return now.strftime(self.date_format)
+        return datetime.datetime.now()
@@ -0,0 +1,417 @@
+import logging
+
+
+def _create_tables(connection):
+    """
+    Version 1: Create the initial tables. Files that were created before the schema was versioned already contain the
+    tables, so IF NOT EXISTS is used.
+    :param connection: The database connection.
+    """
+    c = connection.cursor()
+    c.execute("CREATE TABLE IF NOT EXISTS `Users` ("
+              "`uid` INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, "
+              "`name` TEXT NOT NULL, "
+              "`deleted` BOOLEAN NOT NULL);")
+    c.execute("CREATE TABLE IF NOT EXISTS `Settings` ("
+              "`uid` INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, "
+              "`user_uid` INTEGER NOT NULL, "
+              "`timestamp_create` TEXT NOT NULL, "
+              "`key` TEXT NOT NULL, "
+              "`value` TEXT NOT NULL);")
+    c.execute("CREATE TABLE IF NOT EXISTS `Tasks` ("
+              "`uid` INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, "
+              "`user_uid` INTEGER NOT NULL, "
+              "`title` TEXT, "
+              "`description` TEXT, "
+              "`done` BOOLEAN NOT NULL, "
+              "`timestamp_orderby` TEXT NOT NULL, "
+              "`type_id` INTEGER NOT NULL, "
+              "`deleted` BOOLEAN NOT NULL);")
+    c.execute("CREATE TABLE IF NOT EXISTS `TrackEntries` ("
+              "`uid` INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, "
+              "`task_uid` INTEGER NOT NULL, "
+              "`timestamp_begin` TEXT NOT NULL, "
+              "`timestamp_end` TEXT, "
+              "`deleted` BOOLEAN NOT NULL);")
+
+
+def _create_indexes(connection):
+    """
+    Version 2: Create the indexes that match the WHERE / ORDER BY clauses of the task, track entry, and setting queries.
+    :param connection: The database connection.
+    """
+    c = connection.cursor()
+    c.execute("CREATE INDEX IF NOT EXISTS `Settings_latest` "
+              "ON `Settings` (`user_uid`, `key`, `timestamp_create` DESC, `uid` DESC);")
+    c.execute("CREATE INDEX IF NOT EXISTS `Tasks_open` "
+              "ON `Tasks` (`user_uid`, `done`, `deleted`, `timestamp_orderby`, `uid`);")
+    c.execute("CREATE INDEX IF NOT EXISTS `Tasks_all` "
+              "ON `Tasks` (`user_uid`, `deleted`, `timestamp_orderby`, `uid`);")
+    c.execute("CREATE INDEX IF NOT EXISTS `TrackEntries_task` "
+              "ON `TrackEntries` (`task_uid`, `timestamp_begin`);")
+    c.execute("CREATE INDEX IF NOT EXISTS `TrackEntries_open` "
+              "ON `TrackEntries` (`task_uid`, `timestamp_begin`) WHERE `timestamp_end` IS NULL;")
+
+
+def _text_timestamp_to_integer(column):
+    """
+    Returns the SQL expression that converts a timestamp column in the old text format "%Y-%m-%dT%H:%M:%S:%f" to
+    integer microseconds since 1970-01-01 00:00. strftime() treats the text as UTC, which gives exactly the wall-clock
+    microseconds that are used by timestamp_to_sql(). Values that are already integers are kept.
+    :param column: The column name.
+    :return: The SQL expression.
+    """
+    return ("CASE WHEN `{0}` IS NULL OR typeof(`{0}`)='integer' THEN `{0}` "
+            "ELSE CAST(strftime('%s', substr(`{0}`, 1, 19)) AS INTEGER) * 1000000 + CAST(substr(`{0}`, 21) AS INTEGER) "
+            "END").format(column)
+
+
+def _rebuild_table(connection, table_name, create_query, select_columns):
+    """
+    Replace a table by a new table with a different column definition. The rows are copied with the given select
+    expressions and the AUTOINCREMENT counter is kept. Indexes of the old table are dropped.
+    :param connection: The database connection.
+    :param table_name: The table name.
+    :param create_query: The CREATE TABLE query for the new table, with the placeholder {} for the table name.
+    :param select_columns: List with the SQL expressions that compute the new columns from the old ones.
+    """
+    new_table_name = table_name + "_new"
+    c = connection.cursor()
+    c.execute("SELECT `seq` FROM `sqlite_sequence` WHERE `name`=?;", (table_name,))
+    row = c.fetchone()
+    c.execute(create_query.format(new_table_name))
+    c.execute("INSERT INTO `%s` SELECT %s FROM `%s`;" % (new_table_name, ", ".join(select_columns), table_name))
+    c.execute("DROP TABLE `%s`;" % table_name)
+    c.execute("ALTER TABLE `%s` RENAME TO `%s`;" % (new_table_name, table_name))
+    if row is not None:
+        c.execute("DELETE FROM `sqlite_sequence` WHERE `name`=?;", (table_name,))
+        c.execute("INSERT INTO `sqlite_sequence` (`name`, `seq`) VALUES (?, ?);", (table_name, row[0]))
+
+
+def _integer_timestamps(connection):
+    """
+    Version 3: Store the timestamps as integer microseconds since 1970-01-01 00:00 instead of formatted text.
+    :param connection: The database connection.
+    """
+    _rebuild_table(connection, "Settings",
+                   "CREATE TABLE `{}` ("
+                   "`uid` INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, "
+                   "`user_uid` INTEGER NOT NULL, "
+                   "`timestamp_create` INTEGER NOT NULL, "
+                   "`key` TEXT NOT NULL, "
+                   "`value` TEXT NOT NULL);",
+                   ["`uid`", "`user_uid`", _text_timestamp_to_integer("timestamp_create"), "`key`", "`value`"])
+    _rebuild_table(connection, "Tasks",
+                   "CREATE TABLE `{}` ("
+                   "`uid` INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, "
+                   "`user_uid` INTEGER NOT NULL, "
+                   "`title` TEXT, "
+                   "`description` TEXT, "
+                   "`done` BOOLEAN NOT NULL, "
+                   "`timestamp_orderby` INTEGER NOT NULL, "
+                   "`type_id` INTEGER NOT NULL, "
+                   "`deleted` BOOLEAN NOT NULL);",
+                   ["`uid`", "`user_uid`", "`title`", "`description`", "`done`",
+                    _text_timestamp_to_integer("timestamp_orderby"), "`type_id`", "`deleted`"])
+    _rebuild_table(connection, "TrackEntries",
+                   "CREATE TABLE `{}` ("
+                   "`uid` INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, "
+                   "`task_uid` INTEGER NOT NULL, "
+                   "`timestamp_begin` INTEGER NOT NULL, "
+                   "`timestamp_end` INTEGER, "
+                   "`deleted` BOOLEAN NOT NULL);",
+                   ["`uid`", "`task_uid`", _text_timestamp_to_integer("timestamp_begin"),
+                    _text_timestamp_to_integer("timestamp_end"), "`deleted`"])
+    _create_indexes(connection)
+
+
+def _task_totals(connection):
+    """
+    Version 4: Create the TaskTotals table with the tracked microseconds per task and the triggers that keep it up to
+    date whenever a track entry is inserted, closed, edited, or deleted. Open and deleted track entries do not count.
+    :param connection: The database connection.
+    """
+    c = connection.cursor()
+    c.execute("CREATE TABLE `TaskTotals` ("
+              "`task_uid` INTEGER NOT NULL PRIMARY KEY, "
+              "`duration` INTEGER NOT NULL);")
+    c.execute("INSERT INTO `TaskTotals` "
+              "SELECT `task_uid`, SUM(`timestamp_end` - `timestamp_begin`) FROM `TrackEntries` "
+              "WHERE `timestamp_end` IS NOT NULL AND `deleted`=0 GROUP BY `task_uid`;")
+    c.execute("CREATE TRIGGER `TrackEntries_totals_insert` AFTER INSERT ON `TrackEntries` "
+              "WHEN NEW.`timestamp_end` IS NOT NULL AND NEW.`deleted`=0 "
+              "BEGIN "
+              "INSERT OR IGNORE INTO `TaskTotals` VALUES (NEW.`task_uid`, 0); "
+              "UPDATE `TaskTotals` SET `duration` = `duration` + NEW.`timestamp_end` - NEW.`timestamp_begin` "
+              "WHERE `task_uid`=NEW.`task_uid`; "
+              "END;")
+    c.execute("CREATE TRIGGER `TrackEntries_totals_update` "
+              "AFTER UPDATE OF `task_uid`, `timestamp_begin`, `timestamp_end`, `deleted` ON `TrackEntries` "
+              "BEGIN "
+              "UPDATE `TaskTotals` SET `duration` = `duration` - (OLD.`timestamp_end` - OLD.`timestamp_begin`) "
+              "WHERE `task_uid`=OLD.`task_uid` AND OLD.`timestamp_end` IS NOT NULL AND OLD.`deleted`=0; "
+              "INSERT OR IGNORE INTO `TaskTotals` SELECT NEW.`task_uid`, 0 "
+              "WHERE NEW.`timestamp_end` IS NOT NULL AND NEW.`deleted`=0; "
+              "UPDATE `TaskTotals` SET `duration` = `duration` + (NEW.`timestamp_end` - NEW.`timestamp_begin`) "
+              "WHERE `task_uid`=NEW.`task_uid` AND NEW.`timestamp_end` IS NOT NULL AND NEW.`deleted`=0; "
+              "END;")
+    c.execute("CREATE TRIGGER `TrackEntries_totals_delete` AFTER DELETE ON `TrackEntries` "
+              "WHEN OLD.`timestamp_end` IS NOT NULL AND OLD.`deleted`=0 "
+              "BEGIN "
+              "UPDATE `TaskTotals` SET `duration` = `duration` - (OLD.`timestamp_end` - OLD.`timestamp_begin`) "
+              "WHERE `task_uid`=OLD.`task_uid`; "
+              "END;")
+
+
+def _balance_checkpoints(connection):
+    """
+    Version 5: Create the BalanceCheckpoints table with the worked time, the target time, and the running overtime
+    balance at the end of each day, and the triggers that delete outdated checkpoints when track entries or the week
+    targets change.
+    :param connection: The database connection.
+    """
+    c = connection.cursor()
+    c.execute("CREATE TABLE `BalanceCheckpoints` ("
+              "`user_uid` INTEGER NOT NULL, "
+              "`day` INTEGER NOT NULL, "
+              "`worked` INTEGER NOT NULL, "
+              "`target` INTEGER NOT NULL, "
+              "`balance` INTEGER NOT NULL, "
+              "PRIMARY KEY (`user_uid`, `day`)) WITHOUT ROWID;")
+    invalidate = ("DELETE FROM `BalanceCheckpoints` "
+                  "WHERE `user_uid`=(SELECT `user_uid` FROM `Tasks` WHERE `uid`={0}.`task_uid`) "
+                  "AND `day`>={0}.`timestamp_begin` / 86400000000; ")
+    c.execute("CREATE TRIGGER `TrackEntries_checkpoints_insert` AFTER INSERT ON `TrackEntries` "
+              "BEGIN " + invalidate.format("NEW") + "END;")
+    c.execute("CREATE TRIGGER `TrackEntries_checkpoints_update` "
+              "AFTER UPDATE OF `task_uid`, `timestamp_begin`, `timestamp_end`, `deleted` ON `TrackEntries` "
+              "BEGIN " + invalidate.format("OLD") + invalidate.format("NEW") + "END;")
+    c.execute("CREATE TRIGGER `TrackEntries_checkpoints_delete` AFTER DELETE ON `TrackEntries` "
+              "BEGIN " + invalidate.format("OLD") + "END;")
+    c.execute("CREATE TRIGGER `Settings_checkpoints_insert` AFTER INSERT ON `Settings` "
+              "WHEN NEW.`key`='week_targets' "
+              "BEGIN "
+              "DELETE FROM `BalanceCheckpoints` "
+              "WHERE `user_uid`=NEW.`user_uid` AND `day`>=NEW.`timestamp_create` / 86400000000; "
+              "END;")
+
+
+def _rollups(connection):
+    """
+    Version 6: Create the RollupsDay, RollupsWeek, and RollupsMonth tables with the tracked microseconds per user, task,
+    and period, and fill them from the closed and not deleted track entries. Entries that cross midnight are split.
+    :param connection: The database connection.
+    """
+    c = connection.cursor()
+    for table_name in ("RollupsDay", "RollupsWeek", "RollupsMonth"):
+        c.execute("CREATE TABLE `%s` ("
+                  "`user_uid` INTEGER NOT NULL, "
+                  "`day` INTEGER NOT NULL, "
+                  "`task_uid` INTEGER NOT NULL, "
+                  "`type_id` INTEGER, "
+                  "`duration` INTEGER NOT NULL, "
+                  "PRIMARY KEY (`user_uid`, `day`, `task_uid`)) WITHOUT ROWID;" % table_name)
+    c.execute("WITH RECURSIVE "
+              "`segments`(`user_uid`, `task_uid`, `type_id`, `day`, `begin`, `end`) AS ("
+              "SELECT `Tasks`.`user_uid`, `TrackEntries`.`task_uid`, `Tasks`.`type_id`, "
+              "`TrackEntries`.`timestamp_begin` / 86400000000, "
+              "`TrackEntries`.`timestamp_begin`, `TrackEntries`.`timestamp_end` "
+              "FROM `Tasks` JOIN `TrackEntries` ON `TrackEntries`.`task_uid`=`Tasks`.`uid` "
+              "WHERE `TrackEntries`.`deleted`=0 AND `TrackEntries`.`timestamp_end` IS NOT NULL "
+              "AND `TrackEntries`.`timestamp_begin`<`TrackEntries`.`timestamp_end` "
+              "UNION ALL "
+              "SELECT `user_uid`, `task_uid`, `type_id`, `day` + 1, (`day` + 1) * 86400000000, `end` FROM `segments` "
+              "WHERE (`day` + 1) * 86400000000 < `end`) "
+              "INSERT INTO `RollupsDay` "
+              "SELECT `user_uid`, `day`, `task_uid`, `type_id`, SUM(MIN(`end`, (`day` + 1) * 86400000000) - `begin`) "
+              "FROM `segments` GROUP BY `user_uid`, `day`, `task_uid`;")
+    c.execute("INSERT INTO `RollupsWeek` "
+              "SELECT `user_uid`, `day` - ((`day` + 3) % 7), `task_uid`, `type_id`, SUM(`duration`) "
+              "FROM `RollupsDay` GROUP BY 1, 2, 3;")
+    c.execute("INSERT INTO `RollupsMonth` "
+              "SELECT `user_uid`, "
+              "CAST(julianday(`day` * 86400, 'unixepoch', 'start of month') - 2440587.5 AS INTEGER), "
+              "`task_uid`, `type_id`, SUM(`duration`) "
+              "FROM `RollupsDay` GROUP BY 1, 2, 3;")
+
+
+def _track_entries_begin_index(connection):
+    """
+    Version 7: Create an index on the begin of the track entries, so the track entries of a time range can be streamed
+    in order without sorting them first.
+    :param connection: The database connection.
+    """
+    c = connection.cursor()
+    c.execute("CREATE INDEX `TrackEntries_begin` ON `TrackEntries` (`timestamp_begin`);")
+
+
+def _task_type_indexes(connection):
+    """
+    Version 8: Create the indexes for the task pages that are filtered by type id, with and without the done state.
+    :param connection: The database connection.
+    """
+    c = connection.cursor()
+    c.execute("CREATE INDEX `Tasks_type` "
+              "ON `Tasks` (`user_uid`, `type_id`, `deleted`, `timestamp_orderby`, `uid`);")
+    c.execute("CREATE INDEX `Tasks_type_done` "
+              "ON `Tasks` (`user_uid`, `type_id`, `done`, `deleted`, `timestamp_orderby`, `uid`);")
+
+
+def _unique_user_names(connection):
+    """
+    Version 9: Merge users with the same name into the user with the lowest uid, which is the one that get_user()
+    returned so far, and create a unique index on the user names, so a user can be created or found with a single
+    upsert. The tasks, settings, and rollups of the merged users are moved to the kept user. The balance checkpoints of
+    the affected users are dropped and recomputed on demand. Archive databases are not attached here, so archived tasks
+    keep the uid of the merged user.
+    :param connection: The database connection.
+    """
+    c = connection.cursor()
+    c.execute("CREATE TEMP TABLE `MergedUsers` AS "
+              "SELECT `u`.`uid` AS `old_uid`, (SELECT MIN(`uid`) FROM `Users` WHERE `name`=`u`.`name`) AS `new_uid` "
+              "FROM `Users` AS `u` WHERE `u`.`uid`!=(SELECT MIN(`uid`) FROM `Users` WHERE `name`=`u`.`name`);")
+    c.execute("DELETE FROM `BalanceCheckpoints` WHERE `user_uid` IN "
+              "(SELECT `old_uid` FROM `temp`.`MergedUsers` UNION SELECT `new_uid` FROM `temp`.`MergedUsers`);")
+    for table_name in ("Settings", "Tasks", "RollupsDay", "RollupsWeek", "RollupsMonth"):
+        c.execute("UPDATE `%s` SET `user_uid`=(SELECT `new_uid` FROM `temp`.`MergedUsers` WHERE `old_uid`=`user_uid`) "
+                  "WHERE `user_uid` IN (SELECT `old_uid` FROM `temp`.`MergedUsers`);" % table_name)
+    c.execute("DELETE FROM `Users` WHERE `uid` IN (SELECT `old_uid` FROM `temp`.`MergedUsers`);")
+    c.execute("DROP TABLE `temp`.`MergedUsers`;")
+    c.execute("CREATE UNIQUE INDEX `Users_name` ON `Users` (`name`);")
+
+
+def _track_entry_length_index(connection):
+    """
+    Version 10: Create an index on the length of the closed track entries. The longest entry is the first row of the
+    index, so the queries over a time range can bound the begin of the closed entries from below.
+    :param connection: The database connection.
+    """
+    c = connection.cursor()
+    c.execute("CREATE INDEX `TrackEntries_length` ON `TrackEntries` (`timestamp_end` - `timestamp_begin`) "
+              "WHERE `timestamp_end` IS NOT NULL;")
+
+
+def _archive_locations(connection):
+    """
+    Version 11: Create the table that records the archive databases that received data, together with the cutoff of the
+    last move, so the rollups are not rebuilt and reports are not read without the archived track entries.
+    :param connection: The database connection.
+    """
+    c = connection.cursor()
+    c.execute("CREATE TABLE `Archives` ("
+              "`location` TEXT NOT NULL PRIMARY KEY, "
+              "`cutoff` INTEGER NOT NULL);")
+
+
+def _drop_overlapping_task_indexes(connection):
+    """
+    Version 12: Drop the Tasks indexes that overlap with the others, so every task write maintains two indexes instead
+    of four. Tasks_all answers the queries without a type filter and the pages of one or more types, Tasks_type_done
+    answers the queries for the open tasks of a type, which skip the general work and pause tasks that are never done.
+    :param connection: The database connection.
+    """
+    c = connection.cursor()
+    c.execute("DROP INDEX `Tasks_open`;")
+    c.execute("DROP INDEX `Tasks_type`;")
+
+
+def _open_tasks_index(connection):
+    """
+    Version 13: Create Tasks_open again, which version 12 dropped. Without it, the queries for the open or the done
+    tasks of all types search Tasks_all and read every task of the other state. Tasks_type stays dropped: the pages of
+    a type read Tasks_all in order and check the type per row.
+    :param connection: The database connection.
+    """
+    c = connection.cursor()
+    c.execute("CREATE INDEX IF NOT EXISTS `Tasks_open` "
+              "ON `Tasks` (`user_uid`, `done`, `deleted`, `timestamp_orderby`, `uid`);")
+
+
+def _deleted_track_entries_index(connection):
+    """
+    Version 14: Replace TrackEntries_begin with a partial index on the begin of the deleted track entries. The track
+    entry iterator reads the entries of each task from TrackEntries_task, so the archive is the only remaining reader,
+    and it only looks up the deleted entries before the cutoff. The partial index is not written for the other entries.
+    :param connection: The database connection.
+    """
+    c = connection.cursor()
+    c.execute("DROP INDEX `TrackEntries_begin`;")
+    c.execute("CREATE INDEX `TrackEntries_deleted` ON `TrackEntries` (`timestamp_begin`) WHERE `deleted`=1;")
+
+
+# The database schema is versioned with PRAGMA user_version. MIGRATIONS[i] upgrades the schema from version i to version
+# i+1, so a database file with user_version=n is brought up to date by applying MIGRATIONS[n:] in order. Released steps
+# must never be changed, because they describe how old files looked. Schema changes are made by appending a new step.
+MIGRATIONS = [
+    _create_tables,
+    _create_indexes,
+    _integer_timestamps,
+    _task_totals,
+    _balance_checkpoints,
+    _rollups,
+    _track_entries_begin_index,
+    _task_type_indexes,
+    _unique_user_names,
+    _track_entry_length_index,
+    _archive_locations,
+    _drop_overlapping_task_indexes,
+    _open_tasks_index,
+    _deleted_track_entries_index
+]
+
+# The schema version that is reached after applying all migration steps.
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(connection):
+    """
+    Returns the schema version of the given database.
+    :param connection: The database connection.
+    :return: The schema version.
+    """
+    c = connection.cursor()
+    c.execute("PRAGMA user_version;")
+    return c.fetchone()[0]
+
+
+def _check_version(version, target_version):
+    """
+    Raises a RuntimeError if the given schema version is newer than the target version.
+    :param version: The schema version of the database.
+    :param target_version: The target schema version.
+    """
+    if version > target_version:
+        raise RuntimeError("The database schema version %d is newer than the supported version %d." %
+                           (version, target_version))
+
+
+def migrate(connection, target_version=SCHEMA_VERSION):
+    """
+    Bring the database schema up to the target version. If the database is already up to date, this only reads the
+    schema version. Otherwise, all missing migration steps are applied in a single transaction, so a failing step leaves
+    the database untouched.
+    Raises a RuntimeError if the database was written by a newer schema version.
+    :param connection: The database connection.
+    :param target_version: The schema version that should be reached.
+    """
+    assert 0 <= target_version <= SCHEMA_VERSION
+    version = get_schema_version(connection)
+    if version == target_version:
+        return
+    _check_version(version, target_version)
+
+    c = connection.cursor()
+    c.execute("BEGIN IMMEDIATE;")
+    try:
+        # Another process might have migrated the database while we waited for the lock.
+        version = get_schema_version(connection)
+        _check_version(version, target_version)
+        for step in MIGRATIONS[version:target_version]:
+            logging.info("Migrating the database schema to version %d." % (version+1))
+            step(connection)
+            version += 1
+        c.execute("PRAGMA user_version = %d;" % version)
+        connection.commit()
+    except:
+        connection.rollback()
+        raise
@@ -1,48 +1,242 @@
+import datetime
+import operator
 from collections import OrderedDict
 
 
+# Timestamps are stored as integer microseconds since 1970-01-01 00:00 in local wall-clock time, which is the naive time
+# that datetime.datetime.now() returns. Every day has the same length, so day boundaries are multiples of
+# MICROSECONDS_PER_DAY and durations and date ranges can be computed with integer arithmetic inside SQLite.
+# The day index of a timestamp is timestamp // MICROSECONDS_PER_DAY, the number of days since EPOCH_DATE.
+EPOCH = datetime.datetime(1970, 1, 1)
+EPOCH_DATE = EPOCH.date()
+MICROSECONDS_PER_SECOND = 1000000
+MICROSECONDS_PER_DAY = 86400 * MICROSECONDS_PER_SECOND
+
+# The maximum number of bound parameters per statement in old SQLite versions.
+MAX_VARIABLES = 999
+
+
+def timedelta_to_sql(delta):
+    """
+    Convert the given timedelta to the integer microseconds that are stored in the database.
+    :param delta: The timedelta.
+    :return: The microseconds.
+    """
+    return (delta.days * 86400 + delta.seconds) * MICROSECONDS_PER_SECOND + delta.microseconds
+
+
+def timestamp_to_sql(timestamp):
+    """
+    Convert the given datetime to the integer that is stored in the database.
+    :param timestamp: The datetime or None.
+    :return: Microseconds since EPOCH or None.
+    """
+    if timestamp is None:
+        return None
+    return timedelta_to_sql(timestamp - EPOCH)
+
+
+def timestamp_from_sql(value):
+    """
+    Convert the given integer from the database to a datetime.
+    :param value: Microseconds since EPOCH or None.
+    :return: The datetime or None.
+    """
+    if value is None:
+        return None
+    return EPOCH + datetime.timedelta(0, 0, value)
+
+
+def weekday(day):
+    """
+    Returns the week day of the given day index, with Monday as 0. 1970-01-01 was a Thursday. Works on numpy arrays of
+    day indexes, too.
+    :param day: The day index.
+    :return: The week day.
+    """
+    return (day + 3) % 7
+
+
+def _cached_statement(database_object_class, key, build):
+    """
+    Returns the statement with the given key from the statement cache of the database object class. If the statement is
+    not cached yet, it is created with build() and stored in the cache.
+    :param database_object_class: The database object class.
+    :param key: The cache key.
+    :param build: Function that returns the statement.
+    :return: The statement.
+    """
+    statements = database_object_class._statements
+    try:
+        return statements[key]
+    except KeyError:
+        statement = build()
+        statements[key] = statement
+        return statement
+
+
+def create_table_statement(database_object_class, table_name, if_not_exists=False, schema_name=None):
+    """
+    Returns the CREATE TABLE statement for the given database object class.
+    :param database_object_class: The database object class.
+    :param table_name: The table name.
+    :param if_not_exists: Whether the IF NOT EXISTS clause should be added.
+    :param schema_name: The schema of the table, for example of an attached database, or None for the main database.
+    :return: The statement.
+    """
+    def build():
+        if_not_exists_str = " IF NOT EXISTS" if if_not_exists else ""
+        schema_str = "" if schema_name is None else "`%s`." % schema_name
+        column_list = ["`%s` %s" % (name, sql_type) for name, sql_type in database_object_class._field_types.items()]
+        columns = ", ".join(column_list)
+        return "CREATE TABLE%s %s`%s` (%s);" % (if_not_exists_str, schema_str, table_name, columns)
+    return _cached_statement(database_object_class, ("create", table_name, if_not_exists, schema_name), build)
+
+
+def insert_statement(database_object_class, table_name):
+    """
+    Returns the INSERT statement that inserts all columns of the given database object class.
+    :param database_object_class: The database object class.
+    :param table_name: The table name.
+    :return: The statement.
+    """
+    def build():
+        sql_placeholder = ", ".join("?" for _ in database_object_class._field_names)
+        return "INSERT INTO `%s` VALUES (%s);" % (table_name, sql_placeholder)
+    return _cached_statement(database_object_class, ("insert", table_name), build)
+
+
+def update_statement(database_object_class, table_name, column_names):
+    """
+    Returns the UPDATE statement that overwrites the given columns of the row with a given uid.
+    :param database_object_class: The database object class.
+    :param table_name: The table name.
+    :param column_names: Tuple with the column names.
+    :return: The statement.
+    """
+    def build():
+        set_str = ", ".join("`%s`=?" % column_name for column_name in column_names)
+        return "UPDATE `%s` SET %s WHERE `uid`=?;" % (table_name, set_str)
+    return _cached_statement(database_object_class, ("update", table_name, column_names), build)
+
+
+def select_statement(database_object_class, table_name):
+    """
+    Returns the SELECT statement that selects the row with a given uid.
+    :param database_object_class: The database object class.
+    :param table_name: The table name.
+    :return: The statement.
+    """
+    def build():
+        columns = ", ".join("`%s`" % name for name in database_object_class._field_names)
+        return "SELECT %s FROM `%s` WHERE `uid`=?;" % (columns, table_name)
+    return _cached_statement(database_object_class, ("select", table_name), build)
+
+
 def create_table(connection, table_name, database_object_class, if_not_exists=False):
     """
     Create the database table for the given database object class.
+    The statement is not committed, so it becomes part of the transaction that is currently open on the connection.
     :param connection: The database connection.
     :param table_name: The table name.
     :param database_object_class: The database object class.
     :param if_not_exists: Whether the IF NOT EXISTS clause should be added.
     """
     assert issubclass(database_object_class, DatabaseObject)
-    if_not_exists_str = " IF NOT EXISTS" if if_not_exists else ""
-    field_types = database_object_class._field_types
-    column_list = ["`%s` %s" % (name, sql_type) for name, sql_type in field_types.items()]
-    columns = ", ".join(column_list)
-    query = "CREATE TABLE%s `%s` (%s);" % (if_not_exists_str, table_name, columns)
+    query = create_table_statement(database_object_class, table_name, if_not_exists)
     c = connection.cursor()
     c.execute(query)
-    connection.commit()
 
 
 def insert_object(connection, table_name, database_object):
     """
     Insert the given database object into the database. Sets database_object.uid.
+    The insert is not committed, so it becomes part of the transaction that is currently open on the connection.
     :param connection: The database connection.
     :param table_name: The table name.
     :param database_object: The database object.
     """
     assert isinstance(database_object, DatabaseObject)
     database_object.uid = None
-    values = database_object.field_values()
-    sql_placeholder = ", ".join("?" for _ in values)
-    query = "INSERT INTO `%s` VALUES (%s);" % (table_name, sql_placeholder)
+    query = insert_statement(database_object.__class__, table_name)
     c = connection.cursor()
-    c.execute(query, values)
-    connection.commit()
+    c.execute(query, database_object.sql_values())
     database_object.uid = c.lastrowid
+    database_object.mark_clean()
+
+
+def insert_objects(connection, table_name, database_objects):
+    """
+    Insert the given database objects into the database with a single executemany() and set their uids.
+    This must be called inside a transaction that holds the write lock, so no other connection can insert rows in
+    between and the uids of the inserted rows are consecutive.
+    :param connection: The database connection.
+    :param table_name: The table name.
+    :param database_objects: Iterable with database objects of the same class.
+    :return: List with the inserted database objects.
+    """
+    assert connection.in_transaction
+    database_objects = list(database_objects)
+    if len(database_objects) == 0:
+        return database_objects
+    database_object_class = database_objects[0].__class__
+    for database_object in database_objects:
+        assert isinstance(database_object, database_object_class)
+        database_object.uid = None
+
+    # Insert all rows and compute the uids from the rowid of the last inserted row.
+    query = insert_statement(database_object_class, table_name)
+    c = connection.cursor()
+    c.executemany(query, (database_object.sql_values() for database_object in database_objects))
+    c.execute("SELECT last_insert_rowid();")
+    first_uid = c.fetchone()[0] - len(database_objects) + 1
+    for i, database_object in enumerate(database_objects):
+        database_object.uid = first_uid + i
+        database_object.mark_clean()
+    return database_objects
+
+
+def _update_items(database_object, ignore_none):
+    """
+    Returns the column names and values that are written when the given database object is updated. If the object was
+    loaded from or written to the database, these are the modified fields. Otherwise, all fields except the uid are
+    written (only the not-None fields if ignore_none is True).
+    :param database_object: The database object.
+    :param ignore_none: Whether None values should be ignored.
+    :return: Tuple with the column names and list with the values.
+    """
+    set_items = []
+    set_values = []
+    clean_row = database_object._clean_row
+    for i, (column_name, value) in enumerate(database_object.sql_items()):
+        if clean_row is None:
+            write = column_name != "uid" and not (ignore_none and value is None)
+        else:
+            write = column_name != "uid" and value != clean_row[i]
+        if write:
+            set_items.append(column_name)
+            set_values.append(value)
+    return tuple(set_items), set_values
+
+
+def update_columns(database_object, ignore_none=False):
+    """
+    Returns the names of the columns that update_object() and update_objects() write for the given database object.
+    :param database_object: The database object.
+    :param ignore_none: Whether None values should be ignored.
+    :return: Tuple with the column names.
+    """
+    return _update_items(database_object, ignore_none)[0]
 
 
 def update_object(connection, table_name, database_object, ignore_none=False):
     """
     Get the database row with uid=database_object.uid and overwrite all row entries with the ones from database_object.
-    If ignore_none is True, only the not-None fields of database_object are used.
+    If database_object was loaded from or written to the database, only the modified fields are written (None values
+    included) and nothing is done if no field was modified. Otherwise, if ignore_none is True, only the not-None fields
+    of database_object are used.
     Raises a KeyError() if no row with the given uid exists.
+    The update is not committed, so it becomes part of the transaction that is currently open on the connection.
     :param connection: The database connection.
     :param table_name: The table name.
     :param database_object: The database object.
@@ -52,32 +246,117 @@ def update_object(connection, table_name, database_object, ignore_none=False):
     assert isinstance(database_object.uid, int)
 
     # Build the list with the values that should be set.
-    set_items = []
-    set_values = []
-    for column_name, value in database_object.field_items():
-        ignore = ignore_none and value is None
-        if column_name != "uid" and not ignore:
-            set_items.append("`%s`=?" % column_name)
-            set_values.append(value)
+    column_names, set_values = _update_items(database_object, ignore_none)
 
     # Perform the actual update.
-    if len(set_items) > 0:
-        set_str = ", ".join(set_items)
-        query = "UPDATE `%s` SET %s WHERE `uid`=?;" % (table_name, set_str)
+    if len(column_names) > 0:
+        query = update_statement(database_object.__class__, table_name, column_names)
         values = tuple(set_values) + (database_object.uid,)
         c = connection.cursor()
         c.execute(query, values)
-        connection.commit()
+        database_object.mark_clean()
+
+
+def select_object(connection, table_name, database_object_class, uid):
+    """
+    Returns the database object with the given uid. Raises a KeyError if no row with the given uid exists.
+    :param connection: The database connection.
+    :param table_name: The table name.
+    :param database_object_class: The database object class.
+    :param uid: The uid.
+    :return: The database object.
+    """
+    c = connection.cursor()
+    c.execute(select_statement(database_object_class, table_name), (uid,))
+    row = c.fetchone()
+    if row is None:
+        raise KeyError("No row found in %s with uid=%s." % (table_name, uid))
+    return database_object_class.from_row(row)
+
+
+def fetch_chunks(cursor, chunk_size):
+    """
+    Yields the rows of an executed query in lists of at most chunk_size rows, so only one chunk is kept in memory and
+    the first rows are available as soon as the first chunk is read.
+    :param cursor: The cursor with the executed query.
+    :param chunk_size: The number of rows per fetchmany() call.
+    :return: Generator with lists of rows.
+    """
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if len(rows) == 0:
+            break
+        yield rows
 
 
-class DatabaseObject(object):
+def update_objects(connection, table_name, database_objects, ignore_none=False):
+    """
+    Update the database rows of all given database objects like update_object(). Objects that write the same columns
+    are updated with a single executemany(). Objects without modified fields are skipped.
+    The updates are not committed, so they become part of the transaction that is currently open on the connection.
+    :param connection: The database connection.
+    :param table_name: The table name.
+    :param database_objects: Iterable with database objects.
+    :param ignore_none: Whether None values should be ignored.
+    """
+    # Group the update values by the set of written columns.
+    groups = OrderedDict()
+    updated_objects = []
+    for database_object in database_objects:
+        assert isinstance(database_object, DatabaseObject)
+        assert isinstance(database_object.uid, int)
+        column_names, set_values = _update_items(database_object, ignore_none)
+        if len(column_names) > 0:
+            query = update_statement(database_object.__class__, table_name, column_names)
+            groups.setdefault(query, []).append(tuple(set_values) + (database_object.uid,))
+            updated_objects.append(database_object)
+
+    # Perform the actual updates.
+    c = connection.cursor()
+    for query, rows in groups.items():
+        c.executemany(query, rows)
+    for database_object in updated_objects:
+        database_object.mark_clean()
+
+
+class DatabaseObjectMeta(type):
+    """
+    Metaclass of the database objects. It turns the column names from _field_types into __slots__, so each object
+    stores its values in a compact fixed-size layout and attribute access needs no python-level lookup. The additional
+    slot _clean_row holds the database row of the last load or write, which is used to find the modified fields, and the
+    slot __weakref__ allows weak references, which are used by the identity map. It also
+    precomputes the per-class helpers that are used to convert the objects from and to database rows and creates the
+    per-class statement cache.
+    """
+
+    def __new__(mcs, name, bases, namespace):
+        field_types = namespace.get("_field_types")
+        if field_types is None:
+            namespace.setdefault("__slots__", ())
+        else:
+            field_names = tuple(field_types)
+            timestamp_fields = namespace.get("_timestamp_fields", ())
+            namespace["__slots__"] = field_names + ("_clean_row", "__weakref__")
+            namespace["_field_names"] = field_names
+            namespace["_timestamp_indices"] = tuple(i for i, field_name in enumerate(field_names)
+                                                    if field_name in timestamp_fields)
+            namespace["_statements"] = {}
+        cls = super().__new__(mcs, name, bases, namespace)
+        if field_types is not None:
+            # attrgetter returns a tuple if it gets more than one name.
+            getter = operator.attrgetter(*field_names)
+            cls._field_getter = staticmethod(getter if len(field_names) > 1 else lambda obj: (getter(obj),))
+        return cls
+
+
+class DatabaseObject(object, metaclass=DatabaseObjectMeta):
     """
     Base class for all database objects.
     """
 
     """
     _field_types is an ordered dict with the column names and types of the database object. Key is the column name,
-    value is the sql type. It must be overwritten in the subclass.
+    value is the sql type. It must be overwritten in the subclass. The column names become the __slots__ of the class.
     Example:
     _field_types = OrderedDict([
         ("uid", "INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT"),
@@ -86,51 +365,95 @@ class DatabaseObject(object):
     """
     _field_types = None
 
+    """
+    _timestamp_fields is a tuple with the names of the columns that hold timestamps. The values of these columns are
+    datetime objects in python and integers (see timestamp_to_sql()) in the database.
+    """
+    _timestamp_fields = ()
+
+    # The following class attributes are set by DatabaseObjectMeta.
+    _field_names = ()
+    _timestamp_indices = ()
+    _field_getter = None
+    _statements = None
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Create a database object from the given database row.
+        :param row: The row with the column values in the order of _field_types.
+        :return: The database object.
+        """
+        values = row
+        if len(cls._timestamp_indices) > 0:
+            values = list(row)
+            for i in cls._timestamp_indices:
+                value = values[i]
+                if value is not None:
+                    values[i] = EPOCH + datetime.timedelta(0, 0, value)
+        database_object = cls(*values)
+        database_object._clean_row = tuple(row)
+        return database_object
+
     def __init__(self):
         """
-        Initialize the all fields with None.
+        Make sure that the database object has columns. The subclass initializes all fields.
         """
         if self._field_types is None:
             raise RuntimeError("Tried to initialize DatabaseObject without columns.")
-        self._field_values = OrderedDict()
-        for name in self._field_types:
-            self._field_values[name] = None
+        self._clean_row = None
+
+    def dirty_fields(self):
+        """
+        Returns the names of the fields that were modified since the object was loaded from or written to the database.
+        Returns None if the object was neither loaded nor written.
+        :return: Tuple with the modified field names or None.
+        """
+        if self._clean_row is None:
+            return None
+        return tuple(name for name, value, clean_value in zip(self._field_names, self.sql_values(), self._clean_row)
+                     if value != clean_value)
+
+    def mark_clean(self):
+        """
+        Mark all fields as unmodified, so the current values are considered to be the ones in the database.
+        """
+        self._clean_row = self.sql_values()
 
     def field_items(self):
         """
-        Returns the column name and value of the database object as odict_items.
+        Returns the column name and value of the database object.
         The return value can be used similar to d.items(), where d is a dict.
         :return: Column name and according value.
         """
-        return self._field_values.items()
+        return list(zip(self._field_names, self._field_getter(self)))
 
     def field_values(self):
         """
         Returns the field values of the database object as a tuple.
         :return: The field values.
         """
-        return tuple(self._field_values.values())
+        return self._field_getter(self)
 
-    def __getattr__(self, name):
+    def sql_items(self):
         """
-        Return the value of the column with the given name.
-        :param name: The column name.
-        :return: The column value.
+        Returns the column names and the values as they are stored in the database.
+        :return: List with (column name, database value) tuples.
         """
-        return self._field_values[name]
+        return list(zip(self._field_names, self.sql_values()))
 
-    def __setattr__(self, key, value):
+    def sql_values(self):
         """
-        Set the value of the column with the given name.
-        :param key: Column name.
-        :param value: Column value.
+        Returns the field values as they are stored in the database as a tuple.
+        :return: The database values.
         """
-        if key == "_field_values":
-            super().__setattr__(key, value)
-        elif key in self._field_values:
-            self._field_values[key] = value
-        else:
-            raise KeyError()
+        values = self._field_getter(self)
+        if len(self._timestamp_indices) > 0:
+            values = list(values)
+            for i in self._timestamp_indices:
+                values[i] = timestamp_to_sql(values[i])
+            values = tuple(values)
+        return values
 
     def __eq__(self, other):
         """
@@ -176,11 +499,13 @@ class Setting(DatabaseObject):
     _field_types = OrderedDict([
         ("uid", "INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT"),
         ("user_uid", "INTEGER NOT NULL"),
-        ("timestamp_create", "TEXT NOT NULL"),
+        ("timestamp_create", "INTEGER NOT NULL"),
         ("key", "TEXT NOT NULL"),
         ("value", "TEXT NOT NULL")
     ])
 
+    _timestamp_fields = ("timestamp_create",)
+
     def __init__(self, uid=None, user_uid=None, timestamp_create=None, key=None, value=None):
         """
         Initialize the settings object.
@@ -209,11 +534,13 @@ class Task(DatabaseObject):
         ("title", "TEXT"),
         ("description", "TEXT"),
         ("done", "BOOLEAN NOT NULL"),
-        ("timestamp_orderby", "TEXT NOT NULL"),
+        ("timestamp_orderby", "INTEGER NOT NULL"),
         ("type_id", "INTEGER NOT NULL"),
         ("deleted", "BOOLEAN NOT NULL")
     ])
 
+    _timestamp_fields = ("timestamp_orderby",)
+
     def __init__(self, uid=None, user_uid=None, title=None, description=None, done=False, timestamp_orderby=None,
                  type_id=None, deleted=False):
         """
@@ -246,11 +573,13 @@ class TrackEntry(DatabaseObject):
     _field_types = OrderedDict([
         ("uid", "INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT"),
         ("task_uid", "INTEGER NOT NULL"),
-        ("timestamp_begin", "TEXT NOT NULL"),
-        ("timestamp_end", "TEXT"),
+        ("timestamp_begin", "INTEGER NOT NULL"),
+        ("timestamp_end", "INTEGER"),
         ("deleted", "BOOLEAN NOT NULL")
     ])
 
+    _timestamp_fields = ("timestamp_begin", "timestamp_end")
+
     def __init__(self, uid=None, task_uid=None, timestamp_begin=None, timestamp_end=None, deleted=False):
         """
         Initialize the track entry object.
@@ -0,0 +1,131 @@
+import threading
+import weakref
+
+
+class IdentityMap(object):
+    """
+    The IdentityMap keeps at most one database object per (table name, uid), so repeated reads of a row return the same
+    object. The objects are referenced weakly: an object is dropped from the map as soon as the caller does not use it
+    anymore, so the map never grows beyond the objects that are alive anyway.
+
+    Every read still fetches the row, so the objects cannot drift apart from the database. If the row equals the row of
+    the last load or write of the cached object, the object is returned as it is (a hit). Otherwise, the fields that
+    were not modified in memory are refreshed from the row, so local modifications that are not written yet are kept.
+    """
+
+    def __init__(self):
+        """
+        Create an empty identity map.
+        """
+        self._objects = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        """
+        Returns the number of cached objects.
+        :return: The number of cached objects.
+        """
+        return len(self._objects)
+
+    def clear(self):
+        """
+        Removes all objects from the map and resets the counters.
+        """
+        with self._lock:
+            self._objects.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def load(self, table_name, database_object_class, row):
+        """
+        Returns the object for the given row: the cached object if there is one, otherwise a new object.
+        :param table_name: The table name.
+        :param database_object_class: The database object class.
+        :param row: The database row. The first column is the uid.
+        :return: The database object.
+        """
+        key = (table_name, row[0])
+        with self._lock:
+            database_object = self._objects.get(key)
+            if database_object is None:
+                self.misses += 1
+                database_object = database_object_class.from_row(row)
+                self._objects[key] = database_object
+                return database_object
+            self.hits += 1
+        row = tuple(row)
+        if database_object._clean_row != row:
+            self._refresh(database_object, row)
+        return database_object
+
+    def add(self, table_name, database_object):
+        """
+        Adds an inserted object to the map.
+        :param table_name: The table name.
+        :param database_object: The database object with its uid.
+        """
+        with self._lock:
+            self._objects[(table_name, database_object.uid)] = database_object
+
+    def discard(self, table_name, database_object):
+        """
+        Removes the given object from the map, for example after its insert was rolled back. Nothing is done if another
+        object is cached for its uid.
+        :param table_name: The table name.
+        :param database_object: The database object.
+        """
+        key = (table_name, database_object.uid)
+        with self._lock:
+            if self._objects.get(key) is database_object:
+                del self._objects[key]
+
+    def written(self, table_name, database_object, field_names):
+        """
+        Copies the written fields of the given object to the cached object with the same uid, if that is another object.
+        :param table_name: The table name.
+        :param database_object: The database object that was written.
+        :param field_names: The names of the written fields.
+        :return: Tuple (cached object, clean row before the write) if a cached object was changed, otherwise None.
+        """
+        with self._lock:
+            cached = self._objects.get((table_name, database_object.uid))
+        if cached is None or cached is database_object or cached._clean_row is None:
+            return None
+        old_clean_row = cached._clean_row
+        current = cached.sql_values()
+        clean_row = list(cached._clean_row)
+        sql_values = database_object.sql_values()
+        for i, name in enumerate(database_object._field_names):
+            if name in field_names:
+                # Fields that were modified in memory keep their value, so they are still written by the next update.
+                if current[i] == clean_row[i]:
+                    setattr(cached, name, getattr(database_object, name))
+                clean_row[i] = sql_values[i]
+        cached._clean_row = tuple(clean_row)
+        return cached, old_clean_row
+
+    def restore(self, database_object, row):
+        """
+        Sets the fields of the cached object that were not modified in memory back to the given row, which is the clean
+        row from before a write that was rolled back.
+        :param database_object: The cached database object.
+        :param row: The database row.
+        """
+        self._refresh(database_object, row)
+
+    @staticmethod
+    def _refresh(database_object, row):
+        """
+        Sets the fields of the object that were not modified in memory to the values of the given row.
+        :param database_object: The database object.
+        :param row: The database row.
+        """
+        current = database_object.sql_values()
+        clean_row = database_object._clean_row
+        loaded = database_object.from_row(row)
+        for i, name in enumerate(database_object._field_names):
+            if clean_row is None or current[i] == clean_row[i]:
+                setattr(database_object, name, getattr(loaded, name))
+        database_object._clean_row = row
@@ -0,0 +1,182 @@
+import datetime
+from collections import namedtuple
+
+from .database_connector import DatabaseConnector
+from .database_types import EPOCH_DATE, MICROSECONDS_PER_DAY, timestamp_to_sql
+from .rollups import DAY, WEEK, MONTH, ROLLUP_TABLES, PERIOD_EXPRESSIONS, period_start, next_period_start
+
+
+# The report groupings.
+TASK = "task"
+TYPE = "type"
+
+# SQL column lists for the groupings.
+_GROUP_COLUMNS = {
+    TASK: "`task_uid`, `type_id`",
+    TYPE: "NULL, `type_id`",
+    None: "NULL, NULL"
+}
+
+# ReportRow is a row of a report. period is the first day of the period (datetime.date), task_uid and type_id are the
+# task and type of the row (None if the report is not grouped by them), and duration is the tracked time as timedelta.
+ReportRow = namedtuple("ReportRow", ["period", "task_uid", "type_id", "duration"])
+
+
+def _report_query(period, group_by, open_only=False, tables=("Tasks", "TrackEntries")):
+    """
+    Returns the report query over the track entries. Track entries are clipped to the report range, open entries count
+    until now, and entries that cross midnight are split into one segment per day with a recursive CTE, so every
+    segment is counted in the period of its day.
+
+    The closed and the open entries are selected separately, so both index searches are bounded: a closed entry that
+    overlaps the range begins at most :max_length before the range, and the open entries are read from the partial index
+    TrackEntries_open.
+    :param period: The report period.
+    :param group_by: The report grouping.
+    :param open_only: Whether only open track entries are counted.
+    :param tables: The names of the tables or views with the tasks and the track entries.
+    :return: The query.
+    """
+    select = ("SELECT `TrackEntries`.`task_uid`, `Tasks`.`type_id`, MAX(`TrackEntries`.`timestamp_begin`, :begin), %s "
+              "FROM `%s` AS `Tasks` JOIN `%s` AS `TrackEntries` ON `TrackEntries`.`task_uid`=`Tasks`.`uid` "
+              "WHERE `Tasks`.`user_uid`=:user_uid AND `TrackEntries`.`deleted`=0 "
+              "AND `TrackEntries`.`timestamp_begin`<:end AND %s")
+    open_entries = select % ("MIN(:now, :end)", tables[0], tables[1],
+                             "`TrackEntries`.`timestamp_end` IS NULL AND :now>:begin")
+    if open_only:
+        entries = open_entries
+    else:
+        closed_entries = select % ("MIN(`TrackEntries`.`timestamp_end`, :end)", tables[0], tables[1],
+                                   "`TrackEntries`.`timestamp_end` IS NOT NULL "
+                                   "AND `TrackEntries`.`timestamp_begin`>=:begin - :max_length "
+                                   "AND `TrackEntries`.`timestamp_end`>:begin")
+        entries = closed_entries + " UNION ALL " + open_entries
+    return ("WITH RECURSIVE "
+            "`entries`(`task_uid`, `type_id`, `begin`, `end`) AS (%s), "
+            "`segments`(`task_uid`, `type_id`, `day`, `begin`, `end`) AS ("
+            "SELECT `task_uid`, `type_id`, `begin` / :day_length, `begin`, `end` FROM `entries` WHERE `begin`<`end` "
+            "UNION ALL "
+            "SELECT `task_uid`, `type_id`, `day` + 1, (`day` + 1) * :day_length, `end` FROM `segments` "
+            "WHERE (`day` + 1) * :day_length < `end`) "
+            "SELECT %s AS `period`, %s, SUM(MIN(`end`, (`day` + 1) * :day_length) - `begin`) "
+            "FROM `segments` GROUP BY 1, 2, 3 ORDER BY 1, 2, 3;" %
+            (entries, PERIOD_EXPRESSIONS[period], _GROUP_COLUMNS[group_by]))
+
+
+def _rollup_query(table_name, period, group_by):
+    """
+    Returns the report query over the given rollup table for the day range [:first_day, :last_day).
+    :param table_name: The rollup table.
+    :param period: The report period.
+    :param group_by: The report grouping.
+    :return: The query.
+    """
+    return ("SELECT %s AS `period`, %s, SUM(`duration`) FROM `%s` "
+            "WHERE `user_uid`=:user_uid AND `day`>=:first_day AND `day`<:last_day GROUP BY 1, 2, 3;" %
+            (PERIOD_EXPRESSIONS[period], _GROUP_COLUMNS[group_by], table_name))
+
+
+def _rollup_ranges(first_day, last_day, period):
+    """
+    Splits the day range [first_day, last_day) into the full periods in the middle, which are read from the rollup table
+    of the period, and the remaining days at both ends, which are read from the day rollups.
+    :param first_day: The first day index.
+    :param last_day: The day index after the last day.
+    :param period: The report period.
+    :return: List [(rollup period, first_day, last_day)].
+    """
+    start = period_start(first_day, period)
+    if start < first_day:
+        start = next_period_start(first_day, period)
+    stop = period_start(last_day, period)
+    if period == DAY or start >= stop:
+        return [(DAY, first_day, last_day)]
+    return [(DAY, first_day, start), (period, start, stop), (DAY, stop, last_day)]
+
+
+def summarize(database, user_uid, begin, end, period=DAY, group_by=TASK, now=None):
+    """
+    Compute the tracked time of the given user per period in the range [begin, end). The grouping runs inside SQLite,
+    so the track entries are never loaded into python. The closed track entries of the full days in the range are read
+    from the rollup tables, only the partial days at both ends of the range and the open track entries are summarized
+    from the raw track entries. If an archive database is attached, the partial days include the archived entries.
+    Otherwise, a RuntimeError is raised if a partial day lies before the cutoff of the archive.
+    :param database: The DatabaseConnector.
+    :param user_uid: The user uid.
+    :param begin: Begin of the report range (datetime).
+    :param end: End of the report range (datetime).
+    :param period: The period: DAY, WEEK, or MONTH. Weeks start on Monday.
+    :param group_by: The grouping inside each period: TASK, TYPE, or None for one row per period.
+    :param now: The time until which open track entries count. Defaults to the current timestamp.
+    :return: List with ReportRows ordered by period, task uid, and type id.
+    """
+    assert isinstance(database, DatabaseConnector)
+    assert isinstance(user_uid, int)
+    if period not in PERIOD_EXPRESSIONS:
+        raise ValueError("Invalid report period: %s" % period)
+    if group_by not in _GROUP_COLUMNS:
+        raise ValueError("Invalid report grouping: %s" % group_by)
+    if now is None:
+        now = database.get_current_timestamp()
+
+    begin = timestamp_to_sql(begin)
+    end = timestamp_to_sql(end)
+    now = timestamp_to_sql(now)
+    tables = database.history_tables
+    first_day = -(-begin // MICROSECONDS_PER_DAY)
+    last_day = end // MICROSECONDS_PER_DAY
+
+    # Each query returns rows (period, task_uid, type_id, duration) that are summed up afterwards. The range of a query
+    # is given in microseconds for the track entry queries and in day indices for the rollup queries.
+    queries = []
+    entry_query = _report_query(period, group_by, tables=tables)
+    if first_day >= last_day:
+        queries.append((entry_query, begin, end))
+    else:
+        queries.append((entry_query, begin, first_day * MICROSECONDS_PER_DAY))
+        queries.append((_report_query(period, group_by, open_only=True), first_day * MICROSECONDS_PER_DAY,
+                        last_day * MICROSECONDS_PER_DAY))
+        queries.append((entry_query, last_day * MICROSECONDS_PER_DAY, end))
+        for rollup_period, range_first, range_last in _rollup_ranges(first_day, last_day, period):
+            if range_first < range_last:
+                queries.append((_rollup_query(ROLLUP_TABLES[rollup_period], period, group_by), range_first, range_last))
+
+    # The queries run on one snapshot, so writes of other threads cannot be counted twice or not at all.
+    durations = {}
+    with database.reading() as connection:
+        if not database.archive_attached:
+            # The rollups still count the archived track entries, but the partial days need the raw entries.
+            cutoff = database.get_archive_cutoff()
+            if cutoff is not None and any(query == entry_query and range_begin < min(range_end, cutoff)
+                                          for query, range_begin, range_end in queries):
+                raise RuntimeError("The report range reaches into the archived track entries. Attach the archive "
+                                   "database first.")
+        max_length = database.get_max_track_entry_length()
+        c = connection.cursor()
+        for query, range_begin, range_end in queries:
+            if range_begin >= range_end:
+                continue
+            c.execute(query, {
+                "user_uid": user_uid,
+                "begin": range_begin,
+                "end": range_end,
+                "first_day": range_begin,
+                "last_day": range_end,
+                "now": now,
+                "max_length": max_length,
+                "day_length": MICROSECONDS_PER_DAY
+            })
+            for day, task_uid, type_id, duration in c.fetchall():
+                key = (day, task_uid, type_id)
+                durations[key] = durations.get(key, 0) + duration
+    return [ReportRow(EPOCH_DATE + datetime.timedelta(days=key[0]), key[1], key[2], datetime.timedelta(0, 0, duration))
+            for key, duration in sorted(durations.items(), key=_row_order)]
+
+
+def _row_order(item):
+    """
+    Sort key of the report rows: period, task uid, and type id, where None comes first like in SQLite.
+    :param item: The item ((period, task_uid, type_id), duration).
+    :return: The sort key.
+    """
+    return tuple((value is not None, value or 0) for value in item[0])
@@ -0,0 +1,209 @@
+import argparse
+import datetime
+import sqlite3
+
+from .database_types import EPOCH_DATE, MAX_VARIABLES, MICROSECONDS_PER_DAY, weekday
+
+
+# The rollup periods.
+DAY = "day"
+WEEK = "week"
+MONTH = "month"
+
+# The rollup table of each period. All tables have the columns `user_uid`, `day`, `task_uid`, `type_id`, and `duration`,
+# where `day` is the day index (days since 1970-01-01) of the first day of the period and `duration` is the tracked time
+# in microseconds. Only closed and not deleted track entries are counted, entries that cross midnight are split.
+ROLLUP_TABLES = {
+    DAY: "RollupsDay",
+    WEEK: "RollupsWeek",
+    MONTH: "RollupsMonth"
+}
+
+# SQL expressions that map the day index `day` to the day index of the first day of the period. Weeks start on Monday,
+# the week expression subtracts weekday(`day`).
+PERIOD_EXPRESSIONS = {
+    DAY: "`day`",
+    WEEK: "`day` - ((`day` + 3) % 7)",
+    MONTH: "CAST(julianday(`day` * 86400, 'unixepoch', 'start of month') - 2440587.5 AS INTEGER)"
+}
+
+# Whether SQLite supports upserts (3.24), so a rollup row is inserted or updated with a single statement.
+_UPSERT = sqlite3.sqlite_version_info >= (3, 24, 0)
+
+
+def period_start(day, period):
+    """
+    Returns the day index of the first day of the period that contains the given day.
+    :param day: The day index.
+    :param period: The period: DAY, WEEK, or MONTH.
+    :return: The day index.
+    """
+    if period == DAY:
+        return day
+    if period == WEEK:
+        return day - weekday(day)
+    if period == MONTH:
+        date = EPOCH_DATE + datetime.timedelta(days=day)
+        return day - date.day + 1
+    raise ValueError("Invalid rollup period: %s" % period)
+
+
+def next_period_start(day, period):
+    """
+    Returns the day index of the first day of the period after the one that contains the given day.
+    :param day: The day index.
+    :param period: The period: DAY, WEEK, or MONTH.
+    :return: The day index.
+    """
+    if period == DAY:
+        return day + 1
+    if period == WEEK:
+        return period_start(day, WEEK) + 7
+    if period == MONTH:
+        # Every month has at least 28 and at most 31 days, so this always lands in the next month.
+        return period_start(period_start(day, MONTH) + 31, MONTH)
+    raise ValueError("Invalid rollup period: %s" % period)
+
+
+def _segments(begin, end):
+    """
+    Splits the time range [begin, end) at midnight.
+    :param begin: The begin in microseconds since the epoch.
+    :param end: The end in microseconds since the epoch.
+    :return: List [(day, microseconds)].
+    """
+    segments = []
+    day = begin // MICROSECONDS_PER_DAY
+    while begin < end:
+        day_end = min((day + 1) * MICROSECONDS_PER_DAY, end)
+        segments.append((day, day_end - begin))
+        begin = day_end
+        day += 1
+    return segments
+
+
+def add_track_entries(connection, entries, sign=1):
+    """
+    Adds the time of the given closed track entries to the rollup tables. With sign=-1, the time is subtracted again,
+    which is used before the track entries are modified. The time is summed up per rollup row first, so every rollup
+    row is written once, no matter how many track entries it contains. Rollup rows that drop to zero are deleted.
+    :param connection: The database connection.
+    :param entries: Iterable with tuples (task_uid, timestamp_begin, timestamp_end), where the timestamps are given in
+    microseconds since the epoch.
+    :param sign: 1 to add the time, -1 to subtract it.
+    """
+    durations = {}
+    for task_uid, timestamp_begin, timestamp_end in entries:
+        day = timestamp_begin // MICROSECONDS_PER_DAY
+        if timestamp_end <= (day + 1) * MICROSECONDS_PER_DAY:
+            # Most track entries do not cross midnight.
+            if timestamp_begin < timestamp_end:
+                key = (day, task_uid)
+                durations[key] = durations.get(key, 0) + sign * (timestamp_end - timestamp_begin)
+            continue
+        for day, duration in _segments(timestamp_begin, timestamp_end):
+            key = (day, task_uid)
+            durations[key] = durations.get(key, 0) + sign * duration
+    if len(durations) == 0:
+        return
+
+    c = connection.cursor()
+    task_uids = sorted(set(task_uid for _, task_uid in durations))
+    tasks = {}
+    for i in range(0, len(task_uids), MAX_VARIABLES):
+        chunk = task_uids[i:i+MAX_VARIABLES]
+        c.execute("SELECT `uid`, `user_uid`, `type_id` FROM `Tasks` WHERE `uid` IN (%s);" %
+                  ", ".join("?" * len(chunk)), chunk)
+        tasks.update((uid, (user_uid, type_id)) for uid, user_uid, type_id in c.fetchall())
+
+    for period, table_name in ROLLUP_TABLES.items():
+        if period == DAY:
+            period_durations = durations
+        else:
+            starts = {}
+            period_durations = {}
+            for (day, task_uid), duration in durations.items():
+                start = starts.get(day)
+                if start is None:
+                    start = starts[day] = period_start(day, period)
+                key = (start, task_uid)
+                period_durations[key] = period_durations.get(key, 0) + duration
+        rows = [tasks[task_uid][:1] + (day, task_uid) + tasks[task_uid][1:] + (duration,)
+                for (day, task_uid), duration in period_durations.items() if task_uid in tasks]
+        if _UPSERT:
+            c.executemany("INSERT INTO `%s` VALUES (?, ?, ?, ?, ?) ON CONFLICT (`user_uid`, `day`, `task_uid`) "
+                          "DO UPDATE SET `duration` = `duration` + `excluded`.`duration`;" % table_name, rows)
+        else:
+            c.executemany("INSERT OR IGNORE INTO `%s` VALUES (?, ?, ?, ?, 0);" % table_name,
+                          [row[:4] for row in rows])
+            c.executemany("UPDATE `%s` SET `duration` = `duration` + ? "
+                          "WHERE `user_uid`=? AND `day`=? AND `task_uid`=?;" % table_name,
+                          [(row[4],) + row[:3] for row in rows])
+        c.executemany("DELETE FROM `%s` WHERE `user_uid`=? AND `day`=? AND `task_uid`=? AND `duration`=0;"
+                      % table_name, [row[:3] for row in rows if row[4] <= 0])
+
+
+def rebuild(connection, user_uid=None, tasks_table="Tasks", entries_table="TrackEntries"):
+    """
+    Regenerates the rollup tables from the track entries. The day rollups are computed from the track entries, the week
+    and month rollups from the day rollups. The caller is responsible for the transaction.
+    :param connection: The database connection.
+    :param user_uid: The user whose rollups are regenerated. Defaults to all users.
+    :param tasks_table: The table or view with the tasks.
+    :param entries_table: The table or view with the track entries.
+    """
+    c = connection.cursor()
+    user_filter = "" if user_uid is None else " WHERE `user_uid`=%d" % user_uid
+    task_filter = "" if user_uid is None else " AND `Tasks`.`user_uid`=%d" % user_uid
+    for table_name in ROLLUP_TABLES.values():
+        c.execute("DELETE FROM `%s`%s;" % (table_name, user_filter))
+    c.execute("WITH RECURSIVE "
+              "`segments`(`user_uid`, `task_uid`, `type_id`, `day`, `begin`, `end`) AS ("
+              "SELECT `Tasks`.`user_uid`, `TrackEntries`.`task_uid`, `Tasks`.`type_id`, "
+              "`TrackEntries`.`timestamp_begin` / :day_length, "
+              "`TrackEntries`.`timestamp_begin`, `TrackEntries`.`timestamp_end` "
+              "FROM `%s` AS `Tasks` JOIN `%s` AS `TrackEntries` ON `TrackEntries`.`task_uid`=`Tasks`.`uid` "
+              "WHERE `TrackEntries`.`deleted`=0 AND `TrackEntries`.`timestamp_end` IS NOT NULL "
+              "AND `TrackEntries`.`timestamp_begin`<`TrackEntries`.`timestamp_end`%s "
+              "UNION ALL "
+              "SELECT `user_uid`, `task_uid`, `type_id`, `day` + 1, (`day` + 1) * :day_length, `end` FROM `segments` "
+              "WHERE (`day` + 1) * :day_length < `end`) "
+              "INSERT INTO `RollupsDay` "
+              "SELECT `user_uid`, `day`, `task_uid`, `type_id`, SUM(MIN(`end`, (`day` + 1) * :day_length) - `begin`) "
+              "FROM `segments` GROUP BY `user_uid`, `day`, `task_uid`;" % (tasks_table, entries_table, task_filter),
+              {"day_length": MICROSECONDS_PER_DAY})
+    for period in (WEEK, MONTH):
+        c.execute("INSERT INTO `%s` "
+                  "SELECT `user_uid`, %s, `task_uid`, `type_id`, SUM(`duration`) FROM `RollupsDay`%s "
+                  "GROUP BY 1, 2, 3;" % (ROLLUP_TABLES[period], PERIOD_EXPRESSIONS[period], user_filter))
+
+
+def main():
+    """
+    Regenerates the rollup tables of a database file.
+    """
+    # The connector imports this module, so it is imported here.
+    from .database_connector import DatabaseConnector
+
+    parser = argparse.ArgumentParser(description="Regenerate the rollup tables from the track entries.")
+    parser.add_argument("database", type=str, help="path to the database")
+    parser.add_argument("--user", type=int, default=None, help="only regenerate the rollups of this user uid")
+    parser.add_argument("--archive", type=str, default=None,
+                        help="path to the archive database, required if data was archived")
+    args = parser.parse_args()
+
+    db = DatabaseConnector(args.database)
+    try:
+        if args.archive is None:
+            db.rebuild_rollups(args.user)
+        else:
+            with db.attached_archive(args.archive):
+                db.rebuild_rollups(args.user)
+    except RuntimeError as ex:
+        parser.error(str(ex))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
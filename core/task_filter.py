@@ -0,0 +1,63 @@
+from collections import namedtuple
+
+from .database_types import timestamp_to_sql
+
+
+class TaskFilter(namedtuple("TaskFilter", ["type_id", "done", "deleted", "title", "begin", "end"])):
+    """
+    The TaskFilter describes which tasks a task query returns. A criterion that is None is not checked. Filters are
+    immutable and composed with where(), for example TaskFilter(type_id=TASK_WORK).where(done=False).
+
+    type_id: A type id or an iterable with type ids.
+    done: Whether the tasks are done.
+    deleted: Whether the tasks are deleted. Deleted tasks are excluded by default.
+    title: Text that must be contained in the title (case-insensitive for ASCII letters).
+    begin, end: Range [begin, end) of timestamp_orderby (datetime).
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, type_id=None, done=None, deleted=False, title=None, begin=None, end=None):
+        return super().__new__(cls, type_id, done, deleted, title, begin, end)
+
+    def where(self, **criteria):
+        """
+        Returns a copy of the filter with the given criteria replaced.
+        :param criteria: The criteria, for example done=False.
+        :return: The new filter.
+        """
+        return self._replace(**criteria)
+
+    def to_sql(self):
+        """
+        Returns the SQL condition of the filter for the columns of the Tasks table and the query parameters. The
+        equality conditions come first and the range on timestamp_orderby last, which matches the column order of the
+        Tasks indexes.
+        :return: Tuple (condition, params). The condition is an empty string if nothing is checked.
+        """
+        conditions = []
+        params = []
+        if self.type_id is not None:
+            if isinstance(self.type_id, int):
+                conditions.append("`type_id`=?")
+                params.append(self.type_id)
+            else:
+                type_ids = [int(type_id) for type_id in self.type_id]
+                conditions.append("`type_id` IN (%s)" % ", ".join("?" * len(type_ids)))
+                params += type_ids
+        if self.done is not None:
+            conditions.append("`done`=?")
+            params.append(bool(self.done))
+        if self.deleted is not None:
+            conditions.append("`deleted`=?")
+            params.append(bool(self.deleted))
+        if self.title is not None:
+            conditions.append("`title` LIKE ? ESCAPE '\\'")
+            params.append("%" + self.title.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        if self.begin is not None:
+            conditions.append("`timestamp_orderby`>=?")
+            params.append(timestamp_to_sql(self.begin))
+        if self.end is not None:
+            conditions.append("`timestamp_orderby`<?")
+            params.append(timestamp_to_sql(self.end))
+        return " AND ".join(conditions), params
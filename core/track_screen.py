@@ -1,12 +1,108 @@
+import datetime
 import logging
 
-from PyQt5.QtCore import Qt, pyqtSlot
+from PyQt5.QtCore import Qt, QObject, QTimer, pyqtSignal, pyqtSlot
 from PyQt5.QtWidgets import QWidget, QVBoxLayout
 
 from .common import log_exceptions
 from .user_management import UserManagement
 from .user_profile import UserProfile
 from .widgets import TaskList, TrackingControls
+from .write_queue import ImmediateQueue, WriteQueue
+
+
+# The following functions are submitted to the write queue and run with the UserManagement of the writer thread. They
+# return everything the ui needs, so the GUI thread never touches the database.
+
+def _load_open_tasks(user_management):
+    return user_management.get_open_tasks(), user_management.get_task_totals()
+
+
+def _create_task(user_management, title, description):
+    return user_management.create_task(title, description)
+
+
+def _delete_task(user_management, task_uid):
+    user_management.delete_task(task_uid)
+
+
+def _stopped_task(user_management, task_uid):
+    """
+    Return the uid and the tracked time of the given task, or None if no task is given.
+    """
+    if task_uid is None:
+        return None
+    return task_uid, user_management.get_task_total(task_uid)
+
+
+def _start(user_management, start):
+    """
+    Call start(), which starts a task, and return the stopped task (see _stopped_task) and the uid of the started task.
+    """
+    previous_task_uid = user_management.current_task_uid
+    task_uid = start()
+    return _stopped_task(user_management, previous_task_uid), task_uid
+
+
+def _start_task(user_management, task_uid):
+    def start():
+        user_management.start_task(task_uid)
+        return task_uid
+    return _start(user_management, start)
+
+
+def _start_general_work(user_management):
+    return _start(user_management, user_management.start_general_work)
+
+
+def _start_pause(user_management):
+    return _start(user_management, user_management.start_pause)
+
+
+def _stop_current_task(user_management):
+    task_uid = user_management.current_task_uid
+    user_management.stop_current_task()
+    return _stopped_task(user_management, task_uid)
+
+
+def _task_done(user_management, task_uid):
+    was_started = user_management.current_task_uid == task_uid
+    user_management.task_done(task_uid)
+    return _stopped_task(user_management, task_uid if was_started else None)
+
+
+def _archive(user_management, archive_location, horizon):
+    return user_management.archive_if_due(archive_location, horizon)
+
+
+class _FutureBridge(QObject):
+    """
+    The _FutureBridge calls the callbacks of finished futures in the thread of the bridge (the GUI thread), also if the
+    futures are resolved by the writer thread.
+    """
+
+    finished = pyqtSignal(object, object, name="finished")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.finished.connect(self._on_finished)
+
+    def watch(self, future, callback=None):
+        """
+        Call callback(result) when the future is finished. Exceptions of the future are logged.
+        :param future: The future.
+        :param callback: The callback or None.
+        """
+        future.add_done_callback(lambda f: self.finished.emit(f, callback))
+
+    @pyqtSlot(object, object, name="_on_finished")
+    @log_exceptions
+    def _on_finished(self, future, callback):
+        exception = future.exception()
+        if exception is not None:
+            logging.error("Failed to write to the database: %s", exception)
+        elif callback is not None:
+            callback(future.result())
 
 
 class TrackScreen(QWidget):
@@ -16,15 +112,29 @@ class TrackScreen(QWidget):
 
         assert isinstance(user_profile, UserProfile)
 
-        # Initialize the user management.
+        # Initialize the user management. With asynchronous writes, the user management is owned by a writer thread, so
+        # the GUI thread does not wait for the disk.
         self._user_display_name = user_display_name
         db_user = user_profile["database_user_name"]
         db_location = user_profile["database_location"]
-        self._user_management = UserManagement(db_user, db_location)
+        db_profile = user_profile["database_profile"]
+
+        def create_user_management():
+            return UserManagement(db_user, db_location, db_profile)
+
+        queue_class = WriteQueue if user_profile["asynchronous_writes"] else ImmediateQueue
+        self._writes = queue_class(create_user_management)
+        self._bridge = _FutureBridge()
+
+        # Move old done and deleted tasks into the archive database. This runs at most once per day and only after the
+        # screen is shown, with asynchronous writes on the writer thread.
+        if user_profile["archive_location"]:
+            horizon = datetime.timedelta(days=user_profile["archive_horizon_days"])
+            QTimer.singleShot(0, lambda: self._archive_old_data(user_profile["archive_location"], horizon))
 
         # Create the task box.
         self._task_list = TaskList()
-        self._task_list.load_open_tasks(self._user_management)
+        self._task_list.add_tasks(*self._writes.submit(_load_open_tasks).result())
         self._task_list.delete.connect(self._on_delete_task)
         self._task_list.start.connect(self._on_start_task)
         self._task_list.stop.connect(self._on_stop_task)
@@ -45,46 +155,89 @@ class TrackScreen(QWidget):
         layout.addWidget(self._task_list)
 
     def __del__(self):
-        self._on_end_of_work()
+        if not self._writes.closed:
+            self._on_end_of_work()
+            self._writes.close()
+
+    def _archive_old_data(self, archive_location, horizon):
+        """
+        Archive the old data outside of a transaction, since the archive database is attached for the move.
+        :param archive_location: Path to the archive database.
+        :param horizon: The minimum age of the archived data (timedelta).
+        """
+        if not self._writes.closed:
+            self._bridge.watch(self._writes.submit_alone(_archive, archive_location, horizon))
+
+    def _submit(self, fn, *args, callback=None):
+        """
+        Submit fn(user_management, *args) to the write queue and call callback(result) in the GUI thread when it is
+        committed.
+        :param fn: The function.
+        :param args: The arguments.
+        :param callback: The callback or None.
+        """
+        self._bridge.watch(self._writes.submit(fn, *args), callback)
 
     @pyqtSlot(str, str, name="_on_create_task")
     @log_exceptions
     def _on_create_task(self, title, description):
-        uid = self._user_management.create_task(title, description)
-        self._task_list.add_task(uid, title, description)
+        self._submit(_create_task, title, description,
+                     callback=lambda uid: self._task_list.add_task(uid, title, description))
 
     @pyqtSlot(int, name="_on_delete_task")
     @log_exceptions
     def _on_delete_task(self, task_uid):
-        self._user_management.delete_task(task_uid)
-        self._task_list.remove_task(task_uid)
+        self._submit(_delete_task, task_uid, callback=lambda result: self._task_list.remove_task(task_uid))
 
-    @pyqtSlot(int, name="_on_start_task")
-    @log_exceptions
-    def _on_start_task(self, task_uid):
-        if self._user_management.current_task_uid is not None:
-            self._on_stop_task(self._user_management.current_task_uid)
-        self._user_management.start_task(task_uid)
+    def _show_stopped_task(self, stopped_task):
+        """
+        Update the task list after the user management stopped a task.
+        :param stopped_task: Tuple (uid, total) of the stopped task or None.
+        """
+        if stopped_task is not None:
+            task_uid, total = stopped_task
+            self._task_list.stop_task(task_uid)
+            self._task_list.set_task_total(task_uid, total)
+
+    def _show_started_task(self, result):
+        """
+        Update the controls after the user management switched from the previous task to the started task.
+        :param result: Tuple (stopped task, uid of the started task), see _start.
+        """
+        stopped_task, task_uid = result
+        self._show_stopped_task(stopped_task)
         self._task_list.start_task(task_uid)
         self._tracking_controls.enable_pause_button()
         self._tracking_controls.enable_general_work_button()
 
+    def _show_idle(self, stopped_task):
+        """
+        Update the controls after the user management stopped the current task.
+        :param stopped_task: Tuple (uid, total) of the stopped task or None if no task was running.
+        """
+        if stopped_task is None:
+            return
+        self._show_stopped_task(stopped_task)
+        self._tracking_controls.disable_pause_button()
+        self._tracking_controls.enable_general_work_button()
+
+    @pyqtSlot(int, name="_on_start_task")
+    @log_exceptions
+    def _on_start_task(self, task_uid):
+        self._submit(_start_task, task_uid, callback=self._show_started_task)
+
     @pyqtSlot(int, name="_on_stop_task")
     @log_exceptions
     def _on_stop_task(self, task_uid):
-        assert task_uid == self._user_management.current_task_uid
-        self._user_management.stop_current_task()
-        self._task_list.stop_task(task_uid)
-        self._tracking_controls.disable_pause_button()
-        self._tracking_controls.enable_general_work_button()
+        self._submit(_stop_current_task, callback=self._show_idle)
 
     @pyqtSlot(int, name="_on_task_done")
     @log_exceptions
     def _on_task_done(self, task_uid):
-        if self._user_management.current_task_uid == task_uid:
-            self._on_stop_task(task_uid)
-        self._user_management.task_done(task_uid)
-        self._task_list.remove_task(task_uid)
+        def show_done(stopped_task):
+            self._show_idle(stopped_task)
+            self._task_list.remove_task(task_uid)
+        self._submit(_task_done, task_uid, callback=show_done)
 
     @pyqtSlot(name="_on_general_work")
     @log_exceptions
@@ -92,9 +245,10 @@ class TrackScreen(QWidget):
         """
         Start general work.
         """
-        task_uid = self._user_management.create_general_work_task()
-        self._on_start_task(task_uid)
-        self._tracking_controls.disable_general_work_button()
+        def show_general_work(result):
+            self._show_started_task(result)
+            self._tracking_controls.disable_general_work_button()
+        self._submit(_start_general_work, callback=show_general_work)
 
     @pyqtSlot(name="_on_pause")
     @log_exceptions
@@ -102,15 +256,16 @@ class TrackScreen(QWidget):
         """
         Start pause.
         """
-        task_uid = self._user_management.create_pause_task()
-        self._on_start_task(task_uid)
-        self._tracking_controls.disable_pause_button()
+        def show_pause(result):
+            self._show_started_task(result)
+            self._tracking_controls.disable_pause_button()
+        self._submit(_start_pause, callback=show_pause)
 
     @pyqtSlot(name="_on_end_of_work")
     @log_exceptions
     def _on_end_of_work(self):
         """
-        Stop the work for today.
+        Stop the work for today and wait until everything is written to the database.
         """
-        if self._user_management.current_task_uid is not None:
-            self._on_stop_task(self._user_management.current_task_uid)
+        self._submit(_stop_current_task, callback=self._show_idle)
+        self._writes.flush()
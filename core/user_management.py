@@ -1,30 +1,75 @@
 import logging
 
-from .database_connector import DatabaseConnector
-from .database_types import User, Task, TrackEntry
+from .database_connector import DatabaseConnector, DEFAULT_PAGE_SIZE
+from .database_types import User, Setting, Task, TrackEntry
+from .task_filter import TaskFilter
 
 
 TASK_WORK = 0
 GENERAL_WORK = 1
 PAUSE = 2
 
+_OPEN_WORK_TASKS = TaskFilter(type_id=TASK_WORK, done=False)
+
+# The settings key of the date of the last archive run.
+_LAST_ARCHIVE_KEY = "last_archive_date"
+
 
 class UserManagement(object):
 
-    def __init__(self, user_name, database_location):
+    def __init__(self, user_name, database_location, connection_profile="default", readers=0):
         self._user = User(name=user_name)
-        self._database = DatabaseConnector(database_location)
+        self._database = DatabaseConnector(database_location, connection_profile, readers)
         self._database.create_user(self._user)
+        self._database.load_settings(self._user.uid)
         self._current_task_uid = None
 
     @property
     def current_task_uid(self):
         return self._current_task_uid
 
+    def transaction(self):
+        return self._database.transaction()
+
+    def close(self):
+        self._database.close()
+
+    def refresh(self):
+        # Rebuild the in-memory state from the database, for example after a transaction was rolled back.
+        self._current_task_uid = self._database.get_current_task_uid(self._user.uid)
+
     def get_open_tasks(self):
-        tasks = self._database.get_open_tasks(self._user.uid)
-        tasks = [task for task in tasks if task.type_id == TASK_WORK]
-        return tasks
+        return self._database.get_tasks(self._user.uid, _OPEN_WORK_TASKS)
+
+    def get_setting(self, key, default=None):
+        try:
+            return self._database.get_setting(self._user.uid, key).value
+        except KeyError:
+            return default
+
+    def set_setting(self, key, value):
+        self._database.create_setting(Setting(user_uid=self._user.uid, key=key, value=value))
+
+    def archive(self, archive_location, horizon):
+        return self._database.archive(archive_location, horizon)
+
+    def archive_if_due(self, archive_location, horizon):
+        # Archive at most once per day. Returns None if the archive already ran today.
+        today = self._database.get_current_timestamp().date().isoformat()
+        if self.get_setting(_LAST_ARCHIVE_KEY) == today:
+            return None
+        result = self.archive(archive_location, horizon)
+        self.set_setting(_LAST_ARCHIVE_KEY, today)
+        return result
+
+    def get_tasks_page(self, after=None, limit=DEFAULT_PAGE_SIZE, done=None, type_id=None):
+        return self._database.get_tasks_page(self._user.uid, after, limit, done, type_id)
+
+    def get_task_totals(self):
+        return self._database.get_task_totals(self._user.uid, _OPEN_WORK_TASKS)
+
+    def get_task_total(self, task_uid):
+        return self._database.get_task_total(task_uid)
 
     def create_task(self, title, description):
         task = Task(user_uid=self._user.uid, title=title, description=description, type_id=TASK_WORK)
@@ -41,26 +86,52 @@ class UserManagement(object):
         self._database.create_task(task)
         return task.uid
 
+    def start_general_work(self):
+        with self._database.transaction():
+            task_uid = self.create_general_work_task()
+            self.start_task(task_uid)
+        return task_uid
+
+    def start_pause(self):
+        with self._database.transaction():
+            task_uid = self.create_pause_task()
+            self.start_task(task_uid)
+        return task_uid
+
     def delete_task(self, task_uid):
-        task = Task(uid=task_uid, deleted=True)
+        task = self._database.get_task(task_uid)
+        task.deleted = True
         self._database.update_task(task)
 
     def start_task(self, task_uid):
+        with self._database.transaction():
+            if self._current_task_uid is not None:
+                self._close_open_track_entries(self._current_task_uid)
+            now = self._database.get_current_timestamp()
+            entry = TrackEntry(task_uid=task_uid, timestamp_begin=now)
+            self._database.create_track_entry(entry)
         self._current_task_uid = task_uid
-        now = self._database.get_current_timestamp()
-        entry = TrackEntry(task_uid=task_uid, timestamp_begin=now)
-        self._database.create_track_entry(entry)
         return entry.uid
 
     def stop_current_task(self):
         if self._current_task_uid is not None:
-            now = self._database.get_current_timestamp()
-            entries = self._database.get_open_track_entries(self._current_task_uid)
-            for entry in entries:
-                entry.timestamp_end = now
-                self._database.update_track_entry(entry)
+            with self._database.transaction():
+                self._close_open_track_entries(self._current_task_uid)
             self._current_task_uid = None
 
     def task_done(self, task_uid):
-        task = Task(uid=task_uid, done=True)
-        self._database.update_task(task)
+        with self._database.transaction():
+            if self._current_task_uid == task_uid:
+                self._close_open_track_entries(task_uid)
+            task = self._database.get_task(task_uid)
+            task.done = True
+            self._database.update_task(task)
+        if self._current_task_uid == task_uid:
+            self._current_task_uid = None
+
+    def _close_open_track_entries(self, task_uid):
+        now = self._database.get_current_timestamp()
+        entries = self._database.get_open_track_entries(task_uid)
+        for entry in entries:
+            entry.timestamp_end = now
+            self._database.update_track_entry(entry)
@@ -24,7 +24,11 @@ class UserProfile(object):
         """
         self.settings = {
             "database_user_name": "",
-            "database_location": ""
+            "database_location": "",
+            "database_profile": "default",
+            "archive_location": "",
+            "archive_horizon_days": 365,
+            "asynchronous_writes": False
         }
 
     def __getitem__(self, name):
@@ -1,3 +1,4 @@
+import datetime
 import logging
 
 from PyQt5.QtCore import pyqtSignal, pyqtSlot
@@ -30,20 +31,29 @@ class TaskList(QGroupBox):
         self.setLayout(self.layout)
 
     def load_open_tasks(self, user_management):
-        for task in user_management.get_open_tasks():
-            self.add_task(task.uid, task.title, task.description)
+        self.add_tasks(user_management.get_open_tasks(), user_management.get_task_totals())
 
-    def add_task(self, task_uid, title, description):
+    def add_tasks(self, tasks, totals):
+        """
+        Add the given tasks to the ui.
+        :param tasks: The tasks.
+        :param totals: Dict {task_uid: tracked time}. Tasks without an entry have no tracked time.
+        """
+        for task in tasks:
+            self.add_task(task.uid, task.title, task.description, totals.get(task.uid, datetime.timedelta()))
+
+    def add_task(self, task_uid, title, description, total=datetime.timedelta()):
         """
         Add the given task to the ui.
         :param task_uid: The task uid.
         :param title: The task title.
         :param description: The task description.
+        :param total: The tracked time of the task.
         """
         if task_uid in self._tasks:
             logging.warning("Tried to add a task to the track screen that was already added before.")
         else:
-            task = TaskWidget(task_uid, title, description)
+            task = TaskWidget(task_uid, title, description, total)
             task.delete.connect(self._on_show_delete_task_dialog)
             task.start.connect(self.start)
             task.stop.connect(self.stop)
@@ -55,6 +65,10 @@ class TaskList(QGroupBox):
         task = self._tasks.pop(task_uid)
         task.deleteLater()
 
+    def set_task_total(self, task_uid, total):
+        if task_uid in self._tasks:
+            self._tasks[task_uid].set_total(total)
+
     def start_task(self, task_uid):
         if task_uid in self._tasks:
             self._tasks[task_uid].start_task()
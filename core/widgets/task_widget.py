@@ -1,13 +1,25 @@
+import datetime
+
 from PyQt5.QtCore import pyqtSignal, pyqtSlot, Qt
 from PyQt5.QtWidgets import QWidget, QHBoxLayout, QPushButton, QLabel, QSizePolicy
 
 from ..common import log_exceptions
 
 
+def format_duration(duration):
+    """
+    Format the given duration as hours and minutes, for example "12:05".
+    :param duration: The duration as timedelta.
+    :return: The formatted duration.
+    """
+    minutes = int(duration.total_seconds()) // 60
+    return "%d:%02d" % (minutes // 60, minutes % 60)
+
+
 class TaskWidget(QWidget):
     """
-    The TaskWidget is a QWidget with two labels and three buttons. It is used to show title and description of a task
-    and provides signals to start and stop the time tracking for that task.
+    The TaskWidget is a QWidget with three labels and three buttons. It is used to show title, description, and tracked
+    time of a task and provides signals to start and stop the time tracking for that task.
     """
 
     delete = pyqtSignal(int, name="delete")
@@ -15,7 +27,7 @@ class TaskWidget(QWidget):
     stop = pyqtSignal(int, name="stop")
     done = pyqtSignal(int, name="done")
 
-    def __init__(self, task_uid, title, description, *args, **kwargs):
+    def __init__(self, task_uid, title, description, total=datetime.timedelta(), *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         self.title = title
@@ -36,18 +48,22 @@ class TaskWidget(QWidget):
         title_lbl = QLabel(text=title)
         description_lbl = QLabel(text=description)
         description_lbl.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Minimum)
+        self._total_lbl = QLabel(text=format_duration(total))
         self.toggle_btn = QPushButton(text="Start")
         self.toggle_btn.clicked.connect(self._clicked_toggle)
         done_btn = QPushButton(text="Done")
         done_btn.clicked.connect(self._clicked_done)
 
-        for widget in (delete_btn, title_lbl, description_lbl, self.toggle_btn, done_btn):
+        for widget in (delete_btn, title_lbl, description_lbl, self._total_lbl, self.toggle_btn, done_btn):
             layout.addWidget(widget)
 
     @property
     def started(self):
         return self._started
 
+    def set_total(self, total):
+        self._total_lbl.setText(format_duration(total))
+
     def start_task(self):
         self._started = True
         self.toggle_btn.setText("Stop")
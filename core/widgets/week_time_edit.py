@@ -38,3 +38,11 @@ class WeekTimeEdit(QFormLayout):
         :return: Returns the {day: time} dict.
         """
         return [(day, self._time_inputs[day].time()) for day in self._days]
+
+    def seconds(self):
+        """
+        Returns a dict {day: seconds}, where day is the day ("Mo", "Tu", ...) and seconds is the corresponding input time
+        in seconds. The dict can be passed to BalanceEngine.set_targets().
+        :return: Returns the {day: seconds} dict.
+        """
+        return {day: QTime(0, 0).secsTo(time) for day, time in self.items()}
@@ -0,0 +1,301 @@
+import atexit
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+
+
+# The default maximum number of queued calls. submit() blocks while the queue is full.
+DEFAULT_MAX_SIZE = 1000
+
+# The default maximum number of calls that are grouped into one transaction.
+DEFAULT_MAX_GROUP = 64
+
+# The queue item that stops the writer thread.
+_STOP = object()
+
+
+def _refresh(target):
+    """
+    Calls target.refresh() if the target has such a method, so in-memory state of the target that was derived from
+    rolled back writes is rebuilt from the database. Exceptions are logged.
+    :param target: The target object.
+    """
+    refresh = getattr(target, "refresh", None)
+    if refresh is None:
+        return
+    try:
+        refresh()
+    except Exception:
+        logging.exception("Failed to refresh the write queue target.")
+
+
+def _run_in_transaction(target, fn, args):
+    """
+    Runs fn(target, *args) in a transaction of the target and returns the result.
+    :param target: The target object, for example a UserManagement.
+    :param fn: The function.
+    :param args: The arguments.
+    :return: The result of fn.
+    """
+    with target.transaction():
+        return fn(target, *args)
+
+
+class ImmediateQueue(object):
+    """
+    The ImmediateQueue has the interface of the WriteQueue, but runs every call immediately in the calling thread. It is
+    used when the asynchronous persistence mode is disabled.
+    """
+
+    def __init__(self, factory):
+        """
+        Creates the target object.
+        :param factory: Function that creates the target object. The target must have a transaction() context manager
+        and a close() method. If it has a refresh() method, it is called after a call failed.
+        """
+        self._target = factory()
+
+    @property
+    def closed(self):
+        """
+        Returns whether the queue is closed.
+        :return: True if the queue is closed.
+        """
+        return self._target is None
+
+    def submit(self, fn, *args):
+        """
+        Runs fn(target, *args) in a transaction and returns a completed future with the result.
+        :param fn: The function.
+        :param args: The arguments.
+        :return: The future.
+        """
+        future = Future()
+        try:
+            future.set_result(_run_in_transaction(self._target, fn, args))
+        except Exception as ex:
+            _refresh(self._target)
+            future.set_exception(ex)
+        return future
+
+    def submit_alone(self, fn, *args):
+        """
+        Runs fn(target, *args) outside of a transaction and returns a completed future with the result.
+        :param fn: The function.
+        :param args: The arguments.
+        :return: The future.
+        """
+        future = Future()
+        try:
+            future.set_result(fn(self._target, *args))
+        except Exception as ex:
+            _refresh(self._target)
+            future.set_exception(ex)
+        return future
+
+    def flush(self, timeout=None):
+        """
+        Does nothing, since every call is finished when submit() returns.
+        :param timeout: Unused.
+        """
+        pass
+
+    def close(self):
+        """
+        Closes the target object.
+        """
+        if self._target is not None:
+            self._target.close()
+            self._target = None
+
+
+class WriteQueue(object):
+    """
+    The WriteQueue runs calls on a dedicated writer thread, so the calling thread, for example the Qt GUI thread, never
+    waits for the disk. The writer thread creates and owns the target object (SQLite connections can only be used in the
+    thread that created them). Queued calls are grouped into one transaction, and every call runs in its own savepoint,
+    so a failing call does not roll back the others. The futures are resolved after the transaction is committed.
+
+    The queue is bounded: submit() blocks while it is full, so no call is ever dropped. flush() waits until all
+    submitted calls are committed, close() flushes and stops the writer thread. Open queues are closed when the
+    interpreter exits.
+    """
+
+    def __init__(self, factory, max_size=DEFAULT_MAX_SIZE, max_group=DEFAULT_MAX_GROUP):
+        """
+        Starts the writer thread and waits until it created the target object. Exceptions of the factory are raised.
+        :param factory: Function that creates the target object. The target must have a transaction() context manager
+        and a close() method. If it has a refresh() method, it is called after a call or a commit failed.
+        :param max_size: The maximum number of queued calls.
+        :param max_group: The maximum number of calls per transaction.
+        """
+        self._queue = queue.Queue(max_size)
+        self._max_group = max_group
+        self._closed = False
+        self._target = None
+        ready = Future()
+        # The thread is a daemon, so a forgotten queue does not keep the interpreter alive. The atexit handler commits the
+        # pending calls before the interpreter stops the daemon threads.
+        self._thread = threading.Thread(target=self._run, args=(factory, ready), name="WriteQueue", daemon=True)
+        self._thread.start()
+        ready.result()
+        atexit.register(self.close)
+
+    @property
+    def closed(self):
+        """
+        Returns whether the queue is closed.
+        :return: True if the queue is closed.
+        """
+        return self._closed
+
+    @property
+    def target(self):
+        """
+        Returns the target object. The target belongs to the writer thread, so other threads may only call its
+        thread-safe methods, for example the reads of a DatabaseConnector with a reader pool.
+        :return: The target object.
+        """
+        return self._target
+
+    def submit(self, fn, *args):
+        """
+        Queues the call fn(target, *args) and returns a future with its result.
+        :param fn: The function.
+        :param args: The arguments.
+        :return: The future.
+        """
+        return self._put(fn, args, True)
+
+    def submit_alone(self, fn, *args):
+        """
+        Queues the call fn(target, *args) like submit(), but runs it on its own and outside of a transaction, for
+        example to attach a database.
+        :param fn: The function.
+        :param args: The arguments.
+        :return: The future.
+        """
+        return self._put(fn, args, False)
+
+    def _put(self, fn, args, in_transaction):
+        """
+        Queues the call fn(target, *args) and returns a future with its result.
+        :param fn: The function.
+        :param args: The arguments.
+        :param in_transaction: Whether the call runs in the transaction of its group.
+        :return: The future.
+        """
+        if self._closed:
+            raise RuntimeError("The write queue is closed.")
+        future = Future()
+        self._queue.put((fn, args, future, in_transaction))
+        return future
+
+    def flush(self, timeout=None):
+        """
+        Waits until all submitted calls are committed.
+        :param timeout: The maximum number of seconds to wait or None.
+        """
+        self.submit(lambda target: None).result(timeout)
+
+    def close(self):
+        """
+        Commits all submitted calls, stops the writer thread, and closes the target object.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.close)
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self, factory, ready):
+        """
+        The writer thread: creates the target and runs the queued calls in groups until the queue is stopped.
+        :param factory: Function that creates the target object.
+        :param ready: Future that is resolved when the target is created.
+        """
+        try:
+            target = factory()
+        except Exception as ex:
+            self._closed = True
+            ready.set_exception(ex)
+            return
+        self._target = target
+        ready.set_result(None)
+
+        pending = None
+        while True:
+            item = self._queue.get() if pending is None else pending
+            pending = None
+            if item is _STOP:
+                break
+            if not item[3]:
+                self._run_alone(target, item)
+                continue
+
+            # Group the queued calls up to the next call that must run alone.
+            group = [item]
+            while len(group) < self._max_group:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP or not item[3]:
+                    pending = item
+                    break
+                group.append(item)
+            self._run_group(target, group)
+
+        try:
+            target.close()
+        except Exception:
+            logging.exception("Failed to close the write queue target.")
+
+    @staticmethod
+    def _run_alone(target, item):
+        """
+        Runs the given call outside of a transaction and resolves its future.
+        :param target: The target object.
+        :param item: The queued call (fn, args, future, in_transaction).
+        """
+        fn, args, future, _ = item
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(target, *args))
+        except Exception as ex:
+            _refresh(target)
+            future.set_exception(ex)
+
+    @staticmethod
+    def _run_group(target, group):
+        """
+        Runs the given calls in one transaction and resolves their futures after the commit.
+        :param target: The target object.
+        :param group: List with the queued calls (fn, args, future, in_transaction).
+        """
+        results = []
+        try:
+            with target.transaction():
+                for fn, args, future, _ in group:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        results.append((future, _run_in_transaction(target, fn, args), None))
+                    except Exception as ex:
+                        # The writes of the call were rolled back, so the next calls must not see its state.
+                        _refresh(target)
+                        results.append((future, None, ex))
+        except Exception as ex:
+            # The commit failed, so none of the calls was persisted.
+            _refresh(target)
+            for future, result, exception in results:
+                future.set_exception(ex)
+            return
+        for future, result, exception in results:
+            if exception is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exception)
@@ -1,4 +1,16 @@
+from .test_analytics import TestAnalytics
+from .test_archive import TestArchive
+from .test_async_api import TestAsyncApi
+from .test_balance import TestBalance
+from .test_common import TestSettings
+from .test_connection_pool import TestConnectionPool
 from .test_database import TestDatabase
+from .test_identity_map import TestIdentityMap
+from .test_migrations import TestMigrations
+from .test_reporting import TestReporting
+from .test_rollups import TestRollups
+from .test_user_management import TestUserManagement
+from .test_write_queue import TestWriteQueue
 
 
 def load_tests(loader, tests, pattern):
@@ -0,0 +1,108 @@
+import datetime
+import os
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from core.database_connector import DatabaseConnector
+from core.database_types import Task, TrackEntry
+
+if numpy is not None:
+    from core import analytics
+
+
+DB_PATH = "test_analytics.db"
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestAnalytics(unittest.TestCase):
+
+    def setUp(self):
+        if os.path.isfile(DB_PATH):
+            os.remove(DB_PATH)
+        self.db = DatabaseConnector(DB_PATH)
+
+        # Two work tasks and a pause task of user 1 and a task of user 2.
+        self.tasks = self.db.create_tasks([Task(user_uid=1, type_id=0), Task(user_uid=1, type_id=0),
+                                           Task(user_uid=1, type_id=2), Task(user_uid=2, type_id=0)])
+        t = [task.uid for task in self.tasks]
+        d = datetime.datetime
+        self.db.create_track_entries([
+            # Monday 2017-01-30.
+            TrackEntry(task_uid=t[0], timestamp_begin=d(2017, 1, 30, 8), timestamp_end=d(2017, 1, 30, 9)),
+            TrackEntry(task_uid=t[1], timestamp_begin=d(2017, 1, 30, 9), timestamp_end=d(2017, 1, 30, 11)),
+            TrackEntry(task_uid=t[2], timestamp_begin=d(2017, 1, 30, 11), timestamp_end=d(2017, 1, 30, 12)),
+            TrackEntry(task_uid=t[2], timestamp_begin=d(2017, 1, 30, 12), timestamp_end=d(2017, 1, 30, 12, 30)),
+            # Tuesday, crosses midnight.
+            TrackEntry(task_uid=t[0], timestamp_begin=d(2017, 1, 31, 22), timestamp_end=d(2017, 2, 1, 2)),
+            # Deleted entries are ignored.
+            TrackEntry(task_uid=t[1], timestamp_begin=d(2017, 2, 1, 8), timestamp_end=d(2017, 2, 1, 9), deleted=True),
+            # Open entry on Thursday.
+            TrackEntry(task_uid=t[1], timestamp_begin=d(2017, 2, 2, 8)),
+            # Other user.
+            TrackEntry(task_uid=t[3], timestamp_begin=d(2017, 1, 30, 8), timestamp_end=d(2017, 1, 30, 9))
+        ])
+        self.now = d(2017, 2, 2, 9)
+
+    def tearDown(self):
+        self.db.close()
+        if os.path.isfile(DB_PATH):
+            os.remove(DB_PATH)
+
+    def test_load_track_columns(self):
+        """
+        Make sure that the columns contain the entries of the user ordered by begin and that open entries end now.
+        """
+        columns = analytics.load_track_columns(self.db, 1, now=self.now)
+        t = [task.uid for task in self.tasks]
+        self.assertEqual(columns.task_uid.tolist(), [t[0], t[1], t[2], t[2], t[0], t[1]])
+        self.assertEqual(columns.type_id.tolist(), [0, 0, 2, 2, 0, 0])
+        self.assertEqual(columns.begin.dtype, numpy.int64)
+        self.assertEqual(analytics.durations(columns).tolist(), [3600, 7200, 3600, 1800, 14400, 3600])
+
+        columns = analytics.load_track_columns(self.db, 1, now=self.now, type_ids=[0])
+        self.assertEqual(columns.type_id.tolist(), [0, 0, 0, 0])
+
+        columns = analytics.load_track_columns(self.db, 1, begin=datetime.datetime(2017, 2, 1),
+                                               end=datetime.datetime(2017, 2, 2), now=self.now)
+        self.assertEqual(analytics.durations(columns).tolist(), [7200])
+
+        columns = analytics.load_track_columns(self.db, 3, now=self.now)
+        self.assertEqual(len(columns.uid), 0)
+        self.assertTrue(numpy.isnan(analytics.duration_percentiles(columns)).all())
+
+    def test_histogram_and_percentiles(self):
+        """
+        Check the duration histogram and percentiles.
+        """
+        columns = analytics.load_track_columns(self.db, 1, now=self.now)
+        counts, edges = analytics.duration_histogram(columns, bins=[0, 3600, 7200, 86400])
+        self.assertEqual(counts.tolist(), [1, 3, 2])
+        self.assertEqual(analytics.duration_percentiles(columns, [0, 50, 100]).tolist(), [1800, 3600, 14400])
+
+    def test_weekday_distribution(self):
+        """
+        Make sure that the time is attributed to the weekdays and that entries are split at midnight.
+        """
+        columns = analytics.load_track_columns(self.db, 1, now=self.now)
+        self.assertEqual(analytics.weekday_distribution(columns).tolist(),
+                         [4.5*3600, 2*3600, 2*3600, 3600, 0, 0, 0])
+        days, totals = analytics.daily_totals(columns)
+        first_day = (datetime.date(2017, 1, 30) - datetime.date(1970, 1, 1)).days
+        self.assertEqual(days.tolist(), [first_day, first_day+1, first_day+2, first_day+3])
+        self.assertEqual(totals.tolist(), [4.5*3600, 2*3600, 2*3600, 3600])
+
+    def test_context_switches(self):
+        """
+        Make sure that task changes are counted per day.
+        """
+        columns = analytics.load_track_columns(self.db, 1, now=self.now)
+        days, counts = analytics.context_switches(columns)
+        self.assertEqual(counts.tolist(), [2, 0, 0])
+
+
+if __name__ == "__main__":
+    unittest.main()
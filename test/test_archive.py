@@ -0,0 +1,109 @@
+import datetime
+import os
+import sqlite3
+import unittest
+
+from core import reporting
+from core.balance import BalanceEngine
+from core.database_connector import DatabaseConnector
+from core.database_types import Task, TrackEntry
+
+
+DB_PATH = "test_archive.db"
+ARCHIVE_PATH = "test_archive_old.db"
+
+
+class TestArchive(unittest.TestCase):
+
+    def setUp(self):
+        for path in (DB_PATH, ARCHIVE_PATH):
+            if os.path.isfile(path):
+                os.remove(path)
+        self.db = DatabaseConnector(DB_PATH)
+        d = datetime.datetime
+        self.now = d(2018, 6, 1, 12)
+        self.db.get_current_timestamp = lambda: self.now
+
+        # An old done task, an old deleted task, a recently finished task, and an old open task.
+        self.tasks = self.db.create_tasks([Task(user_uid=1, type_id=0, done=True),
+                                           Task(user_uid=1, type_id=0, deleted=True),
+                                           Task(user_uid=1, type_id=0, done=True),
+                                           Task(user_uid=1, type_id=0)])
+        for task in self.tasks:
+            task.timestamp_orderby = d(2017, 1, 2)
+            self.db.update_task(task)
+        t = [task.uid for task in self.tasks]
+        self.entries = self.db.create_track_entries([
+            TrackEntry(task_uid=t[0], timestamp_begin=d(2017, 1, 2, 8), timestamp_end=d(2017, 1, 2, 12)),
+            TrackEntry(task_uid=t[1], timestamp_begin=d(2017, 1, 3, 8), timestamp_end=d(2017, 1, 3, 10)),
+            TrackEntry(task_uid=t[2], timestamp_begin=d(2017, 1, 4, 8), timestamp_end=d(2017, 1, 4, 9)),
+            TrackEntry(task_uid=t[2], timestamp_begin=d(2018, 5, 30, 8), timestamp_end=d(2018, 5, 30, 9)),
+            TrackEntry(task_uid=t[3], timestamp_begin=d(2017, 1, 5, 8), timestamp_end=d(2017, 1, 5, 9)),
+            TrackEntry(task_uid=t[3], timestamp_begin=d(2017, 1, 6, 8), timestamp_end=d(2017, 1, 6, 9), deleted=True)
+        ])
+
+    def tearDown(self):
+        self.db.close()
+        for path in (DB_PATH, ARCHIVE_PATH):
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def count_rows(self, table_name):
+        c = self.db.cursor()
+        c.execute("SELECT COUNT(*) FROM `%s`;" % table_name)
+        return c.fetchone()[0]
+
+    def test_archive(self):
+        """
+        Make sure that only old done and deleted tasks and deleted track entries are moved into the archive.
+        """
+        self.assertEqual(self.db.archive(ARCHIVE_PATH, datetime.timedelta(days=365)), (2, 3))
+        self.assertFalse(self.db.archive_attached)
+        self.assertEqual(self.db.get_archive_locations(), [os.path.abspath(ARCHIVE_PATH)])
+        self.assertEqual([task.uid for task in self.db.get_all_tasks(1)], [self.tasks[2].uid, self.tasks[3].uid])
+        self.assertEqual(self.count_rows("TrackEntries"), 3)
+        self.assertNotIn(self.tasks[0].uid, self.db.get_task_totals(1))
+
+        archive = sqlite3.connect(ARCHIVE_PATH)
+        self.assertEqual(archive.execute("SELECT `uid` FROM `Tasks` ORDER BY `uid`;").fetchall(),
+                         [(self.tasks[0].uid,), (self.tasks[1].uid,)])
+        self.assertEqual(archive.execute("SELECT `uid` FROM `TrackEntries` ORDER BY `uid`;").fetchall(),
+                         [(self.entries[0].uid,), (self.entries[1].uid,), (self.entries[5].uid,)])
+        archive.close()
+
+        # Archiving again moves nothing.
+        self.assertEqual(self.db.archive(ARCHIVE_PATH, datetime.timedelta(days=365)), (0, 0))
+
+    def test_history(self):
+        """
+        Make sure that reports, the balance, and the rollups still include the archived time.
+        """
+        d = datetime.datetime
+        engine = BalanceEngine(self.db, 1)
+        self.db.get_current_timestamp = lambda: d(2017, 1, 1)
+        engine.set_targets({})
+        self.db.get_current_timestamp = lambda: self.now
+        balance = engine.get_balance()
+        checkpoints = self.count_rows("BalanceCheckpoints")
+        args = (self.db, 1, d(2017, 1, 2, 9), d(2018, 6, 1), reporting.MONTH, reporting.TASK)
+        report = reporting.summarize(*args, now=self.now)
+
+        self.db.archive(ARCHIVE_PATH, datetime.timedelta(days=365))
+        self.assertEqual(self.count_rows("BalanceCheckpoints"), checkpoints)
+        self.assertEqual(engine.get_balance(), balance)
+
+        # The partial first day needs the archived track entries, the full days are read from the rollups.
+        with self.assertRaises(RuntimeError):
+            reporting.summarize(*args, now=self.now)
+        self.assertEqual(reporting.summarize(self.db, 1, d(2017, 1, 3), d(2018, 6, 1), reporting.MONTH,
+                                             reporting.TASK, now=self.now), report[1:])
+
+        # The rollups are only rebuilt with the archive.
+        with self.assertRaises(RuntimeError):
+            self.db.rebuild_rollups()
+        with self.db.attached_archive(ARCHIVE_PATH):
+            self.assertEqual(self.count_rows("AllTasks"), 4)
+            self.assertEqual(reporting.summarize(*args, now=self.now), report)
+            self.db.rebuild_rollups()
+            self.assertEqual(reporting.summarize(*args, now=self.now), report)
+        self.assertEqual(engine.get_balance(), balance)
@@ -0,0 +1,138 @@
+import asyncio
+import datetime
+import os
+import threading
+import time
+import unittest
+
+from core.async_api import AsyncDatabaseConnector, AsyncUserManagement
+from core.database_connector import DatabaseConnector
+from core.database_types import Task, TrackEntry
+from core.user_management import UserManagement
+
+
+DB_PATH = "test_async_api.db"
+ARCHIVE_PATH = "test_async_api_archive.db"
+
+
+class TestAsyncApi(unittest.TestCase):
+
+    def setUp(self):
+        for path in (DB_PATH, ARCHIVE_PATH):
+            if os.path.isfile(path):
+                os.remove(path)
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        for path in (DB_PATH, ARCHIVE_PATH):
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def test_user_management(self):
+        """
+        Run many coroutines concurrently and make sure that the calls run in the order in which they were submitted.
+        """
+        async def run():
+            async with AsyncUserManagement("Abel", DB_PATH) as um:
+                uids = await asyncio.gather(*(um.create_task("Task %d" % i, "") for i in range(20)))
+                self.assertEqual(len(set(uids)), 20)
+                await asyncio.gather(um.start_task(uids[0]), um.start_task(uids[1]), um.task_done(uids[2]))
+                self.assertEqual(await um.current_task_uid, uids[1])
+                await um.stop_current_task()
+                self.assertIsNone(await um.current_task_uid)
+                tasks = await um.get_open_tasks()
+                self.assertEqual([task.uid for task in tasks], uids[:2] + uids[3:])
+                self.assertEqual(set(await um.get_task_totals()), set(uids) - {uids[2]})
+        self.loop.run_until_complete(run())
+
+    def test_database_connector(self):
+        """
+        Make sure that the iterators return lists, that run() is atomic, and that the archive can be attached.
+        """
+        d = datetime.datetime
+
+        def create_and_fail(db, task):
+            db.create_task(task)
+            raise ValueError("Failed on purpose.")
+
+        async def run():
+            db = AsyncDatabaseConnector(DB_PATH)
+            await db.run(lambda db: setattr(db, "get_current_timestamp", lambda: d(2017, 1, 2)))
+            tasks = await db.create_tasks([Task(user_uid=1, type_id=0, done=True), Task(user_uid=1, type_id=0)])
+            await db.create_track_entry(TrackEntry(task_uid=tasks[0].uid, timestamp_begin=d(2017, 1, 2, 8),
+                                                   timestamp_end=d(2017, 1, 2, 9)))
+            self.assertEqual(await db.iter_tasks(1), tasks)
+            self.assertEqual(len(await db.iter_track_entries(1)), 1)
+            with self.assertRaises(ValueError):
+                await db.run(create_and_fail, Task(user_uid=1, type_id=0))
+            self.assertEqual(len(await db.get_all_tasks(1)), 2)
+
+            await db.run(lambda db: setattr(db, "get_current_timestamp", lambda: d(2018, 6, 1)))
+            self.assertEqual(await db.archive(ARCHIVE_PATH, datetime.timedelta(days=365)), (1, 1))
+            self.assertEqual(await db.get_all_tasks(1), tasks[1:])
+            await db.close()
+        self.loop.run_until_complete(run())
+
+    def test_facades_have_the_sync_methods(self):
+        """
+        Make sure that the facades offer every public method of the synchronous classes, except for the ones that are
+        replaced by run().
+        """
+        replaced = {
+            AsyncDatabaseConnector: {"transaction", "reading", "attached_archive", "cursor", "archive_attached",
+                                     "date_format", "history_tables", "identity_map"},
+            AsyncUserManagement: {"transaction"}
+        }
+        for facade, sync_class in ((AsyncDatabaseConnector, DatabaseConnector), (AsyncUserManagement, UserManagement)):
+            sync_names = set(name for name in dir(sync_class) if not name.startswith("_"))
+            facade_names = set(name for name in dir(facade) if not name.startswith("_"))
+            self.assertEqual(facade_names - {"run", "flush"}, sync_names - replaced[facade])
+
+    def test_reads_use_the_reader_pool(self):
+        """
+        Make sure that the reads run outside of the writer thread and without a write transaction, and that they see
+        the writes that were submitted before them.
+        """
+        statements = []
+
+        async def run():
+            async with AsyncDatabaseConnector(DB_PATH) as db:
+                await db.run(lambda db: db._connection.set_trace_callback(statements.append))
+                tasks = await asyncio.gather(*(db.create_task(Task(user_uid=1, type_id=0)) for _ in range(5)))
+                del statements[:]
+                self.assertEqual(len(await db.get_all_tasks(1)), 5)
+                self.assertEqual(await db.get_current_task_uid(1), None)
+                self.assertEqual(statements, [])
+                self.assertEqual(len(tasks), 5)
+
+            async with AsyncDatabaseConnector(DB_PATH, connection_profile="durable", readers=0) as db:
+                self.assertEqual(len(await db.get_all_tasks(1)), 5)
+        self.loop.run_until_complete(run())
+
+    def test_full_queue_does_not_block_the_loop(self):
+        """
+        Block the writer thread, submit more calls than the queue can hold, and make sure that the event loop keeps
+        running until the writer continues.
+        """
+        blocker = threading.Event()
+        # Releases the writer if the loop is stuck, so a failing test does not hang.
+        timer = threading.Timer(5, blocker.set)
+        timer.start()
+
+        async def run():
+            async with AsyncDatabaseConnector(DB_PATH, max_size=2, max_group=1) as db:
+                blocked = asyncio.ensure_future(db.run(lambda db: blocker.wait()))
+                calls = [asyncio.ensure_future(db.run(lambda db, i: i, i)) for i in range(10)]
+                ticks = 0
+                start = time.time()
+                while ticks < 10:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+                self.assertFalse(blocker.is_set())
+                self.assertLess(time.time() - start, 2)
+                blocker.set()
+                await blocked
+                self.assertEqual(await asyncio.gather(*calls), list(range(10)))
+        self.loop.run_until_complete(run())
+        timer.cancel()
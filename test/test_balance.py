@@ -0,0 +1,113 @@
+import datetime
+import os
+import unittest
+
+from core.balance import BalanceEngine, WEEKDAYS
+from core.database_connector import DatabaseConnector
+from core.database_types import Task, TrackEntry
+
+
+DB_PATH = "test_balance.db"
+
+
+def hours(h):
+    return datetime.timedelta(hours=h)
+
+
+class TestBalance(unittest.TestCase):
+
+    def setUp(self):
+        if os.path.isfile(DB_PATH):
+            os.remove(DB_PATH)
+        self.db = DatabaseConnector(DB_PATH)
+        self.work, self.pause = self.db.create_tasks([Task(user_uid=1, type_id=0), Task(user_uid=1, type_id=2)])
+        self.engine = BalanceEngine(self.db, 1)
+
+        # 8 hours from Monday to Friday, set on Monday 2017-01-30.
+        self.set_targets(datetime.datetime(2017, 1, 30, 7), {day: 8 * 3600 for day in WEEKDAYS[:5]})
+
+    def tearDown(self):
+        self.db.close()
+        if os.path.isfile(DB_PATH):
+            os.remove(DB_PATH)
+
+    def set_targets(self, timestamp, targets):
+        self.db.get_current_timestamp = lambda: timestamp
+        self.engine.set_targets(targets)
+        del self.db.get_current_timestamp
+
+    def track(self, task, begin, end=None):
+        entry = TrackEntry(task_uid=task.uid, timestamp_begin=begin, timestamp_end=end)
+        self.db.create_track_entry(entry)
+        return entry
+
+    def count_checkpoints(self):
+        c = self.db.cursor()
+        c.execute("SELECT COUNT(*) FROM `BalanceCheckpoints`;")
+        return c.fetchone()[0]
+
+    def test_targets(self):
+        """
+        Make sure that each day uses the targets that applied at the time.
+        """
+        self.set_targets(datetime.datetime(2017, 2, 6, 12), {"Mo": 4 * 3600})
+        self.assertEqual(self.engine.get_targets(datetime.date(2017, 2, 5))["Mo"], hours(8))
+        self.assertEqual(self.engine.get_targets(datetime.date(2017, 2, 6))["Mo"], hours(4))
+        self.assertEqual(self.engine.get_targets(datetime.date(2017, 2, 6))["Tu"], hours(0))
+        with self.assertRaises(KeyError):
+            self.engine.get_targets(datetime.date(2017, 1, 29))
+        with self.assertRaises(KeyError):
+            self.engine.set_targets({"Monday": 3600})
+
+    def test_balance(self):
+        """
+        Make sure that pauses do not count, the current day counts with its full target, and checkpoints are written
+        for the finished days.
+        """
+        d = datetime.datetime
+        self.track(self.work, d(2017, 1, 30, 8), d(2017, 1, 30, 18))
+        self.track(self.pause, d(2017, 1, 30, 12), d(2017, 1, 30, 13))
+        self.track(self.work, d(2017, 1, 31, 8), d(2017, 1, 31, 15))
+        self.track(self.work, d(2017, 2, 1, 8))
+
+        # Monday +2, Tuesday -1, Wednesday 3 of 8 hours so far.
+        self.assertEqual(self.engine.get_balance(now=d(2017, 2, 1, 11)), hours(2 - 1 - 5))
+        self.assertEqual(self.count_checkpoints(), 2)
+
+        # The open entry continues until now. Saturday and Sunday have no target.
+        self.assertEqual(self.engine.get_balance(now=d(2017, 2, 5, 11)), hours(2 - 1 + 8 + 16 + 16 + 24 + 11))
+        self.assertEqual(self.count_checkpoints(), 6)
+
+    def test_current_day(self):
+        """
+        Make sure that the closed and the open track entries of the current day are counted, but not the pauses.
+        """
+        d = datetime.datetime
+        self.track(self.work, d(2017, 1, 30, 8), d(2017, 1, 30, 10))
+        self.track(self.pause, d(2017, 1, 30, 10), d(2017, 1, 30, 11))
+        self.track(self.work, d(2017, 1, 30, 11))
+        self.track(self.pause, d(2017, 1, 30, 11, 30))
+        self.assertEqual(self.engine.get_balance(now=d(2017, 1, 30, 12)), hours(2 + 1 - 8))
+
+    def test_checkpoint_invalidation(self):
+        """
+        Make sure that changed track entries and targets are taken into account.
+        """
+        d = datetime.datetime
+        self.track(self.work, d(2017, 1, 30, 8), d(2017, 1, 30, 16))
+        entry = self.track(self.work, d(2017, 1, 31, 8), d(2017, 1, 31, 16))
+        now = d(2017, 2, 2, 0)
+        self.assertEqual(self.engine.get_balance(now=now), hours(-8 - 8))
+
+        entry.timestamp_end = d(2017, 1, 31, 20)
+        self.db.update_track_entry(entry)
+        self.assertEqual(self.count_checkpoints(), 1)
+        self.assertEqual(self.engine.get_balance(now=now), hours(4 - 8 - 8))
+
+        self.track(self.work, d(2017, 1, 30, 18), d(2017, 1, 30, 19))
+        self.assertEqual(self.count_checkpoints(), 0)
+        self.assertEqual(self.engine.get_balance(now=now), hours(1 + 4 - 8 - 8))
+
+        self.set_targets(d(2017, 2, 1, 9), {})
+        self.assertEqual(self.count_checkpoints(), 2)
+        self.assertEqual(self.engine.get_balance(now=now), hours(1 + 4))
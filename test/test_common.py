@@ -0,0 +1,75 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from collections import namedtuple
+from unittest import mock
+
+from core.common import Settings
+
+
+Dirs = namedtuple("Dirs", ["user_config_dir", "user_data_dir"])
+
+
+class TestSettings(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.settings = Settings(Dirs(os.path.join(self.directory, "config"), os.path.join(self.directory, "data")))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read_file(self):
+        with open(self.settings.config_file, "r") as f:
+            return json.load(f)
+
+    def test_get_and_set(self):
+        """
+        Make sure that settings are written to the file and that missing settings raise a KeyError.
+        """
+        with self.assertRaises(KeyError):
+            self.settings["a"]
+        self.settings["a"] = {"b": [1, 2]}
+        self.assertEqual(self.settings["a"], {"b": [1, 2]})
+        self.settings["a"]["b"].append(3)
+        self.assertEqual(self.read_file(), {"a": {"b": [1, 2]}})
+        with self.assertRaises(KeyError):
+            self.settings["c"]
+        self.assertEqual(os.listdir(os.path.dirname(self.settings.config_file)), ["config.json"])
+
+    def test_file_is_cached(self):
+        """
+        Make sure that the file is only read again after it was changed.
+        """
+        self.settings["a"] = 1
+        with mock.patch("core.common.open", side_effect=AssertionError("File was read"), create=True):
+            self.assertEqual(self.settings["a"], 1)
+
+        # Another process writes the file.
+        with open(self.settings.config_file, "w") as f:
+            json.dump({"a": 1, "b": 22}, f)
+        self.assertEqual(self.settings["b"], 22)
+        self.settings["c"] = 3
+        self.assertEqual(self.read_file(), {"a": 1, "b": 22, "c": 3})
+
+    def test_batch(self):
+        """
+        Make sure that a batch writes the file once and that a failed batch writes nothing.
+        """
+        with mock.patch("os.replace", wraps=os.replace) as replace, self.settings.batch():
+            self.settings["a"] = 1
+            with self.settings.batch():
+                self.settings["b"] = 2
+            self.assertEqual(self.settings["b"], 2)
+            self.assertFalse(os.path.isfile(self.settings.config_file))
+            self.settings.update({"c": 3, "d": 4})
+        self.assertEqual(replace.call_count, 1)
+        self.assertEqual(self.read_file(), {"a": 1, "b": 2, "c": 3, "d": 4})
+
+        with self.assertRaises(ValueError):
+            with self.settings.batch():
+                self.settings["a"] = 5
+                raise ValueError()
+        self.assertEqual(self.settings["a"], 1)
@@ -0,0 +1,148 @@
+import os
+import sqlite3
+import threading
+import unittest
+
+from core.connection_profile import ConnectionProfile
+from core.database_connector import DatabaseConnector
+from core.database_types import Task, TrackEntry
+
+
+DB_PATH = "test_connection_pool.db"
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        if os.path.isfile(DB_PATH):
+            os.remove(DB_PATH)
+        self.db = DatabaseConnector(DB_PATH, readers=2)
+
+    def tearDown(self):
+        self.db.close()
+        for path in (DB_PATH, DB_PATH + "-wal", DB_PATH + "-shm"):
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def test_snapshot(self):
+        """
+        Make sure that the reads inside reading() see one snapshot and that reads inside a transaction see the
+        uncommitted writes.
+        """
+        self.db.create_task(Task(user_uid=1, type_id=0))
+        with self.db.reading() as connection:
+            self.assertIsNot(connection, self.db._connection)
+            self.assertEqual(len(self.db.get_all_tasks(1)), 1)
+            thread = threading.Thread(target=self.db.create_task, args=(Task(user_uid=1, type_id=0),))
+            thread.start()
+            thread.join()
+            self.assertEqual(len(self.db.get_all_tasks(1)), 1)
+            self.assertRaises(sqlite3.OperationalError, connection.execute, "DELETE FROM `Tasks`;")
+        self.assertEqual(len(self.db.get_all_tasks(1)), 2)
+
+        with self.db.transaction():
+            self.db.create_task(Task(user_uid=1, type_id=0))
+            self.assertEqual(len(self.db.get_all_tasks(1)), 3)
+
+    def test_parallel_reads(self):
+        """
+        Make sure that every thread reads on its own connection and that a read connection is kept by an iterator
+        until it is exhausted.
+        """
+        self.db.create_tasks([Task(user_uid=1, type_id=0) for _ in range(3)])
+        barrier = threading.Barrier(2, timeout=5)
+        connections = []
+
+        def read():
+            with self.db.reading() as connection:
+                connections.append(connection)
+                barrier.wait()
+                self.assertEqual(len(self.db.get_open_tasks(1)), 3)
+
+        threads = [threading.Thread(target=read) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(connections)), 2)
+
+        iterator = self.db.iter_tasks(1, chunk_size=1)
+        next(iterator)
+        self.assertEqual(self.db._pool._idle.qsize(), 1)
+        self.assertIsNone(getattr(self.db._local, "reader", None))
+        self.assertEqual(len(list(iterator)), 2)
+        self.assertEqual(self.db._pool._idle.qsize(), 2)
+
+    def test_interleaved_iterators(self):
+        """
+        Consume two iterators in turns, close the first one, and make sure that the second one keeps its own connection
+        and snapshot and that both connections are returned to the pool.
+        """
+        self.db.create_tasks([Task(user_uid=1, type_id=0) for _ in range(6)])
+        first = self.db.iter_tasks(1, chunk_size=2)
+        second = self.db.iter_tasks(1, chunk_size=2)
+        next(first)
+        next(second)
+        next(first)
+        self.assertEqual(self.db._pool._idle.qsize(), 0)
+        first.close()
+        self.assertEqual(self.db._pool._idle.qsize(), 1)
+
+        # The second iterator still reads its snapshot, so it does not see the new task.
+        self.db.create_task(Task(user_uid=1, type_id=0))
+        self.assertEqual(len(list(second)), 5)
+        self.assertEqual(self.db._pool._idle.qsize(), 2)
+        self.assertEqual(getattr(self.db._local, "read_depth", 0), 0)
+
+        # An iterator that is started inside reading() reads the snapshot of the block and keeps no connection.
+        with self.db.reading():
+            iterator = self.db.iter_tasks(1, chunk_size=2)
+            next(iterator)
+            self.assertEqual(self.db._pool._idle.qsize(), 1)
+        self.assertEqual(len(list(iterator)), 6)
+
+    def test_suspended_iterator_in_transaction(self):
+        """
+        Start an iterator inside a transaction, leave the transaction, and make sure that the suspended iterator does
+        not keep the write lock.
+        """
+        self.db.create_tasks([Task(user_uid=1, type_id=0) for _ in range(3)])
+        with self.db.transaction():
+            iterator = self.db.iter_tasks(1, chunk_size=1)
+            next(iterator)
+        thread = threading.Thread(target=self.db.create_task, args=(Task(user_uid=1, type_id=0),))
+        thread.start()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(list(iterator)), 2)
+
+    def test_concurrent_writes(self):
+        """
+        Write from several threads and make sure that all writes are serialized.
+        """
+        task = Task(user_uid=1, type_id=0)
+        self.db.create_task(task)
+
+        def write():
+            for _ in range(20):
+                with self.db.transaction():
+                    entry = TrackEntry(task_uid=task.uid, timestamp_begin=self.db.get_current_timestamp())
+                    self.db.create_track_entry(entry)
+                    entry.timestamp_end = self.db.get_current_timestamp()
+                    self.db.update_track_entry(entry)
+
+        threads = [threading.Thread(target=write) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.db.get_track_entries(task.uid)), 80)
+        self.assertEqual(self.db.get_open_track_entries(task.uid), [])
+
+    def test_journal_mode(self):
+        """
+        Make sure that the reader pool is refused without the WAL journal mode.
+        """
+        self.db.close()
+        self.assertRaises(ValueError, DatabaseConnector, DB_PATH, ConnectionProfile(journal_mode="DELETE"), 2)
+        self.assertRaises(ValueError, DatabaseConnector, DB_PATH, "durable", 2)
@@ -1,8 +1,14 @@
+import datetime
 import os
+import sqlite3
 import unittest
+from unittest import mock
 
+from core.connection_profile import ConnectionProfile
 from core.database_connector import DatabaseConnector
 from core.database_types import User, Setting, Task, TrackEntry
+from core.database_types import create_table, insert_statement, select_statement, update_statement
+from core.task_filter import TaskFilter
 
 
 DB_PATH = "test.db"
@@ -22,6 +28,20 @@ class TestDatabase(unittest.TestCase):
         if os.path.isfile(DB_PATH):
             os.remove(DB_PATH)
 
+    def test_database_object(self):
+        """
+        Check the field accessors of the slot-based database objects.
+        """
+        now = datetime.datetime(2017, 1, 2, 8)
+        task = Task(uid=3, user_uid=1, title="Title", timestamp_orderby=now, type_id=0)
+        self.assertEqual(task.field_values(), (3, 1, "Title", None, False, now, 0, False))
+        self.assertEqual(list(task.field_items())[:3], [("uid", 3), ("user_uid", 1), ("title", "Title")])
+        self.assertEqual(task.sql_values()[5], 1483344000000000)
+        self.assertEqual(Task.from_row(task.sql_values()), task)
+        self.assertFalse(hasattr(task, "__dict__"))
+        with self.assertRaises(AttributeError):
+            task.unknown = 1
+
     def test_create_user(self):
         """
         Create multiple users and make sure that the uids differ.
@@ -34,6 +54,31 @@ class TestDatabase(unittest.TestCase):
         for uid in uids:
             self.assertGreater(uid, 0)
 
+    def test_create_existing_user(self):
+        """
+        Create the same user twice and make sure that the existing uid is found with a single read and that a new user
+        is inserted with a single statement after the read. Without RETURNING, the uid of the insert is used.
+        """
+        for returning in (True, False):
+            with mock.patch("core.database_connector._UPSERT_RETURNING", returning):
+                name = "Abel %s" % returning
+                user0 = User(name=name)
+                statements = []
+                db._connection.set_trace_callback(statements.append)
+                db.create_user(user0)
+                self.assertEqual(len(statements), 2)
+                self.assertTrue(statements[0].startswith("SELECT"))
+                del statements[:]
+                user1 = User(name=name)
+                db.create_user(user1)
+                db._connection.set_trace_callback(None)
+                self.assertEqual(user1.uid, user0.uid)
+                self.assertEqual(len(statements), 1)
+                self.assertTrue(statements[0].startswith("SELECT"))
+                self.assertEqual(db.get_user(name), user1)
+        with self.assertRaises(sqlite3.IntegrityError):
+            db._connection.execute("INSERT INTO `Users` (`name`, `deleted`) VALUES ('Abel True', 0);")
+
     def test_get_user(self):
         """
         Check that the uid is consistent between create_user() and get_user().
@@ -97,6 +142,46 @@ class TestDatabase(unittest.TestCase):
         self.assertEqual(setting2, setting3)
         self.assertNotEqual(setting0, setting3)
 
+    def test_settings_cache(self):
+        """
+        Make sure that settings are read from the cache after they were loaded, that writes go through to the cache,
+        and that the cache is dropped when a transaction is rolled back.
+        """
+        db.create_setting(Setting(user_uid=1, key="a", value=[1]))
+        db.create_setting(Setting(user_uid=1, key="a", value=[2]))
+        db.create_setting(Setting(user_uid=1, key="b", value="x"))
+        db.load_settings(1)
+
+        statements = []
+        db._connection.set_trace_callback(statements.append)
+        self.assertEqual(db.get_setting(1, "a").value, [2])
+        db.get_setting(1, "a").value.append(3)
+        self.assertEqual(db.get_setting(1, "a").value, [2])
+        with self.assertRaises(KeyError):
+            db.get_setting(1, "c")
+        db._connection.set_trace_callback(None)
+        self.assertEqual(statements, [])
+
+        db.create_setting(Setting(user_uid=1, key="c", value=True))
+        self.assertEqual(db.get_setting(1, "c").value, True)
+        with self.assertRaises(ValueError):
+            with db.transaction():
+                db.create_setting(Setting(user_uid=1, key="a", value=[4]))
+                raise ValueError()
+        self.assertEqual(db.get_setting(1, "a").value, [2])
+
+    def test_compact_settings(self):
+        """
+        Make sure that compaction only keeps the latest setting of the given keys.
+        """
+        for value in range(3):
+            db.create_setting(Setting(user_uid=1, key="a", value=value))
+            db.create_setting(Setting(user_uid=1, key="b", value=value))
+        self.assertEqual(db.compact_settings(1, ["a"]), 2)
+        self.assertEqual([s.value for s in db.get_setting_history(1, "a")], [2])
+        self.assertEqual([s.value for s in db.get_setting_history(1, "b")], [0, 1, 2])
+        self.assertEqual(db.get_setting(1, "a").value, 2)
+
     def test_create_task(self):
         """
         Create tasks and make sure that the uids differ.
@@ -111,6 +196,31 @@ class TestDatabase(unittest.TestCase):
         for uid in uids:
             self.assertGreater(uid, 0)
 
+    def test_get_task(self):
+        """
+        Create a task and make sure that get_task() returns it.
+        """
+        task0 = Task(user_uid=1, type_id=0, title="Title")
+        db.create_task(task0)
+        task1 = db.get_task(task0.uid)
+        self.assertEqual(task0, task1)
+        with self.assertRaises(KeyError):
+            db.get_task(task0.uid + 1)
+
+    def test_statement_cache(self):
+        """
+        Make sure that the statements are cached per class and table and that update statements depend on the columns.
+        """
+        self.assertIs(insert_statement(Task, "Tasks"), insert_statement(Task, "Tasks"))
+        self.assertIs(select_statement(Task, "Tasks"), select_statement(Task, "Tasks"))
+        self.assertIsNot(insert_statement(Task, "Tasks"), insert_statement(Task, "ArchivedTasks"))
+        self.assertNotEqual(insert_statement(Task, "Tasks"), insert_statement(TrackEntry, "Tasks"))
+        query0 = update_statement(Task, "Tasks", ("title",))
+        query1 = update_statement(Task, "Tasks", ("title", "done"))
+        self.assertEqual(query0, "UPDATE `Tasks` SET `title`=? WHERE `uid`=?;")
+        self.assertEqual(query1, "UPDATE `Tasks` SET `title`=?, `done`=? WHERE `uid`=?;")
+        self.assertIs(query0, update_statement(Task, "Tasks", ("title",)))
+
     def test_get_all_tasks(self):
         """
         Create tasks for different users and make sure that get_all_tasks() only returns the tasks for the given user.
@@ -141,6 +251,74 @@ class TestDatabase(unittest.TestCase):
         self.assertEqual(tasks1, tasks2)
         self.assertNotEqual(tasks0, tasks2)
 
+    def test_iter_tasks(self):
+        """
+        Make sure that iter_tasks() yields the same tasks as the list getters and fetches the rows in chunks.
+        """
+        tasks = [Task(user_uid=1, type_id=0, done=(i % 3 == 0)) for i in range(10)]
+        db.create_tasks(tasks)
+        statements = []
+        db._connection.set_trace_callback(statements.append)
+        iterator = db.iter_tasks(1, chunk_size=4)
+        self.assertEqual(next(iterator), tasks[0])
+        self.assertEqual(list(iterator), tasks[1:])
+        db._connection.set_trace_callback(None)
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(list(db.iter_tasks(1, open_only=True, chunk_size=1)), db.get_open_tasks(1))
+        self.assertEqual(list(db.iter_tasks(2)), [])
+
+    def test_get_tasks_page(self):
+        """
+        Create tasks with equal and different timestamp_orderby and make sure that the pages contain every matching
+        task exactly once.
+        """
+        tasks = db.create_tasks([Task(user_uid=1, type_id=i % 2, done=(i % 3 == 0)) for i in range(7)])
+        tasks += db.create_tasks([Task(user_uid=1, type_id=0), Task(user_uid=1, type_id=0, deleted=True),
+                                  Task(user_uid=2, type_id=0)])
+        tasks[0].timestamp_orderby += datetime.timedelta(hours=1)
+        db.update_task(tasks[0])
+        expected = tasks[1:8] + tasks[:1]
+
+        def all_pages(**kwargs):
+            pages = [db.get_tasks_page(1, limit=3, **kwargs)]
+            while len(pages[-1]) == 3:
+                pages.append(db.get_tasks_page(1, after=pages[-1][-1], limit=3, **kwargs))
+            return pages
+
+        pages = all_pages()
+        self.assertEqual([len(page) for page in pages], [3, 3, 2])
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual(sum(all_pages(done=False), []), [t for t in expected if not t.done])
+        self.assertEqual(sum(all_pages(type_id=1, done=True), []), [t for t in expected if t.type_id == 1 and t.done])
+
+    def test_get_tasks_with_filter(self):
+        """
+        Make sure that the filter criteria can be combined and that the title match treats % and _ literally.
+        """
+        d = datetime.datetime
+        tasks = db.create_tasks([Task(user_uid=1, type_id=0, title="Write report"),
+                                 Task(user_uid=1, type_id=0, title="100% done", done=True),
+                                 Task(user_uid=1, type_id=1, title="General work"),
+                                 Task(user_uid=1, type_id=2, title="Pause", deleted=True),
+                                 Task(user_uid=2, type_id=0, title="Write report")])
+        for i, task in enumerate(tasks):
+            task.timestamp_orderby = d(2017, 1, 2 + i)
+            db.update_task(task)
+
+        self.assertEqual(db.get_tasks(1), tasks[:3])
+        self.assertEqual(db.get_tasks(1, TaskFilter(type_id=0)), tasks[:2])
+        self.assertEqual(db.get_tasks(1, TaskFilter(type_id=0).where(done=False)), tasks[:1])
+        self.assertEqual(db.get_tasks(1, TaskFilter(type_id=[1, 2], deleted=None)), tasks[2:4])
+        self.assertEqual(db.get_tasks(1, TaskFilter(deleted=True)), tasks[3:4])
+        self.assertEqual(db.get_tasks(1, TaskFilter(title="REPORT")), tasks[:1])
+        self.assertEqual(db.get_tasks(1, TaskFilter(title="0%")), tasks[1:2])
+        self.assertEqual(db.get_tasks(1, TaskFilter(title="e_o")), [])
+        self.assertEqual(db.get_tasks(1, TaskFilter(begin=d(2017, 1, 3), end=d(2017, 1, 4))), tasks[1:2])
+        self.assertEqual(db.get_tasks(1, limit=2), tasks[:2])
+        self.assertEqual(db.get_tasks(1, after=tasks[0], limit=1), tasks[1:2])
+        self.assertEqual(db.get_task_totals(1, TaskFilter(type_id=0)), {tasks[0].uid: datetime.timedelta(),
+                                                                        tasks[1].uid: datetime.timedelta()})
+
     def test_update_task(self):
         """
         Create and update a task and make sure that the uid remains the same and that only the updated values are found.
@@ -162,6 +340,32 @@ class TestDatabase(unittest.TestCase):
         self.assertEqual(task.uid, uid)
         self.assertEqual(task.title, "New title")
 
+    def test_update_only_modified_fields(self):
+        """
+        Load a task, modify it, and make sure that only the modified columns are written, that a column can be set to
+        NULL, and that an unmodified task is not written at all.
+        """
+        task0 = Task(user_uid=1, type_id=0, title="Title", description="Description")
+        db.create_task(task0)
+        self.assertEqual(task0.dirty_fields(), ())
+        task1 = db.get_task(task0.uid)
+        self.assertEqual(task1.dirty_fields(), ())
+
+        statements = []
+        db._connection.set_trace_callback(statements.append)
+        db.update_task(task1)
+        self.assertEqual(statements, [])
+
+        task1.description = None
+        task1.done = True
+        self.assertEqual(task1.dirty_fields(), ("description", "done"))
+        db.update_task(task1)
+        db._connection.set_trace_callback(None)
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].startswith("UPDATE `Tasks` SET `description`=NULL, `done`=1 WHERE"))
+        self.assertEqual(task1.dirty_fields(), ())
+        self.assertEqual(db.get_task(task0.uid), task1)
+
     def test_delete_task(self):
         """
         Create and delete a task and make sure that get_open_tasks() and get_all_tasks() do not return the deleted task.
@@ -212,6 +416,42 @@ class TestDatabase(unittest.TestCase):
         self.assertNotEqual(entries1, entries2)
         self.assertEqual(entries1, entries3)
 
+    def test_iter_track_entries(self):
+        """
+        Create track entries for the tasks of different users and make sure that iter_track_entries() yields the
+        entries of the given user in the given range sorted by begin.
+        """
+        tasks = db.create_tasks([Task(user_uid=1, type_id=0), Task(user_uid=1, type_id=0), Task(user_uid=2, type_id=0)])
+        d = datetime.datetime
+        entries = db.create_track_entries([
+            TrackEntry(task_uid=tasks[1].uid, timestamp_begin=d(2017, 1, 2, 10), timestamp_end=d(2017, 1, 2, 11)),
+            TrackEntry(task_uid=tasks[0].uid, timestamp_begin=d(2017, 1, 2, 8), timestamp_end=d(2017, 1, 2, 9)),
+            TrackEntry(task_uid=tasks[2].uid, timestamp_begin=d(2017, 1, 2, 9)),
+            TrackEntry(task_uid=tasks[0].uid, timestamp_begin=d(2017, 1, 3, 8))
+        ])
+        self.assertEqual(list(db.iter_track_entries(1, chunk_size=1)), [entries[1], entries[0], entries[3]])
+        self.assertEqual(list(db.iter_track_entries(1, since=d(2017, 1, 2, 9), until=d(2017, 1, 3, 8))),
+                         [entries[0]])
+        self.assertEqual(list(db.iter_track_entries(2)), [entries[2]])
+
+    def test_iter_track_entries_windows(self):
+        """
+        Make sure that the entries are yielded in order if the range is read in many time windows of varying length.
+        """
+        tasks = db.create_tasks([Task(user_uid=1, type_id=0), Task(user_uid=1, type_id=0)])
+        begin = datetime.datetime(2017, 1, 2)
+        # Dense days followed by a long gap.
+        offsets = [datetime.timedelta(minutes=10*i) for i in range(50)] + [datetime.timedelta(days=400 + i)
+                                                                           for i in range(5)]
+        entries = db.create_track_entries([TrackEntry(task_uid=tasks[i % 2].uid, timestamp_begin=begin + offset)
+                                           for i, offset in enumerate(reversed(offsets))])
+        entries.sort(key=lambda entry: entry.timestamp_begin)
+        with mock.patch("core.database_connector._WINDOW_ROWS", 4), \
+                mock.patch("core.database_connector._INITIAL_WINDOW", 3600 * 1000000):
+            self.assertEqual(list(db.iter_track_entries(1)), entries)
+            self.assertEqual(list(db.iter_track_entries(1, since=begin + datetime.timedelta(hours=2))),
+                             entries[12:])
+
     def test_get_open_track_entries_for_task(self):
         """
         Create open and closed track entries and make sure that get_open_track_entries_for_task() only returns the open
@@ -239,7 +479,8 @@ class TestDatabase(unittest.TestCase):
         uid = entry0.uid
 
         # Perform an update.
-        entry0.timestamp_begin = "some text"
+        timestamp = datetime.datetime(2017, 1, 2, 8, 30, 15, 123456)
+        entry0.timestamp_begin = timestamp
         db.update_track_entry(entry0)
 
         # Check that the updated track entry has the same uid and that the old track entry is not found anymore.
@@ -247,7 +488,312 @@ class TestDatabase(unittest.TestCase):
         self.assertEqual(len(entries), 1)
         entry = entries[0]
         self.assertEqual(entry.uid, uid)
-        self.assertEqual(entry.timestamp_begin, "some text")
+        self.assertEqual(entry.timestamp_begin, timestamp)
+
+    def test_create_tasks(self):
+        """
+        Create tasks in bulk and make sure that the uids are set and match the database rows.
+        """
+        user_uid = 1
+        db.create_task(Task(user_uid=user_uid, type_id=0, title="single"))
+        tasks = [Task(user_uid=user_uid, type_id=0, title="bulk %d" % i) for i in range(10)]
+        created = db.create_tasks(iter(tasks))
+        self.assertEqual(created, tasks)
+        self.assertEqual(len(set(task.uid for task in tasks)), len(tasks))
+        self.assertEqual(db.get_all_tasks(user_uid)[1:], tasks)
+        self.assertEqual(db.create_tasks([]), [])
+
+    def test_create_track_entries(self):
+        """
+        Create track entries in bulk and make sure that the uids are set and match the database rows.
+        """
+        now = db.get_current_timestamp()
+        entries = [TrackEntry(task_uid=i % 2, timestamp_begin=now) for i in range(10)]
+        db.create_track_entries(entries)
+        self.assertEqual(db.get_track_entries(0), entries[0::2])
+        self.assertEqual(db.get_track_entries(1), entries[1::2])
+
+    def test_update_track_entries(self):
+        """
+        Update track entries in bulk and make sure that only the not-None values are written.
+        """
+        task_uid = 1
+        now = db.get_current_timestamp()
+        end = now + datetime.timedelta(hours=1)
+        later = now + datetime.timedelta(hours=2)
+        entries = db.create_track_entries(TrackEntry(task_uid=task_uid, timestamp_begin=now) for _ in range(4))
+        updates = [TrackEntry(uid=entries[0].uid, task_uid=task_uid, timestamp_end=end),
+                   TrackEntry(uid=entries[1].uid, task_uid=task_uid, timestamp_end=end),
+                   TrackEntry(uid=entries[2].uid, task_uid=task_uid, timestamp_begin=later)]
+        db.update_track_entries(updates)
+        entries = db.get_track_entries(task_uid)
+        self.assertEqual([(e.timestamp_begin, e.timestamp_end) for e in entries],
+                         [(now, end), (now, end), (now, None), (later, None)])
+
+    def test_task_totals(self):
+        """
+        Create, close, edit, and delete track entries and make sure that the task totals follow.
+        """
+        user_uid = 1
+        tasks = db.create_tasks(Task(user_uid=user_uid, type_id=0) for _ in range(3))
+        begin = datetime.datetime(2017, 1, 2, 8)
+        hour = datetime.timedelta(hours=1)
+        entries = [TrackEntry(task_uid=tasks[0].uid, timestamp_begin=begin, timestamp_end=begin+hour),
+                   TrackEntry(task_uid=tasks[0].uid, timestamp_begin=begin, timestamp_end=begin+2*hour),
+                   TrackEntry(task_uid=tasks[1].uid, timestamp_begin=begin)]
+        db.create_track_entries(entries)
+        self.assertEqual(db.get_task_totals(user_uid), {tasks[0].uid: 3*hour, tasks[1].uid: 0*hour,
+                                                        tasks[2].uid: 0*hour})
+
+        # Close the open entry, move an entry to another task, and delete an entry.
+        entries[2].timestamp_end = begin + 4*hour
+        entries[1].task_uid = tasks[2].uid
+        entries[0].deleted = True
+        db.update_track_entries(entries)
+        self.assertEqual(db.get_task_totals(user_uid), {tasks[0].uid: 0*hour, tasks[1].uid: 4*hour,
+                                                        tasks[2].uid: 2*hour})
+        self.assertEqual(db.get_task_total(tasks[1].uid), 4*hour)
+
+        # Finished tasks are not returned.
+        tasks[1].done = True
+        db.update_task(tasks[1])
+        self.assertEqual(set(db.get_task_totals(user_uid)), {tasks[0].uid, tasks[2].uid})
+
+    def test_integer_timestamps(self):
+        """
+        Make sure that timestamps are stored as integer microseconds and converted back to the same datetime.
+        """
+        begin = datetime.datetime(1970, 1, 2, 0, 0, 1, 5)
+        end = datetime.datetime(2017, 6, 30, 23, 59, 59, 999999)
+        entry0 = TrackEntry(task_uid=1, timestamp_begin=begin, timestamp_end=end)
+        db.create_track_entry(entry0)
+        c = db._connection.cursor()
+        c.execute("SELECT `timestamp_begin`, `timestamp_end` FROM `TrackEntries` WHERE `uid`=?;", (entry0.uid,))
+        self.assertEqual(c.fetchone(), (86401000005, 1498867199999999))
+        entry1 = db.get_track_entries(1)[0]
+        self.assertEqual(entry0, entry1)
+
+    def test_transaction(self):
+        """
+        Make sure that the writes inside a transaction are committed together and rolled back together.
+        """
+        user_uid = 1
+        with db.transaction():
+            for _ in range(3):
+                db.create_task(Task(user_uid=user_uid, type_id=0))
+        self.assertEqual(len(db.get_all_tasks(user_uid)), 3)
+
+        with self.assertRaises(ValueError):
+            with db.transaction():
+                for _ in range(3):
+                    db.create_task(Task(user_uid=user_uid, type_id=0))
+                raise ValueError()
+        self.assertEqual(len(db.get_all_tasks(user_uid)), 3)
+
+    def test_nested_transaction(self):
+        """
+        Make sure that a failing nested transaction only rolls back its own writes.
+        """
+        user_uid = 1
+        with db.transaction():
+            db.create_task(Task(user_uid=user_uid, type_id=0, title="outer"))
+            try:
+                with db.transaction():
+                    db.create_task(Task(user_uid=user_uid, type_id=0, title="inner"))
+                    raise ValueError()
+            except ValueError:
+                pass
+            with db.transaction():
+                db.create_task(Task(user_uid=user_uid, type_id=0, title="second inner"))
+        titles = [task.title for task in db.get_all_tasks(user_uid)]
+        self.assertEqual(titles, ["outer", "second inner"])
+
+    def test_rollback_restores_objects(self):
+        """
+        Make sure that the objects of rolled back updates and inserts are dirty again, so the next update writes them,
+        and that the objects of a savepoint that was released are restored if the outer transaction is rolled back.
+        """
+        task = Task(user_uid=1, type_id=0, title="Title")
+        db.create_task(task)
+        task.title = "Modified"
+        with self.assertRaises(ValueError):
+            with db.transaction():
+                db.update_task(task)
+                with db.transaction():
+                    task.description = "Description"
+                    db.update_task(task)
+                inserted = Task(user_uid=1, type_id=0)
+                db.create_task(inserted)
+                raise ValueError()
+        self.assertEqual(task.dirty_fields(), ("title", "description"))
+        self.assertIsNone(inserted.uid)
+        self.assertIsNone(inserted.dirty_fields())
+
+        with db.transaction():
+            db.update_task(task)
+            try:
+                with db.transaction():
+                    task.title = "Inner"
+                    db.update_task(task)
+                    raise ValueError()
+            except ValueError:
+                pass
+            self.assertEqual(task.dirty_fields(), ("title",))
+        self.assertEqual(db.get_task(task.uid).title, "Modified")
+        db.update_task(task)
+        self.assertEqual(db.get_task(task.uid).title, "Inner")
+
+    def test_transaction_commits_once(self):
+        """
+        Make sure that all writes inside a transaction end up in a single commit.
+        """
+        statements = []
+        db._connection.set_trace_callback(statements.append)
+        with db.transaction():
+            for _ in range(5):
+                db.create_track_entry(TrackEntry(task_uid=1, timestamp_begin=db.get_current_timestamp()))
+        db._connection.set_trace_callback(None)
+        self.assertEqual(statements.count("COMMIT;"), 1)
+
+    def test_connection_profile(self):
+        """
+        Open the database with different connection profiles and make sure that the settings are applied.
+        """
+        def pragmas(connector):
+            c = connector._connection.cursor()
+            values = []
+            for name in ("journal_mode", "synchronous", "cache_size", "temp_store", "busy_timeout"):
+                c.execute("PRAGMA %s;" % name)
+                values.append(c.fetchone()[0])
+            return values
+
+        self.assertEqual(pragmas(db), ["wal", 1, -8000, 2, 5000])
+        db.close()
+        db2 = DatabaseConnector(DB_PATH, "durable")
+        self.assertEqual(pragmas(db2), ["delete", 2, -2000, 0, 5000])
+        db2.close()
+        db2 = DatabaseConnector(DB_PATH, ConnectionProfile(journal_mode="DELETE", synchronous="OFF", busy_timeout=10))
+        self.assertEqual(pragmas(db2), ["delete", 0, -8000, 2, 10])
+        db2.close()
+        with self.assertRaises(KeyError):
+            DatabaseConnector(DB_PATH, "unknown")
+
+    def test_query_plans_use_indexes(self):
+        """
+        Make sure that the task, track entry, and setting queries are answered with an index search and without a
+        temporary b-tree for sorting.
+        """
+        queries = [
+            ("SELECT * FROM `Tasks` WHERE `user_uid`=? AND `deleted`=0 "
+             "ORDER BY `timestamp_orderby` ASC, `uid` ASC;", (1,)),
+            ("SELECT * FROM `Tasks` WHERE `user_uid`=? AND `done`=0 AND `deleted`=0 "
+             "ORDER BY `timestamp_orderby` ASC, `uid` ASC;", (1,)),
+            ("SELECT * FROM `TrackEntries` WHERE `task_uid`=? ORDER BY `timestamp_begin` ASC;", (1,)),
+            ("SELECT * FROM `TrackEntries` WHERE `task_uid`=? AND `timestamp_end` IS NULL "
+             "ORDER BY `timestamp_begin` ASC;", (1,)),
+            ("SELECT * FROM `Settings` WHERE `user_uid`=? AND `key`=? "
+             "ORDER BY `timestamp_create` DESC, `uid` DESC;", (1, "testkey")),
+            ("SELECT * FROM `Tasks` WHERE `user_uid`=? AND `type_id`=? AND `done`=? AND `deleted`=0 "
+             "AND `timestamp_orderby`>=? AND (`timestamp_orderby`>? OR `uid`>?) "
+             "ORDER BY `timestamp_orderby` ASC, `uid` ASC LIMIT ?;", (1, 0, False, 0, 0, 0, 10))
+        ]
+        c = db._connection.cursor()
+        for query, args in queries:
+            c.execute("EXPLAIN QUERY PLAN " + query, args)
+            plan = " ".join(row[-1] for row in c.fetchall())
+            self.assertIn("USING INDEX", plan)
+            self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_task_query_indexes(self):
+        """
+        Make sure that the task queries of the filters that are used search the expected Tasks index.
+        """
+        queries = [
+            (TaskFilter(), "Tasks_all (user_uid=? AND deleted=?)"),
+            (TaskFilter(done=False), "Tasks_open (user_uid=? AND done=? AND deleted=?)"),
+            (TaskFilter(done=True), "Tasks_open (user_uid=? AND done=? AND deleted=?)"),
+            (TaskFilter(type_id=0), "Tasks_all (user_uid=? AND deleted=?)"),
+            (TaskFilter(type_id=[1, 2]), "Tasks_all (user_uid=? AND deleted=?)"),
+            (TaskFilter(type_id=0, done=False), "Tasks_type_done (user_uid=? AND type_id=? AND done=? AND deleted=?)")
+        ]
+        c = db._connection.cursor()
+        for task_filter, index in queries:
+            condition, params = task_filter.to_sql()
+            c.execute("EXPLAIN QUERY PLAN SELECT * FROM `Tasks` WHERE `user_uid`=? AND " + condition +
+                      " ORDER BY `timestamp_orderby` ASC, `uid` ASC LIMIT 10;", [1] + params)
+            plan = " ".join(row[-1] for row in c.fetchall())
+            self.assertIn(index, plan)
+            self.assertNotIn("TEMP B-TREE", plan)
+
+        # The open tasks of get_task_totals() with the default filter and the next page of the open tasks.
+        c.execute("EXPLAIN QUERY PLAN SELECT `Tasks`.`uid`, `TaskTotals`.`duration` FROM `Tasks` "
+                  "LEFT JOIN `TaskTotals` ON `TaskTotals`.`task_uid`=`Tasks`.`uid` "
+                  "WHERE `Tasks`.`user_uid`=? AND `done`=? AND `deleted`=?;", (1, False, False))
+        self.assertIn("Tasks_open (user_uid=? AND done=? AND deleted=?)", " ".join(row[-1] for row in c.fetchall()))
+        c.execute("EXPLAIN QUERY PLAN SELECT * FROM `Tasks` WHERE `user_uid`=? AND `done`=? AND `deleted`=? "
+                  "AND `timestamp_orderby`>=? AND (`timestamp_orderby`>? OR `uid`>?) "
+                  "ORDER BY `timestamp_orderby` ASC, `uid` ASC LIMIT ?;", (1, False, False, 0, 0, 0, 10))
+        plan = " ".join(row[-1] for row in c.fetchall())
+        self.assertIn("Tasks_open (user_uid=? AND done=? AND deleted=? AND timestamp_orderby>?)", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_track_entry_window_plan(self):
+        """
+        Make sure that the track entry windows of iter_track_entries() start from the tasks of the user and search the
+        entries of each task by begin, so the entries of other users are not read.
+        """
+        c = db._connection.cursor()
+        c.execute("EXPLAIN QUERY PLAN SELECT `TrackEntries`.* FROM `Tasks` "
+                  "CROSS JOIN `TrackEntries` ON `TrackEntries`.`task_uid`=`Tasks`.`uid` "
+                  "WHERE `Tasks`.`user_uid`=? AND `TrackEntries`.`timestamp_begin`>=? "
+                  "AND `TrackEntries`.`timestamp_begin`<? "
+                  "ORDER BY `TrackEntries`.`timestamp_begin` ASC, `TrackEntries`.`uid` ASC;", (1, 0, 1))
+        searches = [row[-1] for row in c.fetchall() if row[-1].startswith("SEARCH")]
+        self.assertIn("SEARCH Tasks USING COVERING INDEX", searches[0])
+        self.assertIn("TrackEntries_task (task_uid=? AND timestamp_begin>? AND timestamp_begin<?)", searches[1])
+
+    def test_archive_plan(self):
+        """
+        Make sure that the archive finds the deleted track entries before the cutoff with the partial index.
+        """
+        c = db._connection.cursor()
+        c.execute("EXPLAIN QUERY PLAN SELECT * FROM `TrackEntries` WHERE `deleted`=1 AND `timestamp_begin`<?;", (1,))
+        self.assertIn("TrackEntries_deleted (timestamp_begin<?)", " ".join(row[-1] for row in c.fetchall()))
+
+    def test_create_table_in_transaction(self):
+        """
+        Make sure that create_table() does not commit the transaction that is open on the connection.
+        """
+        with self.assertRaises(ValueError):
+            with db.transaction():
+                db.create_task(Task(user_uid=1, type_id=0))
+                create_table(db._connection, "Copies", Task)
+                raise ValueError()
+        c = db._connection.cursor()
+        c.execute("SELECT COUNT(*) FROM `sqlite_master` WHERE `name`='Copies';")
+        self.assertEqual(c.fetchone()[0], 0)
+        self.assertEqual(db.get_all_tasks(1), [])
+
+    def test_indexes_added_to_existing_database(self):
+        """
+        Create a database file without indexes and make sure that the indexes are added when the file is opened.
+        """
+        db.close()
+        os.remove(DB_PATH)
+        connection = sqlite3.connect(DB_PATH)
+        for table_name, object_class in (("Users", User), ("Settings", Setting), ("Tasks", Task),
+                                         ("TrackEntries", TrackEntry)):
+            create_table(connection, table_name, object_class)
+        connection.commit()
+        connection.close()
+
+        db2 = DatabaseConnector(DB_PATH)
+        c = db2._connection.cursor()
+        c.execute("SELECT `name` FROM `sqlite_master` WHERE `type`='index' AND `name` NOT LIKE 'sqlite_%';")
+        names = set(row[0] for row in c.fetchall())
+        db2.close()
+        self.assertEqual(names, {"Settings_latest", "Tasks_open", "Tasks_all", "Tasks_type_done", "TrackEntries_task",
+                                 "TrackEntries_open", "TrackEntries_deleted", "Users_name", "TrackEntries_length"})
 
 
 if __name__ == "__main__":
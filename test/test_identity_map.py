@@ -0,0 +1,98 @@
+import datetime
+import gc
+import os
+import unittest
+
+from core.database_connector import DatabaseConnector
+from core.database_types import Task, TrackEntry
+
+
+DB_PATH = "test_identity_map.db"
+
+
+class TestIdentityMap(unittest.TestCase):
+
+    def setUp(self):
+        if os.path.isfile(DB_PATH):
+            os.remove(DB_PATH)
+        self.db = DatabaseConnector(DB_PATH, identity_map=True)
+
+    def tearDown(self):
+        self.db.close()
+        if os.path.isfile(DB_PATH):
+            os.remove(DB_PATH)
+
+    def test_same_object(self):
+        """
+        Make sure that inserted and repeatedly read rows are returned as the same object and that hits and misses are
+        counted.
+        """
+        identity_map = self.db.identity_map
+        task = Task(user_uid=1, type_id=0, title="Title")
+        self.db.create_task(task)
+        self.assertIs(self.db.get_task(task.uid), task)
+        self.assertIs(self.db.get_all_tasks(1)[0], task)
+        self.assertIs(self.db.get_tasks_page(1)[0], task)
+        self.assertEqual((identity_map.hits, identity_map.misses), (3, 0))
+
+        entry = TrackEntry(task_uid=task.uid, timestamp_begin=datetime.datetime(2017, 1, 2, 8))
+        self.db.create_track_entry(entry)
+        del entry
+        gc.collect()
+        entries = self.db.get_open_track_entries(task.uid)
+        self.assertIs(self.db.get_track_entries(task.uid)[0], entries[0])
+        self.assertIs(next(self.db.iter_track_entries(1)), entries[0])
+        self.assertEqual((identity_map.hits, identity_map.misses), (5, 1))
+
+        # Objects that are not used anymore are dropped.
+        self.assertEqual(len(identity_map), 2)
+        del task, entries
+        gc.collect()
+        self.assertEqual(len(identity_map), 0)
+
+    def test_update(self):
+        """
+        Update a row through another object and make sure that the cached object gets the written values, but keeps its
+        own modifications.
+        """
+        task = Task(user_uid=1, type_id=0, title="Title", description="Description")
+        self.db.create_task(task)
+        task.description = "Modified"
+        other = Task(uid=task.uid, title="New title", description="Other")
+        self.db.update_task(other)
+        self.assertEqual(task.title, "New title")
+        self.assertEqual(task.description, "Modified")
+        self.assertEqual(task.dirty_fields(), ("description",))
+        self.db.update_task(task)
+        self.assertEqual(self.db.get_task(task.uid).description, "Modified")
+
+    def test_external_change(self):
+        """
+        Change a row without the connector and make sure that the next read refreshes the cached object.
+        """
+        task = Task(user_uid=1, type_id=0, title="Title")
+        self.db.create_task(task)
+        task.description = "Modified"
+        with self.db.transaction():
+            self.db.cursor().execute("UPDATE `Tasks` SET `title`='External', `done`=1 WHERE `uid`=?;", (task.uid,))
+        self.assertIs(self.db.get_task(task.uid), task)
+        self.assertEqual((task.title, task.done, task.description), ("External", True, "Modified"))
+        self.assertEqual(task.dirty_fields(), ("description",))
+
+    def test_rollback(self):
+        """
+        Make sure that a rolled back insert is removed from the map and that a cached object that received the fields of
+        a rolled back update gets its old values back.
+        """
+        task = Task(user_uid=1, type_id=0, title="Title")
+        self.db.create_task(task)
+        entry = TrackEntry(task_uid=task.uid, timestamp_begin=datetime.datetime(2017, 1, 2, 8))
+        with self.assertRaises(ValueError):
+            with self.db.transaction():
+                self.db.update_task(Task(uid=task.uid, title="New title"))
+                self.db.create_track_entry(entry)
+                raise ValueError()
+        self.assertEqual(task.title, "Title")
+        self.assertEqual(task.dirty_fields(), ())
+        self.assertIsNone(entry.uid)
+        self.assertEqual(len(self.db.identity_map), 1)
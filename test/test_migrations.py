@@ -0,0 +1,161 @@
+import datetime
+import os
+import sqlite3
+import unittest
+
+from core.database_connector import DatabaseConnector
+from core.database_migrations import MIGRATIONS, SCHEMA_VERSION, get_schema_version, migrate
+from core.database_types import Task
+
+
+DB_PATH = "test_migrations.db"
+
+
+class TestMigrations(unittest.TestCase):
+
+    def setUp(self):
+        if os.path.isfile(DB_PATH):
+            os.remove(DB_PATH)
+
+    def tearDown(self):
+        if os.path.isfile(DB_PATH):
+            os.remove(DB_PATH)
+
+    @staticmethod
+    def _create_unversioned_database():
+        """
+        Create a database file the way it was created before the schema was versioned and insert a user and a task.
+        """
+        connection = sqlite3.connect(DB_PATH)
+        MIGRATIONS[0](connection)
+        connection.execute("INSERT INTO `Users` VALUES (NULL, 'Abel', 0);")
+        connection.execute("INSERT INTO `Tasks` VALUES (NULL, 1, 'Title', NULL, 0, "
+                           "'2017-01-02T08:00:00:000000', 0, 0);")
+        connection.execute("INSERT INTO `TrackEntries` VALUES (NULL, 1, '2017-01-02T08:00:00:000001', "
+                           "'2017-01-02T09:30:15:250000', 0);")
+        connection.execute("INSERT INTO `TrackEntries` VALUES (NULL, 1, '2017-01-03T08:00:00:000000', NULL, 0);")
+        connection.execute("INSERT INTO `Settings` VALUES (NULL, 1, '2017-01-02T08:00:00:000000', 'key', '7');")
+        connection.commit()
+        connection.close()
+
+    def test_new_database(self):
+        """
+        Create a new database and make sure that it has the current schema version.
+        """
+        db = DatabaseConnector(DB_PATH)
+        self.assertEqual(get_schema_version(db._connection), SCHEMA_VERSION)
+        db.close()
+
+    def test_current_database_runs_no_ddl(self):
+        """
+        Open an up-to-date database and make sure that only the schema version is read.
+        """
+        DatabaseConnector(DB_PATH).close()
+        statements = []
+        connection = sqlite3.connect(DB_PATH)
+        connection.set_trace_callback(statements.append)
+        migrate(connection)
+        connection.close()
+        self.assertEqual(statements, ["PRAGMA user_version;"])
+
+    def test_upgrade_unversioned_database(self):
+        """
+        Upgrade a database that was created before the schema was versioned and make sure that the data is kept.
+        """
+        self._create_unversioned_database()
+        db = DatabaseConnector(DB_PATH)
+        self.assertEqual(get_schema_version(db._connection), SCHEMA_VERSION)
+        self.assertEqual(db.get_user("Abel").uid, 1)
+        tasks = db.get_all_tasks(1)
+        self.assertEqual(len(tasks), 1)
+        self.assertEqual(tasks[0].title, "Title")
+        db.close()
+
+    def test_upgrade_text_timestamps(self):
+        """
+        Upgrade a database with text timestamps and make sure that they are converted to the same datetimes.
+        """
+        self._create_unversioned_database()
+        db = DatabaseConnector(DB_PATH)
+        task = db.get_all_tasks(1)[0]
+        self.assertEqual(task.timestamp_orderby, datetime.datetime(2017, 1, 2, 8))
+        entries = db.get_track_entries(task.uid)
+        self.assertEqual([(e.timestamp_begin, e.timestamp_end) for e in entries],
+                         [(datetime.datetime(2017, 1, 2, 8, 0, 0, 1), datetime.datetime(2017, 1, 2, 9, 30, 15, 250000)),
+                          (datetime.datetime(2017, 1, 3, 8), None)])
+        self.assertEqual(db.get_open_track_entries(task.uid), entries[1:])
+        self.assertEqual(db.get_setting(1, "key").timestamp_create, datetime.datetime(2017, 1, 2, 8))
+        self.assertEqual(db.get_task_totals(1), {task.uid: datetime.timedelta(hours=1, minutes=30, seconds=15,
+                                                                               microseconds=249999)})
+        c = db.cursor()
+        c.execute("SELECT `day`, `duration` FROM `RollupsDay`;")
+        self.assertEqual(c.fetchall(), [(17168, 5415249999)])
+
+        # Make sure that the uids keep counting after the rebuilt tables.
+        new_task = Task(user_uid=1, type_id=0)
+        db.create_task(new_task)
+        self.assertEqual(new_task.uid, 2)
+        db.close()
+
+    def test_upgrade_step_by_step(self):
+        """
+        Apply the migration steps one at a time and make sure that every intermediate version is reached.
+        """
+        self._create_unversioned_database()
+        connection = sqlite3.connect(DB_PATH)
+        for version in range(1, SCHEMA_VERSION+1):
+            migrate(connection, version)
+            self.assertEqual(get_schema_version(connection), version)
+        connection.close()
+
+    def test_merge_duplicate_users(self):
+        """
+        Upgrade a database with two users of the same name and make sure that they are merged into the first one.
+        """
+        self._create_unversioned_database()
+        connection = sqlite3.connect(DB_PATH)
+        connection.execute("INSERT INTO `Users` VALUES (NULL, 'Bert', 0);")
+        connection.execute("INSERT INTO `Users` VALUES (NULL, 'Abel', 0);")
+        connection.execute("INSERT INTO `Tasks` VALUES (NULL, 3, 'Second', NULL, 0, "
+                           "'2017-01-02T09:00:00:000000', 0, 0);")
+        connection.execute("INSERT INTO `TrackEntries` VALUES (NULL, 2, '2017-01-02T10:00:00:000000', "
+                           "'2017-01-02T11:00:00:000000', 0);")
+        connection.commit()
+        connection.close()
+
+        db = DatabaseConnector(DB_PATH)
+        c = db.cursor()
+        c.execute("SELECT `uid`, `name` FROM `Users` ORDER BY `uid`;")
+        self.assertEqual(c.fetchall(), [(1, "Abel"), (2, "Bert")])
+        self.assertEqual([task.title for task in db.get_all_tasks(1)], ["Title", "Second"])
+        c.execute("SELECT DISTINCT `user_uid` FROM `RollupsDay`;")
+        self.assertEqual(c.fetchall(), [(1,)])
+        db.close()
+
+    def test_failing_migration_is_rolled_back(self):
+        """
+        Make sure that a failing migration leaves the database untouched.
+        """
+        self._create_unversioned_database()
+        connection = sqlite3.connect(DB_PATH)
+        connection.execute("CREATE TABLE `Blocker` (`x` INTEGER);")
+        connection.execute("CREATE VIEW `Tasks_open` AS SELECT * FROM `Blocker`;")
+        connection.commit()
+        with self.assertRaises(sqlite3.Error):
+            migrate(connection)
+        self.assertEqual(get_schema_version(connection), 0)
+        connection.close()
+
+    def test_newer_database_is_rejected(self):
+        """
+        Make sure that a database with a newer schema version is not opened.
+        """
+        connection = sqlite3.connect(DB_PATH)
+        connection.execute("PRAGMA user_version = %d;" % (SCHEMA_VERSION+1))
+        connection.close()
+        with self.assertRaises(RuntimeError):
+            DatabaseConnector(DB_PATH)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import datetime
+import os
+import unittest
+
+from core import reporting
+from core.database_connector import DatabaseConnector
+from core.database_types import Task, TrackEntry
+from core.reporting import ReportRow
+
+
+DB_PATH = "test_reporting.db"
+
+
+def hours(h):
+    return datetime.timedelta(hours=h)
+
+
+class TestReporting(unittest.TestCase):
+
+    def setUp(self):
+        if os.path.isfile(DB_PATH):
+            os.remove(DB_PATH)
+        self.db = DatabaseConnector(DB_PATH)
+
+        # Two work tasks and a pause task of user 1 and a task of user 2.
+        self.tasks = self.db.create_tasks([Task(user_uid=1, type_id=0), Task(user_uid=1, type_id=0),
+                                           Task(user_uid=1, type_id=2), Task(user_uid=2, type_id=0)])
+        t = [task.uid for task in self.tasks]
+        d = datetime.datetime
+        self.db.create_track_entries([
+            TrackEntry(task_uid=t[0], timestamp_begin=d(2017, 1, 30, 8), timestamp_end=d(2017, 1, 30, 12)),
+            TrackEntry(task_uid=t[2], timestamp_begin=d(2017, 1, 30, 12), timestamp_end=d(2017, 1, 30, 13)),
+            # Crosses midnight and the end of the month.
+            TrackEntry(task_uid=t[1], timestamp_begin=d(2017, 1, 31, 22), timestamp_end=d(2017, 2, 1, 2)),
+            # Deleted entries do not count.
+            TrackEntry(task_uid=t[1], timestamp_begin=d(2017, 2, 1, 8), timestamp_end=d(2017, 2, 1, 9), deleted=True),
+            # Next week.
+            TrackEntry(task_uid=t[0], timestamp_begin=d(2017, 2, 6, 8), timestamp_end=d(2017, 2, 6, 10)),
+            # Open entry.
+            TrackEntry(task_uid=t[1], timestamp_begin=d(2017, 2, 7, 8)),
+            # Other user.
+            TrackEntry(task_uid=t[3], timestamp_begin=d(2017, 1, 30, 8), timestamp_end=d(2017, 1, 30, 9))
+        ])
+        self.begin = d(2017, 1, 1)
+        self.end = d(2017, 3, 1)
+        self.now = d(2017, 2, 7, 9, 30)
+
+    def tearDown(self):
+        self.db.close()
+        if os.path.isfile(DB_PATH):
+            os.remove(DB_PATH)
+
+    def test_per_day_and_task(self):
+        """
+        Make sure that entries are split at midnight and open entries count until now.
+        """
+        t = [task.uid for task in self.tasks]
+        rows = reporting.summarize(self.db, 1, self.begin, self.end, reporting.DAY, reporting.TASK, now=self.now)
+        date = datetime.date
+        self.assertEqual(rows, [ReportRow(date(2017, 1, 30), t[0], 0, hours(4)),
+                                ReportRow(date(2017, 1, 30), t[2], 2, hours(1)),
+                                ReportRow(date(2017, 1, 31), t[1], 0, hours(2)),
+                                ReportRow(date(2017, 2, 1), t[1], 0, hours(2)),
+                                ReportRow(date(2017, 2, 6), t[0], 0, hours(2)),
+                                ReportRow(date(2017, 2, 7), t[1], 0, hours(1.5))])
+
+    def test_per_week_and_type(self):
+        """
+        Make sure that weeks start on Monday and that the rows are grouped by type.
+        """
+        rows = reporting.summarize(self.db, 1, self.begin, self.end, reporting.WEEK, reporting.TYPE, now=self.now)
+        date = datetime.date
+        self.assertEqual(rows, [ReportRow(date(2017, 1, 30), None, 0, hours(8)),
+                                ReportRow(date(2017, 1, 30), None, 2, hours(1)),
+                                ReportRow(date(2017, 2, 6), None, 0, hours(3.5))])
+
+    def test_per_month(self):
+        """
+        Make sure that the entry that crosses the end of the month is split between both months.
+        """
+        rows = reporting.summarize(self.db, 1, self.begin, self.end, reporting.MONTH, None, now=self.now)
+        date = datetime.date
+        self.assertEqual(rows, [ReportRow(date(2017, 1, 1), None, None, hours(7)),
+                                ReportRow(date(2017, 2, 1), None, None, hours(5.5))])
+
+    def test_range_is_clipped(self):
+        """
+        Make sure that only the part of an entry inside the report range counts.
+        """
+        begin = datetime.datetime(2017, 1, 31, 23)
+        end = datetime.datetime(2017, 2, 1, 1)
+        rows = reporting.summarize(self.db, 1, begin, end, reporting.DAY, None, now=self.now)
+        date = datetime.date
+        self.assertEqual(rows, [ReportRow(date(2017, 1, 31), None, None, hours(1)),
+                                ReportRow(date(2017, 2, 1), None, None, hours(1))])
+
+    def test_invalid_arguments(self):
+        """
+        Make sure that invalid periods and groupings are rejected.
+        """
+        with self.assertRaises(ValueError):
+            reporting.summarize(self.db, 1, self.begin, self.end, "year")
+        with self.assertRaises(ValueError):
+            reporting.summarize(self.db, 1, self.begin, self.end, reporting.DAY, "title")
+
+
+if __name__ == "__main__":
+    unittest.main()
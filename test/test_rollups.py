@@ -0,0 +1,117 @@
+import datetime
+import os
+import unittest
+
+from core import reporting
+from core.database_connector import DatabaseConnector
+from core.database_types import Task, TrackEntry, MICROSECONDS_PER_DAY, timestamp_to_sql
+from core.reporting import ReportRow
+
+
+DB_PATH = "test_rollups.db"
+
+
+class TestRollups(unittest.TestCase):
+
+    def setUp(self):
+        if os.path.isfile(DB_PATH):
+            os.remove(DB_PATH)
+        self.db = DatabaseConnector(DB_PATH)
+        self.tasks = self.db.create_tasks([Task(user_uid=1, type_id=0), Task(user_uid=1, type_id=2)])
+        t = [task.uid for task in self.tasks]
+        d = datetime.datetime
+        self.entries = self.db.create_track_entries([
+            TrackEntry(task_uid=t[0], timestamp_begin=d(2017, 1, 30, 8), timestamp_end=d(2017, 1, 30, 12)),
+            TrackEntry(task_uid=t[1], timestamp_begin=d(2017, 1, 30, 12), timestamp_end=d(2017, 1, 30, 13)),
+            # Crosses midnight, the end of the month, and the end of the week.
+            TrackEntry(task_uid=t[0], timestamp_begin=d(2017, 2, 28, 20), timestamp_end=d(2017, 3, 6, 2)),
+            # Open entry.
+            TrackEntry(task_uid=t[0], timestamp_begin=d(2017, 3, 7, 8))
+        ])
+
+    def tearDown(self):
+        self.db.close()
+        if os.path.isfile(DB_PATH):
+            os.remove(DB_PATH)
+
+    def rollups(self):
+        c = self.db.cursor()
+        rows = {}
+        for table_name in ("RollupsDay", "RollupsWeek", "RollupsMonth"):
+            c.execute("SELECT * FROM `%s` ORDER BY `user_uid`, `day`, `task_uid`;" % table_name)
+            rows[table_name] = c.fetchall()
+        return rows
+
+    def assert_consistent(self):
+        """
+        Make sure that the incrementally updated rollups match the rebuilt ones.
+        """
+        rollups = self.rollups()
+        self.db.rebuild_rollups()
+        self.assertEqual(rollups, self.rollups())
+
+    def summarize_track_entries(self, begin, end, period, group_by, now):
+        """
+        Returns the report rows like reporting.summarize() without using the rollups.
+        """
+        c = self.db.cursor()
+        c.execute(reporting._report_query(period, group_by), {
+            "user_uid": 1,
+            "begin": timestamp_to_sql(begin),
+            "end": timestamp_to_sql(end),
+            "now": timestamp_to_sql(now),
+            "max_length": self.db.get_max_track_entry_length(),
+            "day_length": MICROSECONDS_PER_DAY
+        })
+        return [ReportRow(datetime.date(1970, 1, 1) + datetime.timedelta(days=day), task_uid, type_id,
+                          datetime.timedelta(0, 0, duration))
+                for day, task_uid, type_id, duration in c.fetchall()]
+
+    def test_incremental_updates(self):
+        """
+        Make sure that inserted, closed, edited, and deleted track entries update the rollups.
+        """
+        rollups = self.rollups()
+        self.assertEqual(len(rollups["RollupsDay"]), 9)
+        self.assertEqual(len(rollups["RollupsWeek"]), 4)
+        self.assertEqual(len(rollups["RollupsMonth"]), 4)
+        self.assert_consistent()
+
+        self.entries[3].timestamp_end = datetime.datetime(2017, 3, 7, 17)
+        self.db.update_track_entry(self.entries[3])
+        self.assert_consistent()
+
+        self.entries[0].timestamp_begin = datetime.datetime(2017, 1, 29, 22)
+        self.entries[1].task_uid = self.tasks[0].uid
+        self.db.update_track_entries(self.entries[:2])
+        self.assert_consistent()
+
+        self.entries[2].deleted = True
+        self.db.update_track_entry(self.entries[2])
+        self.assert_consistent()
+        self.assertEqual(len(self.rollups()["RollupsMonth"]), 2)
+
+    def test_rebuild(self):
+        """
+        Make sure that the rebuild regenerates rollups of track entries that were modified without the connector.
+        """
+        c = self.db.cursor()
+        c.execute("UPDATE `TrackEntries` SET `deleted`=1;")
+        self.assertNotEqual(self.rollups()["RollupsDay"], [])
+        self.db.rebuild_rollups(user_uid=2)
+        self.assertNotEqual(self.rollups()["RollupsDay"], [])
+        self.db.rebuild_rollups(user_uid=1)
+        self.assertEqual(self.rollups(), {"RollupsDay": [], "RollupsWeek": [], "RollupsMonth": []})
+
+    def test_reports(self):
+        """
+        Make sure that reports that combine rollups and track entries match reports from the track entries only.
+        """
+        d = datetime.datetime
+        now = d(2017, 3, 7, 10, 30)
+        for begin, end in [(d(2017, 1, 1), d(2017, 4, 1)), (d(2017, 1, 30, 9), d(2017, 3, 7, 9)),
+                           (d(2017, 3, 1, 1), d(2017, 3, 1, 2)), (d(2017, 2, 27, 12), d(2017, 3, 8))]:
+            for period in (reporting.DAY, reporting.WEEK, reporting.MONTH):
+                for group_by in (reporting.TASK, reporting.TYPE, None):
+                    self.assertEqual(reporting.summarize(self.db, 1, begin, end, period, group_by, now=now),
+                                     self.summarize_track_entries(begin, end, period, group_by, now))
@@ -0,0 +1,142 @@
+import datetime
+import os
+import unittest
+
+from core.user_management import UserManagement, TASK_WORK, GENERAL_WORK, PAUSE
+
+
+DB_PATH = "test_user_management.db"
+ARCHIVE_PATH = "test_user_management_archive.db"
+
+
+class TestUserManagement(unittest.TestCase):
+
+    def setUp(self):
+        if os.path.isfile(DB_PATH):
+            os.remove(DB_PATH)
+        self.user_management = UserManagement("Abel", DB_PATH)
+        self.db = self.user_management._database
+
+    def tearDown(self):
+        self.db.close()
+        for path in (DB_PATH, ARCHIVE_PATH):
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def _trace(self, f, *args):
+        """
+        Call f(*args) and return the list with the executed statements.
+        """
+        statements = []
+        self.db._connection.set_trace_callback(statements.append)
+        try:
+            f(*args)
+        finally:
+            self.db._connection.set_trace_callback(None)
+        return statements
+
+    def _count_commits(self, f, *args):
+        """
+        Call f(*args) and return the number of commits that were issued.
+        """
+        return self._trace(f, *args).count("COMMIT;")
+
+    def test_start_task_stops_current_task(self):
+        """
+        Start two tasks after each other and make sure that the first one is stopped in the same transaction.
+        """
+        task0_uid = self.user_management.create_task("Task 0", "")
+        task1_uid = self.user_management.create_task("Task 1", "")
+        self.user_management.start_task(task0_uid)
+        commits = self._count_commits(self.user_management.start_task, task1_uid)
+        self.assertEqual(commits, 1)
+        self.assertEqual(self.user_management.current_task_uid, task1_uid)
+        self.assertEqual(self.db.get_open_track_entries(task0_uid), [])
+        self.assertEqual(len(self.db.get_open_track_entries(task1_uid)), 1)
+
+    def test_stop_current_task(self):
+        """
+        Start and stop a task and make sure that the track entry is closed.
+        """
+        task_uid = self.user_management.create_task("Task", "")
+        self.user_management.start_task(task_uid)
+        commits = self._count_commits(self.user_management.stop_current_task)
+        self.assertEqual(commits, 1)
+        self.assertIsNone(self.user_management.current_task_uid)
+        entries = self.db.get_track_entries(task_uid)
+        self.assertEqual(len(entries), 1)
+        self.assertIsNotNone(entries[0].timestamp_end)
+
+    def test_general_work_and_pause(self):
+        """
+        Start general work and pause and make sure that each switch is one transaction.
+        """
+        commits = self._count_commits(self.user_management.start_general_work)
+        self.assertEqual(commits, 1)
+        general_work_uid = self.user_management.current_task_uid
+        commits = self._count_commits(self.user_management.start_pause)
+        self.assertEqual(commits, 1)
+        pause_uid = self.user_management.current_task_uid
+        tasks = self.db.get_all_tasks(self.user_management._user.uid)
+        self.assertEqual([(task.uid, task.type_id) for task in tasks], [(general_work_uid, GENERAL_WORK),
+                                                                        (pause_uid, PAUSE)])
+        self.assertEqual(self.db.get_open_track_entries(general_work_uid), [])
+
+    def test_task_done(self):
+        """
+        Finish the current task and make sure that it is stopped and no longer open.
+        """
+        task_uid = self.user_management.create_task("Task", "")
+        self.user_management.start_task(task_uid)
+        self.user_management.task_done(task_uid)
+        self.assertIsNone(self.user_management.current_task_uid)
+        self.assertEqual(self.db.get_open_track_entries(task_uid), [])
+        self.assertEqual(self.user_management.get_open_tasks(), [])
+
+    def test_delete_done_task(self):
+        """
+        Finish a task twice and delete it, and make sure that nothing is written the second time and that only the
+        deleted flag is written on deletion.
+        """
+        task_uid = self.user_management.create_task("Task", "")
+        self.user_management.task_done(task_uid)
+        statements = self._trace(self.user_management.task_done, task_uid)
+        self.assertFalse(any(statement.startswith("UPDATE") for statement in statements))
+        statements = self._trace(self.user_management.delete_task, task_uid)
+        self.assertEqual([statement for statement in statements if statement.startswith("UPDATE")],
+                         ["UPDATE `Tasks` SET `deleted`=1 WHERE `uid`=%d;" % task_uid])
+        task = self.db.get_task(task_uid)
+        self.assertTrue(task.done)
+        self.assertTrue(task.deleted)
+
+    def test_get_open_tasks(self):
+        """
+        Make sure that get_open_tasks() only returns the regular work tasks.
+        """
+        task_uid = self.user_management.create_task("Task", "")
+        self.user_management.start_general_work()
+        self.user_management.start_pause()
+        statements = self._trace(self.user_management.get_open_tasks)
+        tasks = self.user_management.get_open_tasks()
+        self.assertEqual([(task.uid, task.type_id) for task in tasks], [(task_uid, TASK_WORK)])
+        self.assertEqual(list(self.user_management.get_task_totals()), [task_uid])
+
+        # The type is filtered in SQL.
+        self.assertEqual(len(statements), 1)
+        self.assertIn("`type_id`=%d" % TASK_WORK, statements[0])
+
+    def test_archive_once_per_day(self):
+        """
+        Make sure that archive_if_due() only archives on the first call of a day.
+        """
+        now = [datetime.datetime(2018, 6, 1, 8)]
+        self.db.get_current_timestamp = lambda: now[0]
+        horizon = datetime.timedelta(days=365)
+        self.assertEqual(self.user_management.archive_if_due(ARCHIVE_PATH, horizon), (0, 0))
+        self.assertIsNone(self.user_management.archive_if_due(ARCHIVE_PATH, horizon))
+        now[0] = datetime.datetime(2018, 6, 2, 8)
+        self.assertEqual(self.user_management.archive_if_due(ARCHIVE_PATH, horizon), (0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
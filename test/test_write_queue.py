@@ -0,0 +1,132 @@
+import os
+import sqlite3
+import threading
+import unittest
+
+from core.user_management import UserManagement
+from core.write_queue import ImmediateQueue, WriteQueue
+
+
+DB_PATH = "test_write_queue.db"
+
+
+def _create_task(user_management, title):
+    return user_management.create_task(title, "")
+
+
+def _fail(user_management):
+    user_management.create_task("Failed", "")
+    raise ValueError("Failed on purpose.")
+
+
+class TestWriteQueue(unittest.TestCase):
+
+    def setUp(self):
+        if os.path.isfile(DB_PATH):
+            os.remove(DB_PATH)
+
+    def tearDown(self):
+        if os.path.isfile(DB_PATH):
+            os.remove(DB_PATH)
+
+    def _open_task_titles(self):
+        user_management = UserManagement("Abel", DB_PATH)
+        titles = [task.title for task in user_management.get_open_tasks()]
+        user_management.close()
+        return titles
+
+    def test_results(self):
+        """
+        Make sure that the calls run on the writer thread and that the futures return their results.
+        """
+        threads = []
+        writes = WriteQueue(lambda: UserManagement("Abel", DB_PATH))
+        first = writes.submit(_create_task, "First")
+        second = writes.submit(_create_task, "Second")
+        thread = writes.submit(lambda user_management: threads.append(threading.current_thread()))
+        self.assertLess(first.result(), second.result())
+        thread.result()
+        self.assertIsNot(threads[0], threading.current_thread())
+        writes.close()
+        self.assertTrue(writes.closed)
+        self.assertRaises(RuntimeError, writes.submit, _create_task, "Third")
+        self.assertEqual(self._open_task_titles(), ["First", "Second"])
+
+    def test_failed_call(self):
+        """
+        Make sure that a failing call only rolls back its own writes.
+        """
+        for queue_class in (WriteQueue, ImmediateQueue):
+            writes = queue_class(lambda: UserManagement("Abel", DB_PATH))
+            futures = [writes.submit(_create_task, "First"), writes.submit(_fail), writes.submit(_create_task, "Last")]
+            writes.flush()
+            self.assertIsInstance(futures[1].exception(), ValueError)
+            self.assertIsNone(futures[2].exception())
+            writes.close()
+            self.assertEqual(self._open_task_titles(), ["First", "Last"])
+            os.remove(DB_PATH)
+
+    def test_grouping(self):
+        """
+        Make sure that queued calls are committed together and that nothing is lost when the queue is closed.
+        """
+        statements = []
+        started = threading.Event()
+        proceed = threading.Event()
+
+        def create_user_management():
+            user_management = UserManagement("Abel", DB_PATH)
+            user_management._database._connection.set_trace_callback(statements.append)
+            return user_management
+
+        def block(user_management):
+            started.set()
+            proceed.wait()
+
+        writes = WriteQueue(create_user_management, max_size=100, max_group=10)
+        writes.submit(block)
+        started.wait()
+        del statements[:]
+        for i in range(25):
+            writes.submit(_create_task, "Task %d" % i)
+        proceed.set()
+        writes.close()
+        # One commit for the blocking call and one for each group of 10 tasks.
+        self.assertEqual(statements.count("COMMIT;"), 4)
+        self.assertEqual(len(self._open_task_titles()), 25)
+
+    def test_failed_commit(self):
+        """
+        Make sure that the current task is rebuilt from the database if the commit of a started task fails.
+        """
+        def create_user_management():
+            user_management = UserManagement("Abel", DB_PATH)
+            connection = user_management._database._connection
+            connection.execute("PRAGMA foreign_keys = ON;")
+            connection.execute("CREATE TABLE IF NOT EXISTS `Blocker` (`task_uid` INTEGER "
+                               "REFERENCES `Tasks` (`uid`) DEFERRABLE INITIALLY DEFERRED);")
+            return user_management
+
+        def start_and_fail_on_commit(user_management, task_uid):
+            user_management.start_task(task_uid)
+            user_management._database.cursor().execute("INSERT INTO `Blocker` VALUES (-1);")
+
+        for queue_class in (WriteQueue, ImmediateQueue):
+            writes = queue_class(create_user_management)
+            task_uid = writes.submit(_create_task, "Task").result()
+            writes.submit(lambda user_management: user_management.start_task(task_uid)).result()
+            other_uid = writes.submit(_create_task, "Other").result()
+            failed = writes.submit(start_and_fail_on_commit, other_uid)
+            self.assertIsInstance(failed.exception(), sqlite3.IntegrityError)
+            current = writes.submit(lambda user_management: user_management.current_task_uid)
+            self.assertEqual(current.result(), task_uid)
+            writes.close()
+            os.remove(DB_PATH)
+
+    def test_factory_error(self):
+        """
+        Make sure that exceptions of the factory are raised in the constructor.
+        """
+        def fail():
+            raise IOError("Failed on purpose.")
+        self.assertRaises(IOError, WriteQueue, fail)